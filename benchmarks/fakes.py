@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 20 14:05:19 2026
+
+@author: ymm
+
+Local stand-ins for the KuCoin REST client and websocket feed, so data
+loaders, model eval and streams run offline
+"""
+import json
+import time
+import uuid
+import asyncio
+from contextlib import contextmanager
+import numpy as np
+import websockets
+from data.base_data import BaseData
+from data.base_stream_data import BaseStreamData
+from data.resample import floor_ts
+
+
+class FakeClient(object):
+    """
+    Stand-in for kucoin.client.Client kline and symbol endpoints. Klines
+    are a deterministic random walk per symbol, `latency` seconds are
+    slept per request to mimic the network round trip.
+    """
+
+    def __init__(self, n_symbols=500, latency=0.0, seed=0):
+        self.n_symbols = n_symbols
+        self.latency = latency
+        self.seed = seed
+        self.calls = 0
+
+    def futures_get_symbols(self):
+        rng = np.random.default_rng(self.seed)
+        price = np.exp(rng.normal(2, 2, self.n_symbols))
+        volume = np.exp(rng.normal(12, 2, self.n_symbols))
+        return [{'symbol': f"S{i}USDTM",
+                 'quoteCurrency': 'USDT',
+                 'markPrice': float(price[i]),
+                 'volumeOf24h': float(volume[i]),
+                 'volValue': float(price[i] * volume[i])}
+                for i in range(self.n_symbols)]
+
+    def futures_get_klines(self, symbol, kline_type=60, start=None, end=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        freq_ms = int(kline_type) * 60000
+        # Bars open on the exchange's grid, weekly bars on Mondays
+        ts = np.arange(floor_ts(start + freq_ms - 1, freq_ms), end + 1, freq_ms, dtype=np.int64)
+        if len(ts) == 0:
+            return []
+
+        # Same bar, same values, whatever the request range
+        bar = ts // freq_ms
+        phase = sum(map(ord, symbol)) + self.seed
+        close = 100 * np.exp(0.05 * np.sin(bar * 0.0137 + phase) + 0.02 * np.sin(bar * 0.31 + 2 * phase))
+        open_ = close * (1 + 0.002 * np.sin(bar * 1.7 + phase))
+        high = np.maximum(open_, close) * 1.001
+        low = np.minimum(open_, close) * 0.999
+        volume = 1000.0 + bar % 97
+
+        return np.column_stack([ts, open_, close, high, low, volume]).tolist()
+
+
+class FakeAsyncClient(object):
+    """
+    Stand-in for kucoin AsyncClient, pointing streams at a local server.
+    Order book snapshots come from the FakeBookServer on that port
+    """
+
+    def __init__(self, port):
+        self.port = port
+
+    async def get_ws_endpoint(self, private=False):
+        return {'instanceServers': [{'endpoint': f"ws://127.0.0.1:{self.port}"}],
+                'token': 'fake'}
+
+    async def get_full_order_book(self, symbol):
+        await asyncio.sleep(0.01)
+        return FakeBookServer.servers[self.port].snapshot(symbol)
+
+
+class FakeTickerServer(object):
+    """
+    Local websocket server speaking the ticker protocol: acks subscribe
+    messages (comma-joined topics), answers pings and then sends
+    `n_messages` tickers round robin over the subscribed symbols, stamped
+    with the send time. rate=None sends as fast as possible.
+    """
+
+    def __init__(self, port=8765, n_messages=100000, rate=None):
+        self.port = port
+        self.n_messages = n_messages
+        self.rate = rate
+        self.sent = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await websockets.serve(self._handler, '127.0.0.1', self.port)
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def message(self, i, topic):
+        """The i-th message to send"""
+        return {
+            'type': 'message',
+            'topic': topic,
+            'subject': 'trade.ticker',
+            'data': {'price': str(100 + i % 10), 'size': '1',
+                     'bestBidPrice': '99.9', 'bestAskPrice': '100.1',
+                     'time': int(time.time() * 1000)},
+        }
+
+    async def _handler(self, ws):
+        subs = []
+        subscribed = asyncio.Event()
+
+        async def reader():
+            async for raw in ws:
+                msg = json.loads(raw)
+                if msg['type'] == 'subscribe':
+                    prefix, syms = msg['topic'].split(':', 1)
+                    subs.extend(f"{prefix}:{sym}" for sym in syms.split(','))
+                    await ws.send(json.dumps({'id': msg['id'], 'type': 'ack'}))
+                    subscribed.set()
+                elif msg['type'] == 'ping':
+                    await ws.send(json.dumps({'id': msg['id'], 'type': 'pong'}))
+
+        reading = asyncio.create_task(reader())
+        try:
+            await subscribed.wait()
+            await asyncio.sleep(0.1)
+            t0 = time.time()
+            for i in range(self.n_messages):
+                msg = self.message(i, subs[i % len(subs)])
+                if msg is not None:
+                    await ws.send(json.dumps(msg))
+                    self.sent += 1
+                if self.rate:
+                    delay = t0 + (i + 1) / self.rate - time.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+            await ws.wait_closed()
+        finally:
+            reading.cancel()
+
+
+class FakeBookServer(FakeTickerServer):
+    """
+    Local websocket server for the spot level 2 feed. Keeps a book of
+    `levels` price levels per side and symbol and streams sequenced
+    changes to random levels, a fifth of them removals. Every
+    `gap_every`-th change is applied but not sent, to exercise resyncs.
+    """
+    servers = {}   # port -> server, read by FakeAsyncClient snapshots
+
+    def __init__(self, port=8765, n_messages=100000, rate=None, levels=200, gap_every=None, seed=0):
+        super().__init__(port, n_messages, rate)
+        self.levels = levels
+        self.gap_every = gap_every
+        self.rng = np.random.default_rng(seed)
+        self.books = {}
+        FakeBookServer.servers[port] = self
+
+    def book(self, sym):
+        """Server side book {'bids': {price: size}, 'asks': ...} and sequence"""
+        if sym not in self.books:
+            ticks = np.arange(1, self.levels + 1)
+            self.books[sym] = [{'bids': dict(zip(np.round(100 - ticks * 0.01, 2), 1.0 + ticks % 7)),
+                                'asks': dict(zip(np.round(100 + ticks * 0.01, 2), 1.0 + ticks % 5))}, 1]
+        return self.books[sym]
+
+    def snapshot(self, sym):
+        sides, seq = self.book(sym)
+        return {'sequence': str(seq),
+                'bids': [[str(p), str(s)] for p, s in sorted(sides['bids'].items(), reverse=True)],
+                'asks': [[str(p), str(s)] for p, s in sorted(sides['asks'].items())]}
+
+    def message(self, i, topic):
+        sym = topic.split(':', 1)[1]
+        book = self.book(sym)
+        book[1] += 1
+        seq = book[1]
+
+        side = 'bids' if self.rng.random() < 0.5 else 'asks'
+        tick = int(self.rng.integers(1, self.levels + 1))
+        price = round(100 - tick * 0.01 if side == 'bids' else 100 + tick * 0.01, 2)
+        size = 0.0 if self.rng.random() < 0.2 else float(self.rng.integers(1, 100))
+        if size > 0:
+            book[0][side][price] = size
+        else:
+            book[0][side].pop(price, None)
+
+        if self.gap_every and i % self.gap_every == self.gap_every - 1:
+            return None
+        return {
+            'type': 'message',
+            'topic': topic,
+            'subject': 'trade.l2update',
+            'data': {'changes': {side: [[str(price), str(size), str(seq)]]},
+                     'sequenceStart': seq, 'sequenceEnd': seq,
+                     'symbol': sym, 'time': int(time.time() * 1000)},
+        }
+
+
+class FakeAPIException(Exception):
+    """Stand-in for KucoinAPIException, with its code attribute"""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+
+
+class FakeExchange(FakeAsyncClient):
+    """
+    Local spot exchange for order flow. Order endpoints take `latency`
+    seconds per request and updates are pushed on a private websocket as
+    /spotMarket/tradeOrdersV2 messages: received (and open for limit
+    orders), then match and filled after `fill_delay` for market orders.
+    Limit orders rest until canceled. Duplicate client oids are rejected
+    like on KuCoin.
+    """
+
+    def __init__(self, port=8797, latency=0.02, fill_delay=0.005):
+        super().__init__(port)
+        self.latency = latency
+        self.fill_delay = fill_delay
+        self.orders = {}   # client_oid -> order
+        self.calls = 0
+        self._sockets = set()
+        self._server = None
+
+    async def start(self):
+        self._server = await websockets.serve(self._handler, '127.0.0.1', self.port)
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handler(self, ws):
+        self._sockets.add(ws)
+        try:
+            async for raw in ws:
+                msg = json.loads(raw)
+                if msg['type'] == 'subscribe':
+                    await ws.send(json.dumps({'id': msg['id'], 'type': 'ack'}))
+                elif msg['type'] == 'ping':
+                    await ws.send(json.dumps({'id': msg['id'], 'type': 'pong'}))
+        finally:
+            self._sockets.discard(ws)
+
+    async def _push(self, order, kind, **extra):
+        data = dict(order, type=kind, ts=time.time_ns(), **extra)
+        msg = json.dumps({'type': 'message', 'topic': '/spotMarket/tradeOrdersV2',
+                          'subject': 'orderChange', 'channelType': 'private', 'data': data})
+        for ws in list(self._sockets):
+            await ws.send(msg)
+
+    async def _lifecycle(self, order):
+        await self._push(order, 'received')
+        if order['orderType'] == 'limit':
+            order['status'] = 'open'
+            await self._push(order, 'open')
+            return
+
+        await asyncio.sleep(self.fill_delay)
+        order['filledSize'] = order['size']
+        order['remainSize'] = '0'
+        order['status'] = 'done'
+        await self._push(order, 'match', matchSize=order['size'], matchPrice='100')
+        await self._push(order, 'filled')
+
+    async def _new_order(self, symbol, side, order_type, size, price, client_oid):
+        await asyncio.sleep(self.latency / 2)
+        self.calls += 1
+        if client_oid in self.orders:
+            raise FakeAPIException('400100', 'clientOid is duplicated')
+
+        order = {'symbol': symbol, 'side': side, 'orderType': order_type,
+                 'orderId': uuid.uuid4().hex[:24], 'clientOid': client_oid,
+                 'size': str(size), 'price': str(price), 'filledSize': '0',
+                 'remainSize': str(size), 'status': 'new', 'orderTime': int(time.time() * 1000)}
+        self.orders[client_oid] = order
+        asyncio.ensure_future(self._lifecycle(order))
+
+        await asyncio.sleep(self.latency / 2)
+        return {'orderId': order['orderId']}
+
+    async def create_market_order(self, symbol, side, size=None, funds=None, client_oid=None, **params):
+        return await self._new_order(symbol, side, 'market', size, None, client_oid or uuid.uuid4().hex)
+
+    async def create_limit_order(self, symbol, side, price, size, client_oid=None, **params):
+        return await self._new_order(symbol, side, 'limit', size, price, client_oid or uuid.uuid4().hex)
+
+    async def create_test_order(self, symbol, type='market', side=None, size=None, price=None,
+                                funds=None, client_oid=None, **params):
+        await asyncio.sleep(self.latency)
+        self.calls += 1
+        if side not in ('buy', 'sell'):
+            raise FakeAPIException('400100', 'side is invalid')
+        return {'orderId': uuid.uuid4().hex[:24]}
+
+    async def cancel_order_by_client_oid(self, client_oid, **params):
+        await asyncio.sleep(self.latency)
+        self.calls += 1
+        order = self.orders.get(client_oid)
+        if order is None or order['status'] != 'open':
+            raise FakeAPIException('400100', 'order cannot be canceled')
+
+        order['status'] = 'done'
+        await self._push(order, 'canceled')
+        return {'cancelledOrderId': order['orderId'], 'clientOid': client_oid}
+
+
+@contextmanager
+def fake_clients(rest_client=None, ws_port=None, stream_client=None):
+    """
+    Point every data class at the fakes while in the context, including
+    loaders instantiated by ModelEvalEngine from data maps. Streams get
+    stream_client if given (e.g. a FakeExchange), otherwise a client for
+    the local server on ws_port
+    """
+    rest_auth, stream_auth = BaseData.authenticate, BaseStreamData.authenticate
+
+    def authenticate_rest(self):
+        self.client = rest_client
+
+    def authenticate_stream(self):
+        self.client = stream_client or FakeAsyncClient(ws_port)
+
+    BaseData.authenticate = authenticate_rest
+    BaseStreamData.authenticate = authenticate_stream
+    try:
+        yield
+    finally:
+        BaseData.authenticate = rest_auth
+        BaseStreamData.authenticate = stream_auth
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 20 14:48:02 2026
+
+@author: ymm
+
+Offline benchmarks for kline loading, model eval and streaming. Run from
+the repo root:
+
+    python -m benchmarks.run_benchmarks --label v1
+    python -m benchmarks.run_benchmarks --label v2 --baseline benchmarks/results/v1.json
+
+Results are saved as JSON under benchmarks/results/, comparing against a
+baseline flags metrics that got worse by more than --tolerance.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from datetime import datetime, timedelta
+
+from benchmarks.fakes import FakeClient, FakeTickerServer, FakeBookServer, FakeExchange, fake_clients
+from data.kucoin_futures_data import KucoinFuturesKlinesData
+from data.kucoin_stream_data import KucoinStreamPriceData, KucoinStreamOrderBookData, KucoinStreamAccountData
+from model.model_eval import ModelEvalEngine
+from model.momentum import Momentum
+from model.simulate import Simulator
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Metrics where lower is better, everything else numeric is higher is better
+LOWER_IS_BETTER = ('seconds', 'peak_mb', 'latency', '_ms', '_us')
+
+END = datetime(2025, 4, 1)
+FREQ = 60
+
+
+def measure(func, *args, **kwargs):
+    """Run func, returns (result, wall seconds, peak traced memory in MB)"""
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak / 1e6
+
+
+def symbols_of(n):
+    return [f"S{i}USDTM" for i in range(n)]
+
+
+#%% Benchmarks
+
+def bench_klines(n_symbols=50, days=60, latency=0.0):
+    """Kline load throughput from REST, then from a warm local cache"""
+    start = END - timedelta(days=days)
+    client = FakeClient(latency=latency)
+    out = {}
+
+    with tempfile.TemporaryDirectory() as cache_dir, fake_clients(client):
+        params = {'symbols': symbols_of(n_symbols), 'freq': FREQ, 'as_panel': True,
+                  'cache_dir': cache_dir, 'rate_limit': 1e9}
+
+        for run in ['cold', 'warm']:
+            calls = client.calls
+            panel, elapsed, _ = measure(KucoinFuturesKlinesData(params).load, start, END)
+            bars = panel.shape[0] * panel.shape[1]
+            out[run] = {'bars': bars, 'requests': client.calls - calls,
+                        'seconds': elapsed, 'bars_per_s': bars / elapsed}
+    return out
+
+
+def bench_model_eval(universes=(10, 100, 500), histories=(30, 180)):
+    """ModelEvalEngine.run time and peak memory vs universe size and history"""
+    out = {}
+    with fake_clients(FakeClient()):
+        for n_symbols in universes:
+            for days in histories:
+                start = END - timedelta(days=days)
+                model = Momentum({'type': 'futures', 'symbols': symbols_of(n_symbols),
+                                  'freq': FREQ, 'lookback': 20})
+                params = dict(model.load_data_map()['KucoinFuturesKlinesData']['params'],
+                              use_cache=False, rate_limit=1e9)
+                data = {'KucoinFuturesKlinesData': KucoinFuturesKlinesData(params).load(start, END)}
+
+                for model_type in ['TS', 'CS']:
+                    engine = ModelEvalEngine({'model': model, 'model_type': model_type})
+                    signals, elapsed, peak = measure(engine.run, start, END, data)
+                    out[f"{model_type}_{n_symbols}x{days}d"] = {
+                        'rows': len(signals), 'symbols': n_symbols,
+                        'seconds': elapsed, 'peak_mb': peak}
+    return out
+
+
+def bench_stream(n_symbols=100, n_messages=50000, rate=None, port=8799):
+    """
+    Stream throughput and latency against the local ticker server. With
+    rate=None the server outruns the client and latency is mostly time
+    spent in socket buffers, pass a rate (msg/s) to measure it unloaded
+    """
+
+    async def run():
+        server = await FakeTickerServer(port, n_messages, rate).start()
+        with fake_clients(ws_port=port):
+            stream = KucoinStreamPriceData({'symbols': symbols_of(n_symbols)})
+
+        received = [0]
+
+        async def callback(msg):
+            if msg.get('type') == 'message':
+                received[0] += 1
+                if received[0] >= n_messages:
+                    stream.stop()
+
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(stream._connect(callback), timeout=600)
+        finally:
+            await server.close()
+        elapsed = time.perf_counter() - t0
+
+        metrics = stream.metrics()
+        total = metrics['latency_ms']['total']
+        return {'messages': received[0], 'seconds': elapsed,
+                'msgs_per_s': received[0] / elapsed,
+                'latency_p50_ms': total['p50'], 'latency_p99_ms': total['p99'],
+                'callback_p99_ms': metrics['latency_ms']['callback']['p99']}
+
+    return asyncio.run(run())
+
+
+def bench_book(n_symbols=10, n_messages=100000, levels=200, gap_every=20000, rate=None, port=8798):
+    """
+    Level 2 book maintenance from the local book server, with a sequence
+    gap every gap_every changes. Checks synced books against the server
+    and times top of book, depth and VWAP queries. Unthrottled, resync
+    snapshots can be ahead of the backlog, skipping deltas; pass a rate
+    (msg/s) to apply every one
+    """
+
+    async def run():
+        server = await FakeBookServer(port, n_messages, rate, levels=levels, gap_every=gap_every).start()
+        with fake_clients(ws_port=port):
+            stream = KucoinStreamOrderBookData({'symbols': symbols_of(n_symbols)})
+
+        expected = n_messages - (n_messages // gap_every if gap_every else 0)
+        received = [0]
+
+        async def callback(msg):
+            if msg.get('type') == 'message':
+                received[0] += 1
+                if received[0] >= expected:
+                    stream.stop()
+
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(stream._connect(lambda msg: stream._on_message(msg, callback)), timeout=600)
+        finally:
+            await server.close()
+        elapsed = time.perf_counter() - t0
+
+        # Synced books must equal the server's
+        synced = [book for book in stream.books.values() if book.synced]
+        consistent = all(
+            book.depth(None)['bids'].tolist() == [[float(p), float(s)] for p, s in server.snapshot(book.symbol)['bids']]
+            and book.depth(None)['asks'].tolist() == [[float(p), float(s)] for p, s in server.snapshot(book.symbol)['asks']]
+            for book in synced)
+
+        book = synced[0]
+        queries = {}
+        for name, query in [('top', book.top), ('depth10', lambda: book.depth(10)),
+                            ('vwap', lambda: book.vwap(50.0))]:
+            q0 = time.perf_counter()
+            for _ in range(10000):
+                query()
+            queries[f"{name}_us"] = (time.perf_counter() - q0) / 10000 * 1e6
+
+        metrics = stream.metrics()
+        return {'messages': received[0], 'seconds': elapsed,
+                'msgs_per_s': received[0] / elapsed,
+                'syncs': metrics['book_syncs'], 'gaps': metrics['book_gaps'],
+                'synced_books': len(synced), 'consistent': consistent,
+                'query': queries}
+
+    return asyncio.run(run())
+
+
+def bench_orders(n_orders=50, latency=0.02, port=8797):
+    """
+    Rebalance of n_orders market orders against the local exchange, one
+    at a time vs concurrently, with submit-to-ack and submit-to-fill
+    latency from the order stream. Then cancel/replace as many resting
+    limit orders
+    """
+
+    async def run():
+        exchange = await FakeExchange(port, latency).start()
+        with fake_clients(stream_client=exchange):
+            account = KucoinStreamAccountData({'rate_limit': 1e9})
+        task = account.stream()
+        await asyncio.sleep(0.2)
+        dispatcher = account.dispatcher
+        orders = [{'symbol': f"S{i}-USDT", 'side': 'buy', 'size': 1} for i in range(n_orders)]
+        out = {}
+
+        try:
+            t0 = time.perf_counter()
+            for o in orders:
+                await account.submit_market_order(o['symbol'], o['side'], o['size'])
+            out['serial_seconds'] = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            records = await account.submit_orders(orders)
+            out['concurrent_seconds'] = time.perf_counter() - t0
+            await dispatcher.wait(records, timeout=10)
+            out['concurrent_fill_seconds'] = time.perf_counter() - t0
+            out['filled'] = sum(o['status'] == 'filled' for o in records)
+
+            # Cancel/replace resting limit orders
+            limits = await account.submit_orders([dict(o, price=90) for o in orders])
+            t0 = time.perf_counter()
+            new = await account.replace_orders({o['client_oid']: dict(orders[i], price=95)
+                                                for i, o in enumerate(limits)})
+            out['replace_seconds'] = time.perf_counter() - t0
+            out['replaced'] = sum(o is not None and o['status'] != 'rejected' for o in new)
+
+            metrics = dispatcher.metrics()
+            for stage in ['ack', 'fill']:
+                out[f"{stage}_p50_ms"] = metrics['latency_ms'][stage]['p50']
+                out[f"{stage}_p99_ms"] = metrics['latency_ms'][stage]['p99']
+        finally:
+            account.stop()
+            await asyncio.wait_for(task, timeout=10)
+            await exchange.close()
+        return out
+
+    return asyncio.run(run())
+
+
+def bench_simulate(n_symbols=100, days=180, n_signals=200):
+    """Portfolio simulation throughput, scoring a lookback sweep of momentum signals"""
+    start = END - timedelta(days=days)
+    lookbacks = list(range(5, 5 + n_signals))
+    with fake_clients(FakeClient()):
+        model = Momentum({'type': 'futures', 'symbols': symbols_of(n_symbols),
+                          'freq': FREQ, 'lookback': lookbacks[-1]})
+        params = dict(model.load_data_map()['KucoinFuturesKlinesData']['params'],
+                      use_cache=False, rate_limit=1e9)
+        panel = KucoinFuturesKlinesData(params).load(start, END)
+
+    data = {'KucoinFuturesKlinesData': panel}
+    stack = model.sweep(start, END, data, lookbacks)
+    index = panel.loc(start, END).timestamps
+    simulator = Simulator({'method': 'demean', 'cost_bps': 6})
+    _, elapsed, peak = measure(simulator.score, stack, panel, index=index, names=lookbacks)
+    return {'signals': n_signals, 'bars': stack.shape[1], 'symbols': n_symbols,
+            'seconds': elapsed, 'signals_per_s': n_signals / elapsed, 'peak_mb': peak}
+
+
+#%% Results
+
+def flatten(results, prefix=''):
+    """Nested results to {'a.b.c': value}"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        else:
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Compare timing and throughput metrics against a baseline, returns the
+    metrics that regressed by more than tolerance
+    """
+    current, base = flatten(results['benchmarks']), flatten(baseline['benchmarks'])
+    regressions = []
+    for name, value in current.items():
+        old = base.get(name)
+        if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+            continue
+        if not any(k in name for k in LOWER_IS_BETTER + ('per_s',)):
+            continue
+
+        change = value / old - 1
+        lower_better = any(k in name for k in LOWER_IS_BETTER)
+        worse = change > tolerance if lower_better else change < -tolerance
+        flag = '  REGRESSION' if worse else ''
+        print(f"{name:45s} {old:12.4g} -> {value:12.4g} ({change:+.1%}){flag}")
+        if worse:
+            regressions.append(name)
+
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks")
+    parser.add_argument('--label', default=None, help="Results file name, default the git revision")
+    parser.add_argument('--baseline', default=None, help="Results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--quick', action='store_true', help="Small sizes, for a smoke run")
+    parser.add_argument('--only', nargs='*', default=['klines', 'model_eval', 'stream', 'book', 'orders', 'simulate'])
+    args = parser.parse_args()
+
+    if args.quick:
+        sizes = {'klines': {'n_symbols': 5, 'days': 10},
+                 'model_eval': {'universes': (10,), 'histories': (10,)},
+                 'stream': {'n_symbols': 10, 'n_messages': 5000},
+                 'book': {'n_symbols': 5, 'n_messages': 10000, 'gap_every': 3000},
+                 'orders': {'n_orders': 10},
+                 'simulate': {'n_symbols': 10, 'days': 10, 'n_signals': 20}}
+    else:
+        sizes = {'klines': {}, 'model_eval': {}, 'stream': {}, 'book': {}, 'orders': {}, 'simulate': {}}
+    benches = {'klines': bench_klines, 'model_eval': bench_model_eval, 'stream': bench_stream,
+               'book': bench_book, 'orders': bench_orders, 'simulate': bench_simulate}
+
+    results = {
+        'label': args.label or git_revision() or 'local',
+        'revision': git_revision(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'benchmarks': {},
+    }
+    for name in args.only:
+        print(f"Running {name} benchmark...")
+        results['benchmarks'][name] = benches[name](**sizes[name])
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    fname = os.path.join(RESULTS_DIR, f"{results['label']}.json")
+    with open(fname, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {fname}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 18 13:41:52 2026
+
+@author: ymm
+
+Build OHLCV bars in real time from the ticker stream
+"""
+import time
+import asyncio
+import numpy as np
+from data.base_data import freq_to_timedelta
+from data.kline_cache import KLINE_DTYPE, KLINE_COLUMNS
+from data.resample import floor_ts
+
+
+def parse_ticker(msg):
+    """
+    Extract (symbol, price, size, ts ms) from a spot /market/ticker or
+    futures /contractMarket/ticker message, None for anything else
+    """
+    if msg.get('type') != 'message' or 'ticker' not in msg.get('topic', ''):
+        return None
+
+    data = msg['data']
+    sym = data.get('symbol') or msg['topic'].split(':', 1)[1]
+
+    price = data.get('price')
+    if price is None:
+        price = (float(data['bestBidPrice']) + float(data['bestAskPrice'])) / 2
+    size = float(data.get('size') or 0)
+
+    # Spot sends ms, futures sends ns
+    ts = data.get('time') or data.get('Time')
+    if ts is None:
+        ts = int(data['ts']) // 1000000 if 'ts' in data else int(time.time() * 1000)
+
+    return sym, float(price), size, int(ts)
+
+
+class BarBuilder(object):
+    """
+    Aggregates ticks into OHLCV bars for any interval in FREQ_MAP (or int
+    minutes), for many symbols at once.
+
+    Bars open on the same grid as historical klines, weekly bars on
+    Mondays. A bar is closed once the watermark (latest tick time or wall clock)
+    passes its end plus `lateness` ms. Ticks for a bar that is still open
+    update it even if out of order; ticks for an already closed bar are
+    dropped and counted in `late_ticks`. Closed bars are dicts with symbol,
+    timestamp (bar open, ms), open, high, low, close, volume and n_ticks.
+
+    NOTE: the ticker stream is sampled, so volume is the sum of sampled
+    trade sizes and under-counts compared to REST klines.
+    """
+
+    def __init__(self, params):
+        self.freq = params.get('freq', 1)
+        self.freq_ms = int(freq_to_timedelta(self.freq).total_seconds() * 1000)
+        self.lateness = params.get('lateness', 0)
+        self.callback = params.get('callback')
+        self.use_timer = params.get('use_timer', True)
+
+        # Optional historical store (KlineCache) to append closed bars to.
+        # Streamed bars go to its separate stream cache, as they under-count
+        # volume. Loaders with stream_bars set read them for ranges not yet
+        # in the exchange klines instead of polling REST
+        self.store = params.get('store')
+        if self.store is not None:
+            self.store = self.store.streamed()
+        self.store_batch = params.get('store_batch', 60)
+        self.store_freq = self.freq_ms // 60000
+        if self.store is not None and self.freq_ms % 60000 != 0:
+            raise ValueError("Only whole-minute bars can be stored with klines")
+
+        # Optional KucoinFuturesKlinesData to backfill missed bars from
+        self.backfill_loader = params.get('backfill')
+        self._held = None
+
+        self.bars = {}          # sym -> {bar ts: open bar}
+        self.last_closed = {}   # sym -> ts of last closed bar
+        self.last_emitted = {}  # sym -> ts of last bar handed downstream
+        self.pending = {}       # sym -> closed bars not yet stored
+        self.watermark = 0
+        self.oldest_open = None  # earliest open bar ts, to skip no-op flushes
+        self.late_ticks = 0
+        self._timer = None
+
+    async def on_message(self, msg):
+        """Stream callback, feed raw ticker messages here"""
+        if self.use_timer and self._timer is None:
+            self._timer = asyncio.create_task(self._run_timer())
+
+        tick = parse_ticker(msg)
+        if tick is not None:
+            self.on_tick(*tick)
+
+    def on_tick(self, sym, price, size, ts):
+        """Update bars with one tick"""
+        bar_ts = floor_ts(ts, self.freq_ms)
+
+        if bar_ts <= self.last_closed.get(sym, -1):
+            self.late_ticks += 1
+            return
+
+        bars = self.bars.setdefault(sym, {})
+        bar = bars.get(bar_ts)
+        if bar is None:
+            bars[bar_ts] = {
+                'symbol':    sym,
+                'timestamp': bar_ts,
+                'open':      price,
+                'high':      price,
+                'low':       price,
+                'close':     price,
+                'volume':    size,
+                'n_ticks':   1,
+                '_first':    ts,
+                '_last':     ts,
+            }
+            if self.oldest_open is None or bar_ts < self.oldest_open:
+                self.oldest_open = bar_ts
+        else:
+            if price > bar['high']:
+                bar['high'] = price
+            if price < bar['low']:
+                bar['low'] = price
+            if ts >= bar['_last']:
+                bar['close'], bar['_last'] = price, ts
+            if ts < bar['_first']:
+                bar['open'], bar['_first'] = price, ts
+            bar['volume'] += size
+            bar['n_ticks'] += 1
+
+        if ts > self.watermark:
+            self.watermark = ts
+            if self.oldest_open is not None and ts - self.freq_ms - self.lateness >= self.oldest_open:
+                self.flush(ts)
+
+    def flush(self, now_ms=None):
+        """Close every bar whose interval (plus lateness) ended before now"""
+        if now_ms is None:
+            now_ms = max(self.watermark, int(time.time() * 1000))
+        cutoff = now_ms - self.freq_ms - self.lateness
+
+        closed = []
+        oldest = None
+        for sym, bars in self.bars.items():
+            for bar_ts in sorted(bars):
+                if bar_ts > cutoff:
+                    oldest = bar_ts if oldest is None else min(oldest, bar_ts)
+                    break
+                closed.append(bars.pop(bar_ts))
+        self.oldest_open = oldest
+
+        for bar in sorted(closed, key=lambda b: b['timestamp']):
+            self._emit(bar)
+
+        return closed
+
+    def _emit(self, bar):
+        """Hand a closed bar downstream, or hold it while backfilling"""
+        del bar['_first'], bar['_last']
+        self.last_closed[bar['symbol']] = bar['timestamp']
+
+        if self._held is not None:
+            self._held.append(bar)
+        else:
+            self._deliver(bar)
+
+    def _deliver(self, bar):
+        """Hand a bar to the callback and the store, in order per symbol"""
+        sym = bar['symbol']
+        if bar['timestamp'] <= self.last_emitted.get(sym, -1):
+            return
+        first = sym not in self.last_emitted
+        self.last_emitted[sym] = bar['timestamp']
+
+        # The first bar after subscribing missed its earlier ticks
+        if self.store is not None and not first:
+            self.pending.setdefault(sym, []).append(bar)
+            if len(self.pending[sym]) >= self.store_batch:
+                self.store_bars(sym)
+
+        if self.callback is not None:
+            res = self.callback(bar)
+            if asyncio.iscoroutine(res):
+                asyncio.ensure_future(res)
+
+    def store_bars(self, sym=None):
+        """Append pending closed bars to the historical kline store"""
+        for sym_ in ([sym] if sym is not None else list(self.pending)):
+            bars = self.pending.pop(sym_, [])
+            if not bars:
+                continue
+            arr = np.empty(len(bars), dtype=KLINE_DTYPE)
+            arr['timestamp'] = [b['timestamp'] for b in bars]
+            for c in KLINE_COLUMNS:
+                arr[c] = [b[c] for b in bars]
+
+            # Mark only contiguous runs as covered, minutes without ticks
+            # stay holes
+            ts = arr['timestamp']
+            breaks = np.flatnonzero(np.diff(ts) > self.freq_ms) + 1
+            for run in np.split(arr, breaks):
+                self.store.write_array(sym_, self.store_freq, run,
+                                       int(run['timestamp'][0]), int(run['timestamp'][-1]))
+
+    async def backfill(self, symbols=None):
+        """
+        Fill bars missed while disconnected from the REST klines, so
+        downstream sees a gap-free series. Use as a stream reconnect
+        handler. Bars closed meanwhile are held back and released after
+        the backfilled ones.
+        """
+        if self.backfill_loader is None or self._held is not None:
+            return
+
+        now_ms = int(time.time() * 1000)
+        now_bar = floor_ts(now_ms, self.freq_ms)
+        symbols = symbols or list(self.last_emitted)
+
+        # Bars open across the outage missed ticks, take them from REST
+        jobs = []
+        for sym in symbols:
+            for bar_ts in [t for t in self.bars.get(sym, {}) if t < now_bar]:
+                del self.bars[sym][bar_ts]
+            if sym in self.last_emitted and self.last_emitted[sym] + self.freq_ms < now_bar:
+                jobs.append((sym, self.last_emitted[sym] + self.freq_ms, now_bar - self.freq_ms))
+        if not jobs:
+            return
+
+        self._held = []
+        try:
+            print(f"Backfilling bars for {len(jobs)} symbols")
+            loop = asyncio.get_running_loop()
+            arrays = await loop.run_in_executor(None, self.backfill_loader.fetch_arrays, jobs)
+
+            bars = []
+            for (sym, start, end), arr in zip(jobs, arrays):
+                for row in arr:
+                    bar = {c: float(row[c]) for c in KLINE_COLUMNS}
+                    bar.update(symbol=sym, timestamp=int(row['timestamp']), n_ticks=0)
+                    bars.append(bar)
+                if len(arr):
+                    self.last_closed[sym] = max(self.last_closed.get(sym, -1), int(arr['timestamp'][-1]))
+
+            for bar in sorted(bars, key=lambda b: b['timestamp']):
+                self._deliver(bar)
+        except Exception as e:
+            print("Error backfilling bars:", e)
+        finally:
+            held, self._held = self._held, None
+            for bar in held:
+                self._deliver(bar)
+
+    async def _run_timer(self):
+        """Close bars on time boundaries even when no new ticks arrive"""
+        while True:
+            now_ms = int(time.time() * 1000)
+            wait_ms = floor_ts(now_ms, self.freq_ms) + self.freq_ms - now_ms + self.lateness
+            await asyncio.sleep(wait_ms / 1000)
+            self.flush()
+
+    def close(self):
+        """Stop the timer and store anything pending"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.store is not None:
+            self.store_bars()
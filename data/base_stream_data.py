@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Apr 23 17:24:18 2025
+
+@author: ymm
+
+Websocket streaming base class, kept apart from data.base_data so batch
+jobs do not import websockets and the async client
+"""
+from abc import ABC, abstractmethod
+import asyncio
+import time
+import json
+import websockets
+from data.client_pool import new_async_client
+from data.stream_queue import MessageQueue
+from data.stream_metrics import StreamStats, exchange_ts
+from data.rate_limiter import backoff_delay
+
+# Faster json decoder if available
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+
+class BaseStreamData(ABC):
+    """
+    Abstract base class for Kucoin streaming data providers
+    """
+    # Streams whose message handling updates their own state (books,
+    # orders) must handle messages here, not in worker processes
+    supports_workers = True
+
+    def __init__(self, params=None):
+        if params is None:
+            params = {}
+            
+        # Common streaming state
+        self.token = None
+        self.ws = None
+        self._connected = False
+        self._running = True
+        self.client = None
+        
+        # Connections, symbols are sharded when over the topic limit
+        self.sockets = {}
+        # Seconds to wait for the close handshake on stop, a busy socket
+        # that is no longer read never completes it
+        self.close_timeout = params.get('close_timeout', 1.0)
+        self.topics_per_connection = params.get('topics_per_connection', 300)
+        self.symbols_per_topic = params.get('symbols_per_topic', 100)
+        
+        # Reconnect with jittered backoff, handlers run after resubscribing
+        self.reconnect = params.get('reconnect', True)
+        self.max_reconnects = params.get('max_reconnects', None)
+        self.reconnect_base = params.get('reconnect_base', 1.0)
+        self.reconnect_cap = params.get('reconnect_cap', 60.0)
+        self.reconnect_handlers = []
+        
+        # Bounded message queue, drained in batches
+        self.batch_size = params.get('batch_size', 100)
+        self.stats = StreamStats(window=params.get('latency_window', 4096))
+        self.queue = MessageQueue(maxsize=params.get('max_queue', 10000),
+                                  policy=params.get('queue_policy', 'block'),
+                                  topic_policies=params.get('topic_policies'),
+                                  stats=self.stats)
+        
+        # Periodic metrics snapshots, handed to metrics_callback (or printed)
+        self.metrics_interval = params.get('metrics_interval', None)
+        self.metrics_callback = params.get('metrics_callback', None)
+        self._pings = {}
+        
+        # Optional StreamRecorder, raw messages are logged as received
+        self.recorder = params.get('recorder', None)
+        
+        # Run the callback in worker processes, sharded by symbol (or
+        # topic), instead of inline on the receiving event loop
+        self.workers = params.get('workers', None)
+        if self.workers and not self.supports_workers:
+            raise ValueError(f"{type(self).__name__} keeps state in this process, it cannot run in workers")
+        self.worker_backlog = params.get('worker_backlog', 10000)
+        self.worker_key = params.get('worker_key', 'symbol')
+        self.worker_ring_bytes = params.get('worker_ring_bytes', 1 << 22)
+        self.worker_init = params.get('worker_init', None)
+        self.pool = None
+
+    def authenticate(self):
+        """
+        Instantiate client and authenticate
+        """
+        self.client = new_async_client()
+
+    async def _ping(self, ws):
+        """
+        Send periodic pings to keep the connection alive
+        """
+        while self._connected:
+            try:
+                ping_id = str(int(time.time() * 1000))
+                self._pings[ping_id] = time.time()
+                await ws.send(json.dumps({"id": ping_id, "type": "ping"}))
+            except Exception as e:
+                print("Ping error:", e)
+            await asyncio.sleep(20)
+
+    async def _queue_loop(self, ws):
+        """
+        Queue incoming messages of one connection into the shared queue,
+        returns when the connection drops
+        """
+        while self._running:
+            try:
+                msg = await ws.recv()
+                recv_ts = time.time()
+                self.stats.count('received')
+                if self.recorder is not None:
+                    self.recorder.write(msg, recv_ts)
+                if '"pong"' in msg:
+                    self._on_pong(msg, recv_ts)
+                await self.queue.put(msg, recv_ts=recv_ts)
+            except Exception as e:
+                if self._running:
+                    print("Error receiving message:", e)
+                break
+
+    def _on_pong(self, msg, recv_ts):
+        """Match a pong to its ping for the round trip time"""
+        try:
+            sent = self._pings.pop(json_loads(msg).get('id'), None)
+        except ValueError:
+            return
+        if sent is not None:
+            self.stats.on_pong(recv_ts - sent)
+
+    async def _get_ws_endpoint(self):
+        """
+        This is to get token for ws connection
+        """
+        resp = await self.client.get_ws_endpoint(private=self.private)
+        endpoint = resp['instanceServers'][0]['endpoint']
+        self.token = resp['token']
+        return f"{endpoint}?token={self.token}"
+
+    def shards(self):
+        """
+        Split symbols across connections so that each stays within the
+        per-connection topic limit. Streams without symbols use a single
+        connection.
+        """
+        symbols = getattr(self, 'symbols', None)
+        if not symbols:
+            return [None]
+        
+        # Each symbol counts once per topic prefix
+        n_topics = len(getattr(self, 'topics', None) or [None])
+        n = max(1, self.topics_per_connection // n_topics)
+        return [symbols[i:i + n] for i in range(0, len(symbols), n)]
+
+    def add_reconnect_handler(self, handler):
+        """
+        Register handler(symbols), sync or async, called after a shard
+        reconnects and resubscribes, e.g. to backfill missed bars
+        """
+        self.reconnect_handlers.append(handler)
+
+    async def _run_shard(self, shard_id, symbols):
+        """
+        Open one connection, subscribe its symbols and feed the shared
+        queue. Reconnects with jittered backoff and a fresh token when the
+        connection drops, then resubscribes
+        """
+        attempt = 0
+        reconnecting = False
+        while self._running:
+            try:
+                ws_url = await self._get_ws_endpoint()
+                async with websockets.connect(ws_url, ping_interval=None, close_timeout=self.close_timeout) as ws:
+                    self.sockets[shard_id] = ws
+                    if shard_id == 0:
+                        self.ws = ws
+                    
+                    ping = asyncio.create_task(self._ping(ws))
+                    try:
+                        await self.subscribe(ws=ws, symbols=symbols)
+                        attempt = 0
+                        if reconnecting:
+                            print(f"Reconnected shard {shard_id}")
+                            self._run_reconnect_handlers(symbols)
+                        await self._queue_loop(ws)
+                    finally:
+                        ping.cancel()
+
+            except Exception as e:
+                if self._running:
+                    print(f"Error in connecting to WebSocket (shard {shard_id}): {e}")
+            finally:
+                self.sockets.pop(shard_id, None)
+            
+            if not self._running:
+                break
+            if not self.reconnect or (self.max_reconnects is not None and attempt >= self.max_reconnects):
+                print(f"Giving up on shard {shard_id}")
+                self.stop()
+                break
+            
+            delay = backoff_delay(attempt, self.reconnect_base, self.reconnect_cap)
+            attempt += 1
+            reconnecting = True
+            self.stats.count('reconnects')
+            print(f"Reconnecting shard {shard_id} in {delay:.1f}s (attempt {attempt})")
+            await asyncio.sleep(delay)
+
+    def _run_reconnect_handlers(self, symbols):
+        """Run reconnect handlers without blocking the receive loop"""
+        for handler in self.reconnect_handlers:
+            try:
+                res = handler(symbols)
+                if asyncio.iscoroutine(res):
+                    asyncio.ensure_future(res)
+            except Exception as e:
+                print("Error in reconnect handler:", e)
+
+    async def _connect(self, callback, sleep=0):
+        """
+        Base connection structure to WebSocket and handle messages. Symbols
+        are sharded over several connections when needed, all of which
+        feed one merged queue
+        """
+        self._connected = True
+        shards = self.shards()
+        if len(shards) > 1:
+            print(f"Streaming over {len(shards)} connections")
+        if self.workers:
+            from data.stream_workers import WorkerPool
+            self.pool = WorkerPool(callback, self.workers, self.worker_key,
+                                   self.worker_ring_bytes, self.worker_init,
+                                   self.worker_backlog).start()
+            print(f"Handling messages in {self.workers} worker processes")
+        tasks = [asyncio.create_task(self._run_shard(i, symbols)) for i, symbols in enumerate(shards)]
+        if self.metrics_interval:
+            tasks.append(asyncio.create_task(self._report_metrics()))
+        
+        try:
+            # Process messages in batches
+            while self._running:
+                try:
+                    batch = await self.queue.get_batch(self.batch_size)
+                    if not batch:
+                        break
+                    dequeue_ts = time.time()
+                    self.stats.on_batch(batch, len(self.queue))
+                    if self.pool is not None:
+                        # Workers parse and handle, callback latency is the hand off
+                        self.pool.flush()
+                        for topic, msg, recv_ts in batch:
+                            await self.pool.put_async(topic, msg, recv_ts)
+                            self.stats.on_message(None, recv_ts, dequeue_ts, time.time())
+                    else:
+                        for _, msg, recv_ts in batch:
+                            msg = json_loads(msg)
+                            await callback(msg)
+                            self.stats.on_message(exchange_ts(msg), recv_ts, dequeue_ts, time.time())
+                    self.stats.on_processed(len(batch), batch[-1][2])
+                except Exception as e:
+                    print("Error processing message:", e)
+                    self.stats.count('errors')
+                    self.stop()
+                    break
+                
+                if sleep > 0:
+                    await asyncio.sleep(sleep)
+        finally:
+            self.stop()
+            await asyncio.gather(*[ws.close() for ws in list(self.sockets.values())], return_exceptions=True)
+            # Shards may be connecting or waiting to reconnect
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.recorder is not None:
+                self.recorder.flush()
+            if self.pool is not None:
+                await self.pool.aclose()
+    
+    async def _report_metrics(self):
+        """Hand a metrics snapshot to metrics_callback every metrics_interval seconds"""
+        # Rates over each interval, from this reporter's own baseline
+        last = None
+        while self._running:
+            await asyncio.sleep(self.metrics_interval)
+            snapshot = last = self.metrics(since=last)
+            if self.metrics_callback is not None:
+                self.metrics_callback(snapshot)
+            else:
+                lat = snapshot['latency_ms']
+                print(f"Stream: {snapshot['process_rate']:.0f} msg/s, queue {snapshot['queue_depth']}, "
+                      + ", ".join(f"{k} p50/p99 {v['p50']:.1f}/{v['p99']:.1f}ms"
+                                  for k, v in lat.items() if v['count']))
+    
+    def metrics(self, since=None):
+        """
+        Throughput, drop and lag counters of the message pipeline, with
+        latency percentiles per stage and ping round trip in ms, plus per
+        worker hand off counts when handling in worker processes. Rates
+        are since the `since` snapshot, or since start
+        """
+        snapshot = self.stats.snapshot(since)
+        if self.pool is not None and self.pool.rings:
+            snapshot['workers'] = self.pool.stats()
+        return snapshot
+    
+    def stop(self):
+        """Stop the stream"""
+        self._running = False
+        self._connected = False
+        self.queue.close()
+        
+    @abstractmethod
+    def stream(self, callback):
+        """High level stream method with message handler callback"""
+        pass
+
+    @abstractmethod
+    async def subscribe(self, topics=None, ws=None, symbols=None):
+        """Custom subscriber for child classes, on a given connection"""
+        pass
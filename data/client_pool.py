@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 21 10:16:37 2026
+
+@author: ymm
+
+Process-wide pool of lazily created, authenticated KuCoin clients
+"""
+import os
+import threading
+from functools import lru_cache
+import settings
+
+# Connections kept alive per host, enough for the concurrent kline loader
+POOL_MAXSIZE = 32
+
+_clients = {}   # (kind, pid) -> client
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def credentials():
+    """KuCoin API credentials from keys.env, read once per process"""
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=os.path.join(settings.PROJECT_ROOT, "keys.env"))
+
+    return (os.getenv("KUCOIN_API_KEY"),
+            os.getenv("KUCOIN_API_SECRET"),
+            os.getenv("KUCOIN_API_PASSPHRASE"))
+
+
+def _new_rest_client():
+    """REST client with a keep-alive connection pool sized for threads"""
+    from kucoin.client import Client
+    from requests.adapters import HTTPAdapter
+
+    client = Client(*credentials())
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+    client.session.mount('https://', adapter)
+    return client
+
+
+def get_client(kind='rest'):
+    """
+    Shared client of a kind, created on first use. Clients are per
+    process, forked workers build their own rather than share sockets
+    with the parent.
+    """
+    key = (kind, os.getpid())
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                if kind != 'rest':
+                    raise ValueError(f"Unknown client kind {kind}")
+                client = _clients[key] = _new_rest_client()
+    return client
+
+
+def new_async_client():
+    """
+    Authenticated AsyncClient for streams. Not pooled, its HTTP session
+    is bound to the event loop it first runs on
+    """
+    from kucoin.async_client import AsyncClient
+    return AsyncClient(*credentials())
+
+
+def reset():
+    """Drop pooled clients, e.g. after rotating credentials"""
+    with _lock:
+        for client in _clients.values():
+            try:
+                client.session.close()
+            except Exception:
+                pass
+        _clients.clear()
+    credentials.cache_clear()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 18 09:12:40 2026
+
+@author: ymm
+
+Local on-disk kline cache, keyed by symbol and freq
+"""
+import os
+import json
+import uuid
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import settings
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, writers are not locked across processes
+    fcntl = None
+
+
+KLINE_COLUMNS = ['open', 'close', 'high', 'low', 'volume']
+
+# Subdirectory for bars built from the ticker stream, kept apart from
+# exchange klines so that loads only read them when asked to
+STREAM_DIR = 'stream'
+
+
+def kline_dtype(float_dtype='<f8'):
+    """Structured kline dtype, int64 ms timestamps and float OHLCV"""
+    return np.dtype([('timestamp', '<i8')] + [(c, float_dtype) for c in KLINE_COLUMNS])
+
+
+KLINE_DTYPE = kline_dtype()
+
+
+class KlineCache(object):
+    """
+    Columnar kline cache backed by memory-mapped numpy files.
+
+    Each (symbol, freq) pair is stored as one structured array sorted by
+    timestamp (ms), plus a small json sidecar with the time ranges that
+    have already been fetched. Ranges are kept separately from the rows
+    so that periods with no trading are not refetched on every load.
+
+    Every write goes to a new data file named by a generation token, and
+    is committed by atomically replacing the sidecar, which names the
+    data file. Readers therefore always see ranges and rows of the same
+    write, and results derived from the rows can be reused until the
+    generation changes. Writers of a symbol and freq hold a file lock
+    across read, merge and commit, so concurrent processes do not lose
+    each other's rows.
+    """
+
+    def __init__(self, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = os.path.join(settings.PROJECT_ROOT, '.cache', 'klines')
+        self.cache_dir = cache_dir
+
+    def _path(self, sym, freq):
+        """Path prefix for a symbol and freq"""
+        return os.path.join(self.cache_dir, str(freq), sym)
+
+    def streamed(self):
+        """Separate cache for bars built from the ticker stream"""
+        return KlineCache(os.path.join(self.cache_dir, STREAM_DIR))
+
+    def _meta(self, sym, freq):
+        path = self._path(sym, freq) + '.json'
+        if not os.path.exists(path):
+            return {'ranges': []}
+        with open(path) as f:
+            return json.load(f)
+
+    def coverage(self, sym, freq):
+        """Cached [start, end] ms ranges for a symbol and freq"""
+        return [tuple(r) for r in self._meta(sym, freq)['ranges']]
+
+    def missing(self, sym, freq, start: int, end: int):
+        """Ranges in [start, end] (ms) not yet covered by the cache"""
+        gaps = []
+        cursor = start
+        for s, e in self.coverage(sym, freq):
+            if e < cursor:
+                continue
+            if s > end:
+                break
+            if s > cursor:
+                gaps.append((cursor, s - 1))
+            cursor = max(cursor, e + 1)
+        if cursor <= end:
+            gaps.append((cursor, end))
+
+        return gaps
+
+    def generation(self, sym, freq):
+        """Token of the last write for a symbol and freq, None if unknown"""
+        return self._meta(sym, freq).get('generation')
+
+    def read(self, sym, freq, start: int=None, end: int=None):
+        """
+        Cached rows in [start, end] (ms) as a structured array view, with
+        the generation they belong to
+        """
+        while True:
+            meta = self._meta(sym, freq)
+            # Caches written before generations keep their rows in <sym>.npy
+            path = os.path.join(os.path.dirname(self._path(sym, freq)), meta.get('file', sym + '.npy'))
+            try:
+                arr = np.load(path, mmap_mode='r')
+                break
+            except FileNotFoundError:
+                # Nothing cached, unless a newer write replaced the file
+                # since the sidecar was read
+                if self.generation(sym, freq) == meta.get('generation'):
+                    return np.empty(0, dtype=KLINE_DTYPE), meta.get('generation')
+
+        ts = arr['timestamp']
+        i0 = 0 if start is None else np.searchsorted(ts, start, side='left')
+        i1 = len(ts) if end is None else np.searchsorted(ts, end, side='right')
+        return arr[i0:i1], meta.get('generation')
+
+    def read_array(self, sym, freq, start: int=None, end: int=None):
+        """Read cached rows in [start, end] (ms) as a structured array view"""
+        return self.read(sym, freq, start, end)[0]
+
+    @contextmanager
+    def _lock(self, sym, freq):
+        """Exclusive lock of a symbol and freq across processes"""
+        path = self._path(sym, freq)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.lock', 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def write_array(self, sym, freq, new, start: int, end: int):
+        """
+        Merge a structured kline array into the cache and mark [start,
+        end] (ms) as covered
+        """
+        new = new[(new['timestamp'] >= start) & (new['timestamp'] <= end)]
+
+        with self._lock(sym, freq):
+            meta = self._meta(sym, freq)
+            old = np.array(self.read_array(sym, freq))
+
+            # Merge, newer rows win on duplicate timestamps
+            arr = np.concatenate([new, old])
+            _, idx = np.unique(arr['timestamp'], return_index=True)
+            arr = arr[idx]
+
+            # Merge coverage ranges
+            freq_ms = int(freq) * 60 * 1000
+            ranges = sorted([tuple(r) for r in meta['ranges']] + [(start, end)])
+            merged = [list(ranges[0])]
+            for s, e in ranges[1:]:
+                if s <= merged[-1][1] + freq_ms:
+                    merged[-1][1] = max(merged[-1][1], e)
+                else:
+                    merged.append([s, e])
+
+            # Rows go to a new file, replacing the sidecar commits them
+            # together with their ranges. A crash before that only leaves
+            # an unreferenced file
+            path = self._path(sym, freq)
+            generation = uuid.uuid4().hex
+            fname = f"{sym}.{generation}.npy"
+            with open(os.path.join(os.path.dirname(path), fname), 'wb') as f:
+                np.save(f, arr)
+            with open(path + '.json.tmp', 'w') as f:
+                json.dump({'ranges': merged, 'generation': generation, 'file': fname}, f)
+            os.replace(path + '.json.tmp', path + '.json')
+
+            # Readers that still map the old file keep their view, on
+            # Windows it cannot be removed until they let go
+            old_file = os.path.join(os.path.dirname(path), meta.get('file', sym + '.npy'))
+            try:
+                os.remove(old_file)
+            except OSError:
+                pass
+
+    def clear(self, sym=None, freq=None):
+        """Drop cached data for a symbol/freq, or everything"""
+        for root, _, files in os.walk(self.cache_dir):
+            if freq is not None and os.path.basename(root) != str(freq):
+                continue
+            for fname in files:
+                if sym is None or fname.split('.', 1)[0] == sym:
+                    os.remove(os.path.join(root, fname))
+
+
+def parse_klines(klines, out=None, grid=None):
+    """
+    Parse raw REST kline rows [ts, open, close, high, low, volume] straight
+    into a structured array, without a DataFrame in between.
+
+    With a preallocated `out` buffer and its sorted bar open times `grid`,
+    rows are written to the slot of their timestamp, so batches can be
+    parsed concurrently into one buffer and overlapping bars land on the
+    same slot. Returns (slots written, rows not on the grid as an array),
+    or the parsed array if out is None.
+    """
+    raw = np.asarray(klines, dtype=np.float64).reshape(-1, 1 + len(KLINE_COLUMNS))
+    ts = raw[:, 0].astype(np.int64)
+
+    if out is None:
+        arr = np.empty(len(raw), dtype=KLINE_DTYPE)
+        arr['timestamp'] = ts
+        for k, c in enumerate(KLINE_COLUMNS):
+            arr[c] = raw[:, k + 1]
+        return arr
+
+    slots = np.searchsorted(grid, ts)
+    ok = slots < len(grid)
+    ok[ok] = grid[slots[ok]] == ts[ok]
+    slots = slots[ok]
+    out['timestamp'][slots] = ts[ok]
+    for k, c in enumerate(KLINE_COLUMNS):
+        out[c][slots] = raw[ok, k + 1]
+    return slots, parse_klines(raw[~ok])
+
+
+def frame_to_array(df):
+    """Convert a batch_load DataFrame to a structured kline array"""
+    arr = np.empty(len(df), dtype=KLINE_DTYPE)
+    arr['timestamp'] = df['timestamp'].values.astype('datetime64[ms]').astype('int64')
+    for c in KLINE_COLUMNS:
+        arr[c] = df[c].values
+    return arr
+
+
+def array_to_frame(arr, sym):
+    """Convert a structured kline array to the batch_load DataFrame format"""
+    df = pd.DataFrame({'timestamp': pd.to_datetime(arr['timestamp'], unit='ms')})
+    for c in KLINE_COLUMNS:
+        df[c] = np.asarray(arr[c], dtype=float)
+    # Symbol as a categorical code, not a Python string per row
+    df['symbol'] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), [sym])
+    return df
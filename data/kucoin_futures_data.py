@@ -6,28 +6,62 @@ Created on Tue May 4 20:08:56 2025
 @author: ymm
 """
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import time
 import pandas as pd
 import numpy as np
 from data.base_data import BaseData, FREQ_MAP
+from data.kline_cache import KlineCache, KLINE_DTYPE, parse_klines, array_to_frame
+from data.panel import Panel
+from data.universe_store import UniverseStore
+from data.rate_limiter import get_limiter, call_with_retry
+from data.resample import freq_minutes, floor_ts, resample_cached
+from data.profiler import stage, bind
 
 
 class KucoinFuturesSymbolData(BaseData):
     """
     Get all symbols from Kucoin
-    NOTE: This is not PIT!
+    NOTE: Live loads are only PIT as of today. Each live load is saved as
+    a daily snapshot, loads as of a past date read the snapshot store, so
+    universes are PIT from the first snapshot on.
     """
     
-    def __init__(self):
-        super().__init__({})
-        self.authenticate()
+    def __init__(self, params=None):
+        if params is None:
+            params = {}
+        super().__init__(params)
+        
+        # Daily universe snapshots
+        self.store = params.get('store') or UniverseStore(params.get('store_dir'))
+        self.snapshot = params.get('snapshot', True)
 
-    def load(self, quote=['USDT']):
-        """Load all tickers from Kucoin"""
+    def load(self, quote=['USDT'], date=None):
+        """
+        Load all tickers from Kucoin, or the snapshot as of a past date
+        from the store (no network round trip)
+        """
+        if date is not None:
+            data = self.store.asof(date)
+            if data is None:
+                raise ValueError(f"No universe snapshot on or before {date}")
+            data = data[data['quoteCurrency'].isin(quote)].reset_index(drop=True)
+            print(f"Loaded Kucoin futures symbol universe as of {data['date'].iloc[0].date()}")
+            return data
         
         # Get all tickers
         data = self.client.futures_get_symbols()
         data = pd.DataFrame(data)
-        data = data.apply(pd.to_numeric, errors='ignore')
+        
+        # Numeric columns to numbers, leave the rest (errors='ignore' is gone in pandas 3)
+        for col in data.columns:
+            converted = pd.to_numeric(data[col], errors='coerce')
+            if converted.notna().sum() == data[col].notna().sum():
+                data[col] = converted
+        
+        # Save today's snapshot, all quote currencies
+        if self.snapshot:
+            self.store.write(data, pd.Timestamp.now(tz='UTC').tz_localize(None))
         
         # Filter quote currency
         data = data[data['quoteCurrency'].isin(quote)]
@@ -36,8 +70,8 @@ class KucoinFuturesSymbolData(BaseData):
         return data
 
     def loc(self, start, end):
-        """Locate data (not implemented for non time dependent data)"""
-        pass
+        """Stored universe snapshots with dates in [start, end]"""
+        return self.store.read(start, end)
     
     def filter_symbols(self, 
                        data, 
@@ -45,9 +79,13 @@ class KucoinFuturesSymbolData(BaseData):
                        threshold=None, 
                        by='volValue',
                        min_dollar_vol=None,
-                       min_booksize=None):
+                       min_booksize=None,
+                       books=None,
+                       book_levels=10):
         """Filter by top liquidity or by volume percentile threshold,
-        if both provided, prioritize top"""
+        if both provided, prioritize top. min_booksize is the minimum
+        quote value resting in the best book_levels levels of the thinner
+        side, read from live books, e.g. KucoinStreamOrderBookData.books"""
         
         # Compute dollar volume
         data['dollarVol24h'] = data['markPrice'] * data['volumeOf24h']
@@ -57,8 +95,15 @@ class KucoinFuturesSymbolData(BaseData):
         if min_dollar_vol is not None:
             data = data[data['dollarVol24h'] >= min_dollar_vol]
         
+        # Filter minimum book depth, symbols without a synced book are dropped
         if min_booksize is not None:
-            pass  # TODO: Implement this
+            if books is None:
+                raise ValueError("min_booksize needs live order books")
+            booksize = data['symbol'].map(
+                lambda sym: books[sym].booksize(book_levels) if sym in books and books[sym].synced else np.nan)
+            if 'multiplier' in data:
+                booksize = booksize * data['multiplier']
+            data = data[booksize >= min_booksize]
         
         # Filter securities by rank or threshold
         if top is not None:
@@ -68,6 +113,51 @@ class KucoinFuturesSymbolData(BaseData):
             data_filtered = data[data[by] >= val].copy()
             
         return data_filtered
+    
+    def filter_symbols_range(self,
+                             start,
+                             end,
+                             top=None,
+                             threshold=None,
+                             by='volValue',
+                             min_dollar_vol=None,
+                             quote=['USDT']):
+        """
+        Universe membership for every day in [start, end] from the stored
+        snapshots, same rules as filter_symbols applied to each day's
+        as-of snapshot but in one pass over a dates x symbols matrix.
+        Returns a boolean DataFrame indexed by date with symbol columns.
+        """
+        fields = ['markPrice', 'volumeOf24h'] + ([by] if by not in ('markPrice', 'volumeOf24h') else [])
+        dates, symbols, m = self.store.matrix(fields, start, end, quote=quote)
+        
+        # Compute dollar volume
+        dollar_vol = m['markPrice'] * m['volumeOf24h']
+        valid = np.isfinite(dollar_vol)
+        
+        # Filter minimum volume
+        if min_dollar_vol is not None:
+            valid &= np.where(valid, dollar_vol, -np.inf) >= min_dollar_vol
+        
+        # Filter securities by rank or threshold
+        if top is not None:
+            order = np.argsort(np.where(valid, -dollar_vol, np.inf), axis=1, kind='stable')
+            ranks = np.empty_like(order)
+            np.put_along_axis(ranks, order, np.arange(order.shape[1])[np.newaxis, :], axis=1)
+            member = valid & (ranks < top)
+        elif threshold is not None:
+            masked = np.where(valid, dollar_vol, np.nan)
+            with np.errstate(invalid='ignore'):
+                any_valid = valid.any(axis=1)
+                val = np.full(len(dates), np.nan)
+                if any_valid.any():
+                    val[any_valid] = np.nanquantile(masked[any_valid], threshold, axis=1)
+                member = valid & (m[by] >= val[:, np.newaxis])
+        else:
+            member = valid
+        
+        return pd.DataFrame(member, index=pd.DatetimeIndex(dates, name='date'),
+                            columns=pd.Index(symbols, name='symbol'))
 
 
 class KucoinFuturesKlinesData(BaseData):
@@ -77,70 +167,188 @@ class KucoinFuturesKlinesData(BaseData):
         super().__init__(params)
 
         self.symbols = params['symbols']
-        self.freq = params.get('freq', '1day')
         self.lookback = params.get('lookback', 0)
         self.offset = params.get('offset', 0)
+        self.as_panel = params.get('as_panel', False)
+        self.panel = None
+        
+        # Freqs are whole minutes from here on, FREQ_MAP keys are resolved.
+        # Only base_freq bars are fetched and cached, coarser freqs are
+        # resampled locally so models at mixed freqs share one history
+        self.freq = freq_minutes(params.get('freq', '1day'))
+        self.base_freq = freq_minutes(params.get('base_freq', self.freq))
+        if self.freq % self.base_freq != 0:
+            raise ValueError(f"freq {self.freq} is not a multiple of base_freq {self.base_freq}")
+        
+        # Panel field precision, float32 halves memory for large universes
+        self.float_dtype = np.dtype(params.get('float_dtype', 'float64'))
+        
+        # Local kline cache, checked before hitting the REST api
+        self.cache = None
+        if params.get('use_cache', True):
+            self.cache = KlineCache(params.get('cache_dir'))
         
-        # Initialize client
-        self.authenticate()        
+        # Serve ranges not cached yet from bars a BarBuilder stored off the
+        # ticker stream, only fetching what the stream did not cover. Their
+        # volume is sampled, so this is for live loads of recent bars
+        self.stream_bars = params.get('stream_bars', False)
+        
+        # Concurrent download, all loaders share one limiter per endpoint
+        self.max_workers = params.get('max_workers', 8)
+        self.max_retries = params.get('max_retries', 5)
+        self.limiter = get_limiter('futures_get_klines', params.get('rate_limit'))
 
-    def batch_load(self, 
-                   sym: str, 
-                   freq: int, 
-                   start: datetime, 
-                   end: datetime, 
-                   batch_size: int=200):
-        """Load klines in batches"""
+    def batch_ranges(self, 
+                     freq: int, 
+                     start: int, 
+                     end: int, 
+                     batch_size: int=200):
+        """Split [start, end] (ms) into per-request batch ranges"""
         
-        # Get datetime interval list
         freq_ms  = freq * 60 * 1000
         batch_ms = freq_ms * batch_size
         N_batches = int(np.ceil((end - start + freq_ms) / batch_ms))
         
-        print(f"Loading {sym} kline data in {N_batches} batches...")
-            
-        df = []
+        ranges = []
         for batch_i in range(N_batches):
-            
             start_ = start + batch_ms * batch_i
             end_   = start + batch_ms * (batch_i + 1)
             end_   = min(end_, end)
+            ranges.append((start_, end_))
             
-            # Get batch data
-            klines = self.client.futures_get_klines(sym, 
-                                                    kline_type=self.freq, 
-                                                    start=start_, 
-                                                    end=end_)
+        return ranges
+    
+    def fetch_arrays(self, jobs: list, batch_size: int=200):
+        """
+        Fetch klines for a list of (sym, start, end) jobs as structured
+        arrays. Each job gets one buffer preallocated on its bar grid
+        (aligned like resample, so weekly bars open on Mondays) and every
+        batch is parsed straight into the slots of its timestamps, so
+        there are no per-batch DataFrames, concatenation or duplicate
+        boundary bars. Bars off the grid are kept as well. All batches
+        of all jobs are fanned out over a thread pool when max_workers
+        > 1; results come back in job order.
+        """
+        freq_ms = self.base_freq * 60 * 1000
+        
+        buffers, filled, extra, tasks = [], [], [], []
+        for job_i, (sym, start, end) in enumerate(jobs):
+            first = floor_ts(start + freq_ms - 1, freq_ms)
+            grid = np.arange(first, end + 1, freq_ms, dtype=np.int64)
+            buffers.append((grid, np.empty(len(grid), dtype=KLINE_DTYPE)))
+            filled.append(np.zeros(len(grid), dtype=bool))
+            extra.append([])
+            
+            ranges = self.batch_ranges(self.base_freq, start, end, batch_size)
+            print(f"Loading {sym} kline data in {len(ranges)} batches...")
+            tasks += [(job_i, sym, s, e) for s, e in ranges]
+        
+        def fetch(task):
+            job_i, sym, start, end = task
+            # One stage per symbol, its calls are the REST batches
+            with stage(sym) as info:
+                klines = call_with_retry(self.client.futures_get_klines, 
+                                         sym, 
+                                         kline_type=self.base_freq, 
+                                         start=start, 
+                                         end=end,
+                                         limiter=self.limiter,
+                                         max_retries=self.max_retries)
+                grid, buf = buffers[job_i]
+                slots, off_grid = parse_klines(klines, buf, grid)
+                filled[job_i][slots] = True
+                if len(off_grid):
+                    extra[job_i].append(off_grid)
+                info['rows'] = len(slots) + len(off_grid)
+        
+        if self.max_workers > 1 and len(tasks) > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                list(pool.map(bind(fetch), tasks))
+        else:
+            for task in tasks:
+                fetch(task)
+        
+        out = []
+        for (sym, start, end), (_, buf), mask, rows in zip(jobs, buffers, filled, extra):
+            arr = buf[mask]
+            if rows:
+                arr = np.concatenate([arr] + rows)
+                arr = arr[(arr['timestamp'] >= start) & (arr['timestamp'] <= end)]
+                _, idx = np.unique(arr['timestamp'], return_index=True)
+                arr = arr[idx]
+            out.append(arr)
+        return out
+
+    def fetch_ranges(self, jobs: list, batch_size: int=200):
+        """
+        Fetch klines for a list of (sym, start, end) jobs, as batch_load
+        DataFrames in job order
+        """
+        return [array_to_frame(arr, sym) for (sym, _, _), arr in zip(jobs, self.fetch_arrays(jobs, batch_size))]
 
-            # Format into pandas df
-            df_ = pd.DataFrame(klines, columns=[
-                "timestamp",
-                "open", 
-                "close", 
-                "high", 
-                "low", 
-                "volume"
-            ])
+    def batch_load(self, 
+                   sym: str, 
+                   freq: int, 
+                   start: datetime, 
+                   end: datetime, 
+                   batch_size: int=200):
+        """Load klines in batches"""
+        return self.fetch_ranges([(sym, start, end)], batch_size)[0]
     
-            df_["timestamp"] = pd.to_datetime(df_["timestamp"].astype(int), unit="ms")
-            df_ = df_.astype({
-                "open":     float,
-                "close":    float,
-                "high":     float,
-                "low":      float,
-                "volume":   float,
-            })
+    def cached_load(self, symbols: list, start: int, end: int):
+        """
+        Load base_freq klines through the local cache, only fetching
+        missing ranges. Returns {symbol: structured kline array} and
+        {symbol: version}, the cache generation plus any bars still
+        forming, which identifies the rows for resample_cached()
+        """
+        
+        # Only bars that are already closed are cached
+        freq_ms = self.base_freq * 60 * 1000
+        now_ms = int(time.time() * 1000)
+        closed_end = min(end, now_ms // freq_ms * freq_ms - freq_ms)
+        
+        stream = self.cache.streamed() if self.stream_bars else None
+        live = {sym: [] for sym in symbols}
+        
+        jobs = []
+        for sym in symbols:
+            gaps = self.cache.missing(sym, self.base_freq, start, end)
+            if stream is not None and gaps:
+                # Streamed bars fill what they cover, the rest is fetched
+                live[sym] += [stream.read_array(sym, self.base_freq, s, e) for s, e in gaps]
+                gaps = [g for s, e in gaps for g in stream.missing(sym, self.base_freq, s, e)]
+            if gaps:
+                print(f"Fetching {len(gaps)} missing range(s) for {sym} from Kucoin")
+            jobs += [(sym, s, e) for s, e in gaps]
+        
+        with stage('fetch') as info:
+            fetched = self.fetch_arrays(jobs)
+            info['rows'] = sum(len(arr) for arr in fetched)
+        for (sym, s, e), arr_ in zip(jobs, fetched):
             
-            df.append(df_)
+            if min(e, closed_end) >= s:
+                self.cache.write_array(sym, self.base_freq, arr_, s, min(e, closed_end))
             
-        df = pd.concat(df, axis=0)
-        df['symbol'] = sym
-        df = df.sort_values("timestamp").reset_index(drop=True)
+            # Keep bars that are still forming out of the cache
+            live[sym].append(arr_[arr_['timestamp'] > closed_end])
         
-        return df
+        data, versions = {}, {}
+        with stage('cache_read') as info:
+            for sym in symbols:
+                arr, generation = self.cache.read(sym, self.base_freq, start, end)
+                versions[sym] = generation and (generation, b''.join(a.tobytes() for a in live[sym]))
+                if live[sym]:
+                    arr = np.concatenate(live[sym][::-1] + [arr])
+                    _, idx = np.unique(arr['timestamp'], return_index=True)
+                    arr = arr[idx]
+                data[sym] = arr
+            info['rows'] = sum(len(arr) for arr in data.values())
+        
+        return data, versions
         
     def load(self, start: datetime=None, end: datetime=None):
-        """Load all klines data"""
+        """Load all klines data, as {symbol: DataFrame} or as a Panel"""
         
         # Resolve symbols
         if not isinstance(self.symbols, list):
@@ -154,18 +362,53 @@ class KucoinFuturesKlinesData(BaseData):
             start = int(start.timestamp() * 1000)
         if not isinstance(end, int):
             end = int(end.timestamp() * 1000)
+        
+        # Resampled bars cover [start, end] with full bars, as from the api
+        if self.base_freq != self.freq:
+            freq_ms = self.freq * 60 * 1000
+            start = int(floor_ts(start + freq_ms - 1, freq_ms))
+            end = int(floor_ts(end, freq_ms)) + freq_ms - self.base_freq * 60 * 1000
 
-        # Get data for each symbol
-        data = {}
-        for sym in self.symbols:
-            
-            df = self.batch_load(sym, self.freq, start, end)
-            
-            print('Obtained futures klines data for {} over {} - {}'.format(sym, start, end))
-            data[sym] = df
+        # Get data for all symbols
+        versions = {}
+        if self.cache is not None:
+            data, versions = self.cached_load(self.symbols, start, end)
+        else:
+            jobs = [(sym, start, end) for sym in self.symbols]
+            with stage('fetch') as info:
+                data = dict(zip(self.symbols, self.fetch_arrays(jobs)))
+                info['rows'] = sum(len(arr) for arr in data.values())
+        
+        if self.base_freq != self.freq:
+            with stage('resample') as info:
+                data = {sym: resample_cached(sym, arr, self.base_freq, self.freq, versions.get(sym))
+                        for sym, arr in data.items()}
+                info['rows'] = sum(len(arr) for arr in data.values())
+        
+        with stage('panel' if self.as_panel else 'frames') as info:
+            info['rows'] = sum(len(arr) for arr in data.values())
+            if self.as_panel:
+                data = Panel.from_arrays(data, dtype=self.float_dtype)
+            else:
+                data = {sym: array_to_frame(arr, sym) for sym, arr in data.items()}
+        
+        print('Obtained futures klines data for {} symbols over {} - {}'.format(len(self.symbols), start, end))
+        
+        # Keep a panel around for point in time access
+        self.panel = data if isinstance(data, Panel) else None
+        self._frames = None if isinstance(data, Panel) else data
             
         return data 
     
-    def loc(self, start, end):
-        """To be implemented for cross-sectional eval"""
-        pass
\ No newline at end of file
+    def loc(self, start=None, end=None):
+        """
+        Point in time access to loaded klines over [start, end], by binary
+        search on the timestamp index. Returns a Panel of views (no copy)
+        """
+        if self.panel is None:
+            if getattr(self, '_frames', None) is None:
+                raise ValueError("No klines loaded, call load() first")
+            self.panel = Panel.from_frames(self._frames)
+            self._frames = None
+        
+        return self.panel.loc(start, end)
\ No newline at end of file
@@ -6,7 +6,11 @@ Created on Wed Apr 6 17:24:18 2025
 import time
 import json
 import asyncio
-from data.base_data import BaseStreamData
+from collections import deque
+from data.base_stream_data import BaseStreamData
+from data.order_book import OrderBook, parse_l2
+from data.order_dispatcher import OrderDispatcher
+from data.rate_limiter import backoff_delay
 
 
 class KucoinStreamPriceData(BaseStreamData):
@@ -39,54 +43,216 @@ class KucoinStreamPriceData(BaseStreamData):
         else:
             loop.run_until_complete(wrapper())
 
-    async def subscribe(self, topics=None):
+    async def subscribe(self, topics=None, ws=None, symbols=None):
         """
-        Subscribe to all symbols to stream
+        Subscribe to all symbols to stream, batching symbols into
+        comma-joined topics
         """
-        for sym in self.symbols:
-            topic = f"/market/ticker:{sym}"
-            sub_msg = {
-                "id": str(int(time.time() * 1000)),
-                "type": "subscribe",
-                "topic": topic,
-                "response": True
-            }
-            await self.ws.send(json.dumps(sub_msg))
-            print(f"Subscribed to {topic}")
+        ws = ws or self.ws
+        symbols = symbols or self.symbols
+        n = self.symbols_per_topic
+        
+        for prefix in self.topics:
+            for i in range(0, len(symbols), n):
+                batch = symbols[i:i + n]
+                topic = prefix + ":" + ",".join(batch)
+                sub_msg = {
+                    "id": f"{int(time.time() * 1000)}{i}",
+                    "type": "subscribe",
+                    "topic": topic,
+                    "response": True
+                }
+                await ws.send(json.dumps(sub_msg))
+                print(f"Subscribed to {prefix} for {len(batch)} symbols")
+
+
+class KucoinStreamOrderBookData(BaseStreamData):
+    """
+    Streaming level 2 order books. Each symbol's book is loaded from a
+    REST snapshot and kept current from the incremental feed; deltas
+    received while a snapshot loads are buffered and replayed on top of
+    it. A sequence gap, or a reconnect, marks the book stale and
+    resyncs it. Live books are in `books` ({symbol: OrderBook}).
+
+    Spot (/market/level2) by default, pass topics=['/contractMarket/level2']
+    for futures.
+    """
+    supports_workers = False
+
+    def __init__(self, params):
+        # Resolve params
+        super().__init__(params)
+
+        self.topics = params.get('topics', ["/market/level2"])
+        self.private = params.get('private', False)
+        self.symbols = params.get('symbols')
+        self.symbols = [self.symbols] if isinstance(self.symbols, str) else self.symbols
+        self.futures = self.topics[0].startswith('/contractMarket')
+        
+        # Books, and deltas buffered per symbol while its snapshot loads
+        self.books = {sym: OrderBook(sym) for sym in self.symbols}
+        self._pending = {}
+        self.max_pending = params.get('max_pending', 100000)
+        self._snapshots = asyncio.Semaphore(params.get('snapshot_concurrency', 5))
+        self.stats.counters.update(book_syncs=0, book_gaps=0)
+        
+        # Authenticate
+        self.authenticate()
+
+    def stream(self, callback=None):
+        """
+        Start streaming, callback (optional) gets every message after
+        the books are updated
+        """
+        async def wrapper():
+            await self._connect(lambda msg: self._on_message(msg, callback))
+
+        loop = asyncio.get_event_loop()
+        if loop.is_running():
+            asyncio.create_task(wrapper())
+        else:
+            loop.run_until_complete(wrapper())
+
+    async def _get_ws_endpoint(self):
+        """Futures books stream from the futures endpoint"""
+        if not self.futures:
+            return await super()._get_ws_endpoint()
+        resp = await self.client.futures_get_ws_endpoint(private=self.private)
+        self.token = resp['token']
+        return f"{resp['instanceServers'][0]['endpoint']}?token={self.token}"
+
+    async def subscribe(self, topics=None, ws=None, symbols=None):
+        """
+        Subscribe to the books of all symbols, then (re)load them from
+        snapshots
+        """
+        ws = ws or self.ws
+        symbols = symbols or self.symbols
+        n = self.symbols_per_topic
+        
+        for prefix in self.topics:
+            for i in range(0, len(symbols), n):
+                batch = symbols[i:i + n]
+                topic = prefix + ":" + ",".join(batch)
+                sub_msg = {
+                    "id": f"{int(time.time() * 1000)}{i}",
+                    "type": "subscribe",
+                    "topic": topic,
+                    "response": True
+                }
+                await ws.send(json.dumps(sub_msg))
+                print(f"Subscribed to {prefix} for {len(batch)} symbols")
+        
+        # Anything missed while disconnected is only in a new snapshot
+        self.resync(symbols)
+
+    async def _on_message(self, msg, callback=None):
+        """Apply a book delta, buffering it while the book syncs"""
+        delta = parse_l2(msg)
+        if delta is not None:
+            sym = delta[0]
+            pending = self._pending.get(sym)
+            if pending is not None:
+                pending.append(delta)
+            elif not self.books.setdefault(sym, OrderBook(sym)).apply(delta):
+                print(f"Sequence gap in {sym} order book, resyncing")
+                self.stats.count('book_gaps')
+                self.resync([sym])
+                self._pending[sym].append(delta)
+        
+        if callback is not None:
+            await callback(msg)
+
+    def resync(self, symbols=None):
+        """Reload books from snapshots, deltas are buffered meanwhile"""
+        for sym in symbols or self.symbols:
+            if sym in self._pending:
+                continue
+            self.books.setdefault(sym, OrderBook(sym)).reset()
+            self._pending[sym] = deque(maxlen=self.max_pending)
+            asyncio.ensure_future(self._sync(sym))
+
+    async def _get_snapshot(self, sym):
+        """Full REST book as (bids, asks, sequence)"""
+        if self.futures:
+            snap = await self.client.futures_get_full_order_book(sym)
+        else:
+            snap = await self.client.get_full_order_book(sym)
+        return snap['bids'], snap['asks'], int(snap['sequence'])
+
+    async def _sync(self, sym):
+        """
+        Load a snapshot and replay buffered deltas on top. If the
+        snapshot is older than the buffer reaches back, fetch again
+        """
+        book = self.books[sym]
+        attempt = 0
+        while self._running:
+            try:
+                async with self._snapshots:
+                    bids, asks, sequence = await self._get_snapshot(sym)
+                book.load(bids, asks, sequence)
+                
+                pending = self._pending[sym]
+                while pending and book.apply(pending[0]):
+                    pending.popleft()
+                if not pending:
+                    del self._pending[sym]
+                    self.stats.count('book_syncs')
+                    return
+                book.reset()
+            except Exception as e:
+                print(f"Error loading {sym} order book snapshot: {e}")
+            
+            await asyncio.sleep(backoff_delay(attempt, self.reconnect_base, self.reconnect_cap))
+            attempt += 1
 
 
 class KucoinStreamAccountData(BaseStreamData):
     """
     Streaming data class for account and order updates
     """
+    supports_workers = False
+
     def __init__(self, params):
 
         # Resolve params
-        super().__init__()
+        super().__init__(params)
          
         self.topics = params.get('topics', ["/spotMarket/tradeOrdersV2"])
         self.private = params.get('private', True)
         
         # Authenticate for private streams
         self.authenticate()
+        
+        # Concurrent orders, matched against the order stream
+        self.dispatcher = OrderDispatcher(self.client, params)
 
-    def stream(self, callback):
+    def stream(self, callback=None):
         """
-        Start streaming with custom msg handler callback func
+        Start streaming with custom msg handler callback func, order
+        updates are matched to dispatched orders first
         """
+        async def handler(msg):
+            self.dispatcher.on_message(msg)
+            if callback is not None:
+                await callback(msg)
+
         async def wrapper():
-            await self._connect(callback)
+            await self._connect(handler)
 
         loop = asyncio.get_event_loop()
         if loop.is_running():
-            asyncio.create_task(wrapper())
+            return asyncio.create_task(wrapper())
         else:
             loop.run_until_complete(wrapper())
 
-    async def subscribe(self, topics=["/spotMarket/tradeOrdersV2"]):
+    async def subscribe(self, topics=None, ws=None, symbols=None):
         """
         Subscribe to account update topics
         """
+        ws = ws or self.ws
+        topics = topics or self.topics
         for topic in topics:
             sub_msg = {
                 "id": str(int(time.time() * 1000)),
@@ -95,31 +261,45 @@ class KucoinStreamAccountData(BaseStreamData):
                 "privateChannel": True,
                 "response": True
             }
-            await self.ws.send(json.dumps(sub_msg))
+            await ws.send(json.dumps(sub_msg))
             print(f"Subscribed to private topic: {topic}")
 
     async def submit_market_order(self, symbol, side, size):
         """
-        Market orders
+        Market orders, through the dispatcher. Returns the order id,
+        raises the error of a rejected order
+        """
+        order = await self.dispatcher.submit(symbol, side, size)
+        if order['status'] == 'rejected':
+            raise order['error']
+        order_id = order['order_id']
+        print(f"Submitted/Finished {side.upper()} order {symbol}, size {size}, orderId {order_id}")
+        return order_id
+
+    async def submit_orders(self, orders):
         """
-        try:
-            order = await self.client.create_market_order(symbol, side=side, size=size)
-            order_id = order['orderId']
-            print(f"Submitted/Finished {side.upper()} order {symbol}, size {size}, orderId {order_id}")
-            return order_id
-        except Exception as e:
-            print(f"Failed to submit {side} order for {symbol}: {e}")
-            return None
+        Submit orders concurrently, e.g. a rebalance. orders are dicts
+        with symbol, side, size and optionally price (limit orders).
+        Returns order records, see OrderDispatcher
+        """
+        return await self.dispatcher.submit_orders(orders)
+
+    async def cancel_orders(self, client_oids):
+        """Cancel orders by client order id concurrently"""
+        return await self.dispatcher.cancel_orders(client_oids)
+
+    async def replace_orders(self, replacements):
+        """Cancel orders and submit their replacements, {client_oid: new order}"""
+        return await self.dispatcher.replace_orders(replacements)
 
     async def submit_test_market_order(self, symbol, side, size):
         """
-        Test market orders
+        Test market orders, through the dispatcher. Returns the order id,
+        raises the error of a rejected order
         """
-        try:
-            order = await self.client.create_test_order(symbol, type='market', side=side, size=size)
-            order_id = order['orderId']
-            print(f"Submitted {side.upper()} order {symbol}, size {size}, orderId {order_id}")
-            return order_id
-        except Exception as e:
-            print(f"Failed to submit {side} order for {symbol}: {e}")
-            return None
+        order = await self.dispatcher.submit(symbol, side, size, test=True)
+        if order['status'] == 'rejected':
+            raise order['error']
+        order_id = order['order_id']
+        print(f"Submitted {side.upper()} order {symbol}, size {size}, orderId {order_id}")
+        return order_id
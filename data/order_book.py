@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 24 09:37:52 2026
+
+@author: ymm
+
+Array-backed level 2 order books maintained from incremental updates
+"""
+from array import array
+from bisect import bisect_left
+import numpy as np
+
+
+def parse_l2(msg):
+    """
+    Normalize a spot /market/level2 or futures /contractMarket/level2
+    message to (symbol, first sequence, last sequence, changes, ts ms),
+    changes being (is_bid, price, size, sequence) tuples. None for
+    anything else
+    """
+    if msg.get('type') != 'message' or 'level2' not in msg.get('topic', ''):
+        return None
+
+    data = msg['data']
+    sym = data.get('symbol') or msg['topic'].split(':', 1)[1]
+
+    # Futures: one "price,side,size" change per message
+    if 'change' in data:
+        price, side, size = data['change'].split(',')
+        seq = int(data['sequence'])
+        return sym, seq, seq, [(side == 'buy', float(price), float(size), seq)], data.get('timestamp')
+
+    # Spot: [price, size, sequence] changes per side
+    changes = data['changes']
+    parsed = [(True, float(p), float(s), int(q)) for p, s, q in changes.get('bids', ())]
+    parsed += [(False, float(p), float(s), int(q)) for p, s, q in changes.get('asks', ())]
+    return sym, int(data['sequenceStart']), int(data['sequenceEnd']), parsed, data.get('time')
+
+
+class BookSide(object):
+    """
+    One side of a book as parallel sorted arrays of keys and sizes. Keys
+    are prices for asks and negated prices for bids, so the best level
+    is always first. Updates are a binary search plus an in-place memmove
+    on insert or delete; queries view the arrays as numpy without copying.
+    """
+    __slots__ = ('sign', 'keys', 'sizes')
+
+    def __init__(self, sign):
+        self.sign = sign
+        self.keys = array('d')
+        self.sizes = array('d')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def load(self, levels):
+        """Replace the side with (price, size) levels"""
+        levels = np.asarray(levels, dtype=float).reshape(-1, 2)
+        levels = levels[levels[:, 1] > 0]
+        keys = self.sign * levels[:, 0]
+        order = np.argsort(keys, kind='stable')
+        self.keys = array('d', keys[order].tobytes())
+        self.sizes = array('d', levels[order, 1].tobytes())
+
+    def update(self, price, size):
+        """Set the size at a price level, size 0 removes it"""
+        key = self.sign * price
+        keys = self.keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            if size > 0:
+                self.sizes[i] = size
+            else:
+                del keys[i]
+                del self.sizes[i]
+        elif size > 0:
+            keys.insert(i, key)
+            self.sizes.insert(i, size)
+
+    def levels(self, n=None):
+        """Best n levels as (prices, sizes) copies"""
+        n = len(self.keys) if n is None else min(n, len(self.keys))
+        prices = self.sign * np.frombuffer(self.keys, dtype=float, count=n)
+        return prices, np.frombuffer(self.sizes, dtype=float, count=n).copy()
+
+    def notional(self, n=None):
+        """Price times size summed over the best n levels"""
+        prices, sizes = self.levels(n)
+        return float(prices @ sizes)
+
+    def vwap(self, size):
+        """
+        Average price to fill size walking the side from the best level,
+        NaN if the side is not deep enough
+        """
+        sizes = np.frombuffer(self.sizes, dtype=float)
+        cum = np.cumsum(sizes)
+        k = np.searchsorted(cum, size)
+        if k >= len(cum) or size <= 0:
+            return np.nan
+
+        prices = self.sign * np.frombuffer(self.keys, dtype=float, count=k + 1)
+        filled = prices[:k] @ sizes[:k] + prices[k] * (size - (cum[k - 1] if k else 0.0))
+        return float(filled / size)
+
+
+class OrderBook(object):
+    """
+    Level 2 book of one symbol, loaded from a REST snapshot and kept
+    current by applying sequenced deltas (see parse_l2). apply() returns
+    False on a sequence gap, the book then has to be reloaded.
+    """
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = BookSide(-1)
+        self.asks = BookSide(1)
+        self.sequence = None
+        self.ts = None
+        self.n_updates = 0
+
+    @property
+    def synced(self):
+        return self.sequence is not None
+
+    def load(self, bids, asks, sequence, ts=None):
+        """Reset the book to a snapshot"""
+        self.bids.load(bids)
+        self.asks.load(asks)
+        self.sequence = int(sequence)
+        self.ts = ts
+
+    def reset(self):
+        """Mark the book stale until the next snapshot"""
+        self.sequence = None
+
+    def apply(self, delta):
+        """
+        Apply a parsed delta. Deltas already covered by the book are
+        skipped, returns False if updates are missing in between
+        """
+        _, start, end, changes, ts = delta
+        seq = self.sequence
+        if seq is None or start > seq + 1:
+            return False
+        if end <= seq:
+            return True
+
+        bids, asks = self.bids, self.asks
+        for is_bid, price, size, change_seq in changes:
+            if change_seq > seq:
+                (bids if is_bid else asks).update(price, size)
+        self.sequence = end
+        self.ts = ts
+        self.n_updates += len(changes)
+        return True
+
+    def top(self):
+        """(best bid, bid size, best ask, ask size), NaN for an empty side"""
+        bid, bid_size = (-self.bids.keys[0], self.bids.sizes[0]) if len(self.bids) else (np.nan, np.nan)
+        ask, ask_size = (self.asks.keys[0], self.asks.sizes[0]) if len(self.asks) else (np.nan, np.nan)
+        return bid, bid_size, ask, ask_size
+
+    def mid(self):
+        bid, _, ask, _ = self.top()
+        return (bid + ask) / 2
+
+    def spread(self):
+        bid, _, ask, _ = self.top()
+        return ask - bid
+
+    def depth(self, n=10):
+        """Best n levels per side as {'bids': (n, 2), 'asks': (n, 2)} price, size arrays"""
+        return {'bids': np.column_stack(self.bids.levels(n)),
+                'asks': np.column_stack(self.asks.levels(n))}
+
+    def vwap(self, size, side='buy'):
+        """Average fill price of a market order of size, buys walk the asks"""
+        return (self.asks if side == 'buy' else self.bids).vwap(size)
+
+    def booksize(self, n=10):
+        """Quote value resting in the best n levels of the thinner side"""
+        return min(self.bids.notional(n), self.asks.notional(n))
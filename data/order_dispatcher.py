@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 25 10:18:44 2026
+
+@author: ymm
+
+Concurrent order submission and tracking against the private order stream
+"""
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from data.rate_limiter import get_limiter, is_rate_limited, backoff_delay
+from data.stream_metrics import RollingHistogram
+
+# Order statuses, the last three are final
+#   new        created, not sent yet
+#   submitted  accepted by REST (acknowledged)
+#   open       resting on the book, per the order stream
+#   filled / canceled / rejected
+#   tested     accepted by the test endpoint, never executes
+FINAL_STATUSES = ('filled', 'canceled', 'rejected', 'tested')
+
+
+class OrderDispatcher(object):
+    """
+    Submits and cancels orders concurrently under the shared 'orders'
+    rate limiter, each with a client order id so that acknowledgements
+    and fills from the /spotMarket/tradeOrdersV2 stream can be matched
+    even when they arrive before the REST response.
+
+    Orders are dicts with client_oid, symbol, side, type, size, price,
+    status, order_id, filled_size, error and timestamps (submit_ts,
+    ack_ts, first_fill_ts, fill_ts, epoch seconds). Failed requests are
+    not raised, the order ends up rejected with the error attached.
+    Submit-to-ack and submit-to-fill latencies are kept in `latency`,
+    measured from the REST request, not from queueing for the limiter.
+
+    Live orders are kept in `orders`, orders in a final status move to
+    `finished`, which keeps the last `history` of them.
+    """
+
+    def __init__(self, client, params=None):
+        if params is None:
+            params = {}
+
+        self.client = client
+        self.test = params.get('test', False)
+        self.limiter = get_limiter('orders', params.get('rate_limit'))
+        self.max_retries = params.get('max_retries', 3)
+        self._inflight = asyncio.Semaphore(params.get('max_inflight', 20))
+
+        self.orders = {}   # client_oid -> live order
+        self.finished = OrderedDict()
+        self.history = params.get('history', 1000)
+        self.counters = {'submitted': 0, 'acked': 0, 'filled': 0, 'canceled': 0, 'rejected': 0, 'tested': 0}
+        window = params.get('latency_window', 4096)
+        self.latency = {'ack': RollingHistogram(window), 'fill': RollingHistogram(window)}
+
+    #%% Submission
+
+    def new_order(self, symbol, side, size=None, price=None, funds=None, client_oid=None, test=False, **params):
+        """
+        Order record, limit if a price is given, otherwise market. Test
+        orders go to the test endpoint
+        """
+        if client_oid in self.orders or client_oid in self.finished:
+            raise ValueError(f"Duplicate client_oid {client_oid}")
+        order = {
+            'client_oid': client_oid or uuid.uuid4().hex,
+            'symbol': symbol,
+            'side': side,
+            'type': 'market' if price is None else 'limit',
+            'size': size,
+            'price': price,
+            'funds': funds,
+            'params': params,
+            'test': test or self.test,
+            'status': 'new',
+            'order_id': None,
+            'filled_size': 0.0,
+            'error': None,
+            'submit_ts': None,
+            'ack_ts': None,
+            'first_fill_ts': None,
+            'fill_ts': None,
+            'sent': asyncio.get_running_loop().create_future(),
+            'done': asyncio.get_running_loop().create_future(),
+        }
+        self.orders[order['client_oid']] = order
+        return order
+
+    def get(self, client_oid):
+        """Order record by client order id, live or recently finished"""
+        order = self.orders.get(client_oid)
+        return order if order is not None else self.finished[client_oid]
+
+    async def _call(self, func, *args, **kwargs):
+        """REST call under the rate limiter, retrying 429s with backoff"""
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire_async()
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
+
+    async def _send(self, order):
+        """Send one order, its ack may race with the order stream"""
+        client = self.client
+        kwargs = dict(order['params'], client_oid=order['client_oid'])
+
+        async def stamped(func, *args, **kwargs):
+            # Latency counts from the request, after any limiter wait
+            order['submit_ts'] = time.time()
+            return await func(*args, **kwargs)
+
+        async with self._inflight:
+            try:
+                if order['test']:
+                    resp = await self._call(stamped, client.create_test_order, order['symbol'], type=order['type'],
+                                            side=order['side'], size=order['size'], price=order['price'],
+                                            funds=order['funds'], **kwargs)
+                elif order['type'] == 'market':
+                    resp = await self._call(stamped, client.create_market_order, order['symbol'], order['side'],
+                                            size=order['size'], funds=order['funds'], **kwargs)
+                else:
+                    resp = await self._call(stamped, client.create_limit_order, order['symbol'], order['side'],
+                                            order['price'], order['size'], **kwargs)
+            except Exception as e:
+                print(f"Failed to submit {order['side']} order for {order['symbol']}: {e}")
+                self._finish(order, 'rejected', error=e)
+                order['sent'].set_result(False)
+                return order
+
+        self.counters['submitted'] += 1
+        order['order_id'] = resp.get('orderId')
+        if order['status'] == 'new':
+            order['status'] = 'submitted'
+        self._ack(order)
+        order['sent'].set_result(True)
+        if order['test']:
+            self._finish(order, 'tested')
+        return order
+
+    async def submit(self, symbol, side, size=None, price=None, **params):
+        """Submit one order, returns its record once acknowledged or rejected"""
+        return await self._send(self.new_order(symbol, side, size, price, **params))
+
+    async def submit_orders(self, orders):
+        """
+        Submit many orders concurrently, orders being dicts of submit()
+        arguments. Returns the records in the same order
+        """
+        records = [self.new_order(**o) for o in orders]
+        return await asyncio.gather(*[self._send(order) for order in records])
+
+    #%% Cancel / replace
+
+    async def _cancel(self, order):
+        """
+        Cancel one order, returns whether the exchange accepted it. Orders
+        still being submitted are canceled once the exchange has them
+        """
+        if order['ack_ts'] is None and not order['sent'].done():
+            await order['sent']
+        if order['status'] in FINAL_STATUSES:
+            return order['status'] == 'canceled'
+        try:
+            await self._call(self.client.cancel_order_by_client_oid, order['client_oid'])
+        except Exception as e:
+            print(f"Failed to cancel order {order['client_oid']}: {e}")
+            order['error'] = e
+            return False
+
+        self._finish(order, 'canceled')
+        return True
+
+    async def cancel_orders(self, client_oids):
+        """Cancel orders concurrently, returns per order success"""
+        return await asyncio.gather(*[self._cancel(self.get(oid)) for oid in client_oids])
+
+    async def replace_orders(self, replacements):
+        """
+        Cancel and replace orders concurrently. replacements maps a
+        client_oid to the submit() arguments of its replacement, which is
+        only sent once the cancel went through. Returns the new records,
+        None where the cancel failed
+        """
+        async def replace(oid, new):
+            if not await self._cancel(self.get(oid)):
+                return None
+            return await self._send(self.new_order(**new))
+
+        return await asyncio.gather(*[replace(oid, new) for oid, new in replacements.items()])
+
+    #%% Order stream
+
+    def on_message(self, msg):
+        """Match a /spotMarket/tradeOrdersV2 message to its order"""
+        if msg.get('type') != 'message' or not msg.get('topic', '').startswith('/spotMarket/tradeOrders'):
+            return None
+        data = msg['data']
+        order = self.orders.get(data.get('clientOid'))
+        if order is None:
+            return None
+
+        if order['order_id'] is None:
+            order['order_id'] = data.get('orderId')
+        kind = data.get('type')
+        if 'filledSize' in data:
+            order['filled_size'] = float(data['filledSize'])
+
+        if kind in ('received', 'open'):
+            if order['status'] in ('new', 'submitted'):
+                order['status'] = 'open' if kind == 'open' else 'submitted'
+            self._ack(order)
+        elif kind == 'match':
+            self._ack(order)
+            if order['first_fill_ts'] is None:
+                order['first_fill_ts'] = time.time()
+        elif kind == 'filled':
+            self._ack(order)
+            self._finish(order, 'filled')
+        elif kind == 'canceled':
+            self._finish(order, 'canceled')
+        return order
+
+    def _ack(self, order):
+        if order['ack_ts'] is None:
+            order['ack_ts'] = time.time()
+            self.counters['acked'] += 1
+            self.latency['ack'].add(order['ack_ts'] - order['submit_ts'])
+
+    def _finish(self, order, status, error=None):
+        """Move an order to a final status once"""
+        if order['status'] in FINAL_STATUSES:
+            return
+        order['status'] = status
+        order['error'] = error
+        self.counters[status] += 1
+        if status == 'filled':
+            order['fill_ts'] = time.time()
+            if order['first_fill_ts'] is None:
+                order['first_fill_ts'] = order['fill_ts']
+            self.latency['fill'].add(order['fill_ts'] - order['submit_ts'])
+        if not order['done'].done():
+            order['done'].set_result(order)
+
+        # Keep a bounded history of finished orders
+        self.orders.pop(order['client_oid'], None)
+        self.finished[order['client_oid']] = order
+        while len(self.finished) > self.history:
+            self.finished.popitem(last=False)
+
+    #%% Status
+
+    async def wait(self, orders, timeout=None):
+        """Wait until orders reach a final status, returns the ones that did not"""
+        pending = [o['done'] for o in orders if o is not None and not o['done'].done()]
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+        return [o for o in orders if o is not None and not o['done'].done()]
+
+    def open_orders(self):
+        return list(self.orders.values())
+
+    def metrics(self):
+        """Order counters with submit-to-ack and submit-to-fill latency in ms"""
+        return dict(self.counters,
+                    open=len(self.open_orders()),
+                    latency_ms={k: h.summary(1000) for k, h in self.latency.items()})
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 18 11:20:05 2026
+
+@author: ymm
+
+Aligned T x N panel store for kline data
+"""
+import os
+import json
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from data.kline_cache import frame_to_array
+
+PANEL_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+
+class Panel(object):
+    """
+    Aligned T x N panel: one shared timestamp index, one symbol index and
+    one C-contiguous float (T, N) array per field, float64 unless built
+    with dtype=float32. Missing bars are NaN.
+    """
+
+    def __init__(self, timestamps, symbols, fields: dict):
+        self.timestamps = np.asarray(timestamps, dtype='datetime64[ns]')
+        self.symbols = list(symbols)
+        self.fields = fields
+        self.sym_idx = {sym: j for j, sym in enumerate(self.symbols)}
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def shape(self):
+        return (len(self.timestamps), len(self.symbols))
+
+    @property
+    def dtype(self):
+        return next(iter(self.fields.values())).dtype if self.fields else np.dtype(np.float64)
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, fields=PANEL_FIELDS, dtype=np.float64):
+        """
+        Build a panel from {symbol: structured kline array}, scattering each
+        symbol's rows straight into the preallocated field arrays
+        """
+        symbols = list(arrays.keys())
+        ts = [np.asarray(arr['timestamp'], dtype='int64') for arr in arrays.values()]
+        index = np.unique(np.concatenate(ts)) if ts else np.empty(0, dtype='int64')
+
+        out = {f: np.full((len(index), len(symbols)), np.nan, dtype=dtype) for f in fields}
+        for j, (ts_, arr) in enumerate(zip(ts, arrays.values())):
+            rows = np.searchsorted(index, ts_)
+            for f in fields:
+                out[f][rows, j] = arr[f]
+
+        return cls(index.astype('datetime64[ms]'), symbols, out)
+
+    @classmethod
+    def from_frames(cls, frames: dict, fields=PANEL_FIELDS, dtype=np.float64):
+        """Build a panel from {symbol: batch_load DataFrame}"""
+        return cls.from_arrays({sym: frame_to_array(df) for sym, df in frames.items()}, fields, dtype)
+
+    def slice(self, start=None, end=None):
+        """Panel over [start, end]; field arrays are views, not copies"""
+        i0 = 0 if start is None else np.searchsorted(self.timestamps, np.datetime64(start, 'ns'), side='left')
+        i1 = len(self) if end is None else np.searchsorted(self.timestamps, np.datetime64(end, 'ns'), side='right')
+        fields = {f: arr[i0:i1] for f, arr in self.fields.items()}
+        return Panel(self.timestamps[i0:i1], self.symbols, fields)
+
+    # Point in time access
+    loc = slice
+
+    def asof_index(self, date):
+        """Row of the last bar at or before date, -1 if there is none"""
+        return int(np.searchsorted(self.timestamps, np.datetime64(date, 'ns'), side='right')) - 1
+
+    def asof(self, date, field='close'):
+        """Cross section of a field as of date (a view), None if before the panel"""
+        i = self.asof_index(date)
+        return self.fields[field][i] if i >= 0 else None
+
+    def to_frame(self, field='close', values=None):
+        """T x N DataFrame of a field (or of values aligned to this panel)"""
+        values = self.fields[field] if values is None else values
+        return pd.DataFrame(values,
+                            index=pd.DatetimeIndex(self.timestamps, name='timestamp'),
+                            columns=pd.Index(self.symbols, name='symbol'))
+
+    def to_shared(self):
+        """
+        Copy the panel into one shared memory block so other processes can
+        attach to it without pickling. Returns (shm, descriptor); the owner
+        must keep shm alive and call shm.unlink() when done.
+        """
+        T, N = self.shape
+        names = list(self.fields)
+        dtype = self.dtype
+        nbytes = 8 * T + dtype.itemsize * T * N * len(names)
+        shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        
+        ts = np.ndarray((T,), dtype='datetime64[ns]', buffer=shm.buf)
+        ts[:] = self.timestamps
+        for k, f in enumerate(names):
+            arr = np.ndarray((T, N), dtype=dtype, buffer=shm.buf, offset=8 * T + dtype.itemsize * T * N * k)
+            arr[:] = self.fields[f]
+        
+        descriptor = {'name': shm.name, 'T': T, 'symbols': self.symbols, 'fields': names,
+                      'dtype': dtype.str}
+        return shm, descriptor
+
+    @classmethod
+    def from_shared(cls, descriptor):
+        """
+        Attach to a panel created by to_shared(). Returns (panel, shm); the
+        arrays are views into shm, which must outlive the panel
+        """
+        try:
+            shm = shared_memory.SharedMemory(name=descriptor['name'], track=False)
+        except TypeError:
+            # Python < 3.13, children share the owner's resource tracker
+            # so attaching only re-registers the same block
+            shm = shared_memory.SharedMemory(name=descriptor['name'])
+        
+        T, N = descriptor['T'], len(descriptor['symbols'])
+        dtype = np.dtype(descriptor.get('dtype', '<f8'))
+        ts = np.ndarray((T,), dtype='datetime64[ns]', buffer=shm.buf)
+        fields = {}
+        for k, f in enumerate(descriptor['fields']):
+            fields[f] = np.ndarray((T, N), dtype=dtype, buffer=shm.buf, offset=8 * T + dtype.itemsize * T * N * k)
+        
+        return cls(ts, descriptor['symbols'], fields), shm
+
+    def save(self, path):
+        """
+        Write the panel as one .npy file per field plus a json index, for
+        read-only memory-mapped access with open()
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'timestamps.npy'), self.timestamps)
+        for f, arr in self.fields.items():
+            np.save(os.path.join(path, f + '.npy'), np.ascontiguousarray(arr))
+        with open(os.path.join(path, 'panel.json'), 'w') as fh:
+            json.dump({'symbols': self.symbols, 'fields': list(self.fields)}, fh)
+        return path
+
+    @classmethod
+    def open(cls, path, mmap_mode='r'):
+        """
+        Open a panel written by save(). Fields are memory-mapped, so any
+        number of processes share one copy through the page cache
+        """
+        with open(os.path.join(path, 'panel.json')) as fh:
+            meta = json.load(fh)
+        ts = np.load(os.path.join(path, 'timestamps.npy'))
+        fields = {f: np.load(os.path.join(path, f + '.npy'), mmap_mode=mmap_mode) for f in meta['fields']}
+        return cls(ts, meta['symbols'], fields)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 27 09:14:26 2026
+
+@author: ymm
+
+Stage timing and profiling for model eval runs
+"""
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from data.panel import Panel
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Profiler collecting stages, None when profiling is off
+_active = None
+_local = threading.local()
+
+
+def n_rows(data):
+    """Rows in a result or loaded data, bars (timestamps x symbols) for panels"""
+    if data is None:
+        return None
+    if isinstance(data, dict):
+        counts = [n_rows(value) for value in data.values()]
+        return sum(c for c in counts if c is not None)
+    if isinstance(data, Panel):
+        return int(data.shape[0] * data.shape[1])
+    if hasattr(data, '__len__'):
+        return len(data)
+    return None
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _path():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextmanager
+def stage(name, rows=None):
+    """
+    Time a stage of the active profiler, a no-op when there is none.
+    Stages nest into paths like 'load/KucoinFuturesKlinesData/fetch'.
+    Yields a dict, set its 'rows' when the count is only known at the end
+    """
+    prof = _active
+    info = {'rows': rows}
+    if prof is None:
+        yield info
+        return
+
+    stack = _path()
+    main = threading.get_ident() == prof.thread
+    traced = main and prof.tracemalloc
+    frame = {'name': name, 'floor': 0}
+    if traced:
+        # Peak so far belongs to the enclosing stage, restart it for this one
+        _, peak = tracemalloc.get_traced_memory()
+        outer = stack[-1] if stack else prof.root
+        outer['floor'] = max(outer['floor'], peak)
+        tracemalloc.reset_peak()
+
+    stack.append(frame)
+    cpu_clock = time.process_time if main else time.thread_time
+    t0, c0 = time.perf_counter(), cpu_clock()
+    try:
+        yield info
+    finally:
+        wall, cpu = time.perf_counter() - t0, cpu_clock() - c0
+        stack.pop()
+        if traced:
+            peak = max(tracemalloc.get_traced_memory()[1], frame['floor'])
+            outer = stack[-1] if stack else prof.root
+            outer['floor'] = max(outer['floor'], peak)
+            peak_mb = peak / 1e6
+        elif main:
+            peak_mb = _max_rss_mb()
+        else:
+            peak_mb = None
+        path = '/'.join([f['name'] for f in stack] + [name])
+        prof.record(path, wall, cpu, info['rows'], peak_mb)
+
+
+def bind(func):
+    """
+    Wrap func to run under the caller's stage path, for work handed to
+    thread pools
+    """
+    if _active is None:
+        return func
+    parent = list(_path())
+
+    def wrapper(*args, **kwargs):
+        stack = _path()
+        saved = stack[:]
+        stack[:] = [{'name': f['name'], 'floor': 0} for f in parent]
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stack[:] = saved
+    return wrapper
+
+
+class Profiler(object):
+    """
+    Collects wall time, CPU time, rows and peak memory per stage while
+    active (with Profiler(...) as prof: ...), see stage().
+
+    mode is True for stage timing only, or any of 'cprofile' (function
+    level profile of the calling thread) and 'tracemalloc' (per stage
+    peak of traced Python allocations instead of the process max RSS),
+    as a string or a list. Stages run in worker threads are summed over
+    threads, so their wall time can exceed their parent's; their CPU
+    time is per thread and they have no peak memory.
+    """
+
+    def __init__(self, mode=True, label=None, top=30, profile_dir=None):
+        modes = [mode] if isinstance(mode, str) else (mode if isinstance(mode, (list, tuple)) else [])
+        self.cprofile = 'cprofile' in modes
+        self.tracemalloc = 'tracemalloc' in modes
+        self.label = label
+        self.top = top
+        self.profile_dir = profile_dir
+        self.stages = {}
+        self.root = {'name': None, 'floor': 0}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        global _active
+        self._outer = _active
+        self.thread = threading.get_ident()
+        self._stack = _path()[:]
+        _path().clear()
+        self._started_tracing = self.tracemalloc and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        self._profile = cProfile.Profile() if self.cprofile else None
+        self.started = datetime.now(timezone.utc).isoformat()
+        _active = self
+
+        self._t0, self._c0 = time.perf_counter(), time.process_time()
+        if self._profile is not None:
+            self._profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        if self._profile is not None:
+            self._profile.disable()
+        self.wall = time.perf_counter() - self._t0
+        self.cpu = time.process_time() - self._c0
+        if self.tracemalloc:
+            self.peak_mb = max(tracemalloc.get_traced_memory()[1], self.root['floor']) / 1e6
+            if self._started_tracing:
+                tracemalloc.stop()
+        else:
+            self.peak_mb = _max_rss_mb()
+        _active = self._outer
+        _path()[:] = self._stack
+        return False
+
+    def record(self, path, wall, cpu, rows=None, peak_mb=None):
+        with self._lock:
+            s = self.stages.get(path)
+            if s is None:
+                s = self.stages[path] = {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'rows': 0,
+                                         'max_wall': 0.0, 'peak_mb': None}
+            s['calls'] += 1
+            s['wall'] += wall
+            s['cpu'] += cpu
+            s['max_wall'] = max(s['max_wall'], wall)
+            if rows is not None:
+                s['rows'] += rows
+            if peak_mb is not None:
+                s['peak_mb'] = peak_mb if s['peak_mb'] is None else max(s['peak_mb'], peak_mb)
+
+    def functions(self):
+        """Top functions of the cProfile run by cumulative time"""
+        if self._profile is None:
+            return None
+        stats = pstats.Stats(self._profile, stream=io.StringIO()).stats
+        rows = sorted(stats.items(), key=lambda kv: kv[1][3], reverse=True)[:self.top]
+        return [{'function': f"{os.path.basename(file)}:{line}({name})",
+                 'calls': nc, 'tottime': tt, 'cumtime': ct}
+                for (file, line, name), (cc, nc, tt, ct, _) in rows]
+
+    def report(self):
+        """JSON serializable report of the run"""
+        report = {
+            'label': self.label,
+            'started': self.started,
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'peak_mb': self.peak_mb,
+            'memory': 'tracemalloc' if self.tracemalloc else 'max_rss',
+            'stages': {path: dict(s) for path, s in self.stages.items()},
+        }
+        if self._profile is not None:
+            report['functions'] = self.functions()
+            if self.profile_dir is not None:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                fname = os.path.join(self.profile_dir, f"{self.label or 'run'}_{self.started.replace(':', '')}.prof")
+                self._profile.dump_stats(fname)
+                report['profile_file'] = fname
+        return report
+
+
+#%% Reports
+
+def save_report(report, path):
+    """Append a report to a JSON lines file"""
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(report) + '\n')
+
+
+def load_reports(path):
+    """Reports saved with save_report"""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def aggregate(reports):
+    """
+    Combine reports of many runs. Stage stats are summed, with mean and
+    worst wall time per run, peaks are the max; cProfile functions are
+    summed by function
+    """
+    runs = len(reports)
+    walls = [r['wall'] for r in reports]
+    out = {
+        'runs': runs,
+        'labels': sorted({r.get('label') for r in reports if r.get('label') is not None}),
+        'wall': {'total': sum(walls), 'mean': sum(walls) / runs if runs else None,
+                 'min': min(walls, default=None), 'max': max(walls, default=None)},
+        'cpu': sum(r.get('cpu', 0.0) for r in reports),
+        'peak_mb': max((r['peak_mb'] for r in reports if r.get('peak_mb') is not None), default=None),
+        'stages': {},
+    }
+
+    for r in reports:
+        for path, s in r['stages'].items():
+            agg = out['stages'].setdefault(path, {'runs': 0, 'calls': 0, 'wall': 0.0, 'cpu': 0.0,
+                                                  'rows': 0, 'max_wall': 0.0, 'run_max_wall': 0.0,
+                                                  'peak_mb': None})
+            agg['runs'] += 1
+            for key in ('calls', 'wall', 'cpu', 'rows'):
+                agg[key] += s[key]
+            agg['max_wall'] = max(agg['max_wall'], s['max_wall'])
+            agg['run_max_wall'] = max(agg['run_max_wall'], s['wall'])
+            if s.get('peak_mb') is not None:
+                agg['peak_mb'] = s['peak_mb'] if agg['peak_mb'] is None else max(agg['peak_mb'], s['peak_mb'])
+    for agg in out['stages'].values():
+        agg['mean_wall'] = agg['wall'] / agg['runs']
+
+    functions = {}
+    for r in reports:
+        for fn in r.get('functions') or []:
+            agg = functions.setdefault(fn['function'], {'function': fn['function'], 'calls': 0,
+                                                        'tottime': 0.0, 'cumtime': 0.0})
+            for key in ('calls', 'tottime', 'cumtime'):
+                agg[key] += fn[key]
+    if functions:
+        out['functions'] = sorted(functions.values(), key=lambda f: f['cumtime'], reverse=True)
+
+    return out
+
+
+def format_report(report, min_share=0.0):
+    """Stage table of a report or aggregate, for printing"""
+    total = report['wall']['total'] if isinstance(report['wall'], dict) else report['wall']
+    lines = [f"{'stage':50s} {'calls':>7s} {'wall s':>9s} {'cpu s':>9s} {'share':>6s} {'rows':>10s} {'peak MB':>8s}"]
+    for path, s in sorted(report['stages'].items()):
+        share = s['wall'] / total if total else 0.0
+        if share < min_share:
+            continue
+        peak = '' if s.get('peak_mb') is None else f"{s['peak_mb']:.1f}"
+        lines.append(f"{path:50s} {s['calls']:7d} {s['wall']:9.3f} {s['cpu']:9.3f} {share:6.1%} {s['rows']:10d} {peak:>8s}")
+    return '\n'.join(lines)
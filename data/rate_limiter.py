@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 18 10:03:15 2026
+
+@author: ymm
+
+Rate limiting and retry helpers for REST requests
+"""
+import time
+import random
+import threading
+
+# Default per-endpoint limits (requests per second, burst size).
+# Kucoin futures public endpoints share a 2000 / 30s weight pool and
+# klines cost 3 weight each, so ~20 req/s leaves some headroom.
+ENDPOINT_LIMITS = {
+    'futures_get_klines': (20, 20),
+    # Spot order placement and cancels, 45 requests / 3s per user
+    'orders':             (15, 15),
+    'default':            (10, 10),
+}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket. Tokens refill continuously at `rate` per
+    second up to `capacity`; acquire() blocks until enough are available.
+    """
+
+    def __init__(self, rate: float, capacity: float=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float=1):
+        """Take tokens if available, otherwise return seconds to wait"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens: float=1):
+        """Block until tokens are available"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float=1):
+        """Wait for tokens without blocking the event loop"""
+        # Imported here, REST-only users of the limiter never load asyncio
+        import asyncio
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+def get_limiter(endpoint: str, rate: float=None, capacity: float=None):
+    """
+    Get the process-wide limiter shared by all callers of an endpoint.
+    Callers passing their own limits share a separate bucket per limit,
+    so an override never changes the limit of the other callers
+    """
+    key = endpoint if rate is None else (endpoint, float(rate), float(capacity or rate))
+    with _limiters_lock:
+        if key not in _limiters:
+            default_rate, default_capacity = ENDPOINT_LIMITS.get(endpoint, ENDPOINT_LIMITS['default'])
+            _limiters[key] = TokenBucket(rate or default_rate, capacity or rate or default_capacity)
+        return _limiters[key]
+
+
+def is_rate_limited(e: Exception):
+    """Whether an api exception is a 429 / too many requests"""
+    return getattr(e, 'status_code', None) == 429 or str(getattr(e, 'code', '')) == '429000'
+
+
+def backoff_delay(attempt: int, base: float=0.5, cap: float=30.0):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def call_with_retry(func, *args, limiter=None, max_retries: int=5, **kwargs):
+    """Call func under a rate limiter, retrying with backoff on 429s"""
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if not is_rate_limited(e) or attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Rate limited, retrying in {delay:.2f}s ({attempt + 1}/{max_retries})")
+            time.sleep(delay)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 19 14:48:31 2026
+
+@author: ymm
+
+Throughput, lag and latency metrics for streaming data
+"""
+import time
+import numpy as np
+
+# Latency stages of a message, in seconds
+#   network   exchange timestamp -> socket receive
+#   queue     socket receive -> dequeue
+#   callback  dequeue -> callback done
+#   total     exchange timestamp -> callback done
+LATENCY_STAGES = ['network', 'queue', 'callback', 'total', 'ping_rtt']
+
+
+def exchange_ts(msg):
+    """
+    Exchange timestamp of a parsed message in epoch seconds, None if it
+    has none. Kucoin sends ms (spot) or ns (futures)
+    """
+    data = msg.get('data')
+    if not isinstance(data, dict):
+        return None
+    ts = data.get('time') or data.get('Time') or data.get('ts')
+    if ts is None:
+        return None
+    ts = int(ts)
+    if ts > 1e17:
+        return ts / 1e9
+    if ts > 1e14:
+        return ts / 1e6
+    return ts / 1e3
+
+
+class RollingHistogram(object):
+    """
+    Fixed size ring buffer of the most recent observations, with
+    percentiles computed on demand
+    """
+
+    def __init__(self, window=4096):
+        self.values = np.empty(window)
+        self.n = 0
+        self.max = float('-inf')
+
+    def add(self, value):
+        self.values[self.n % len(self.values)] = value
+        self.n += 1
+        if value > self.max:
+            self.max = value
+
+    def summary(self, scale=1.0):
+        """count, p50, p99 and max over the window, max since start"""
+        if self.n == 0:
+            return {'count': 0, 'p50': None, 'p99': None, 'max': None, 'max_all': None}
+        window = self.values[:min(self.n, len(self.values))] * scale
+        p50, p99 = np.percentile(window, [50, 99])
+        return {'count': self.n, 'p50': float(p50), 'p99': float(p99),
+                'max': float(window.max()), 'max_all': self.max * scale}
+
+
+class StreamStats(object):
+    """
+    Counters for the websocket message pipeline: received, processed,
+    dropped and coalesced messages, batches, queue depth and lag (age of
+    the last processed message since it came off the socket).
+
+    Also keeps rolling histograms of per-message latency by stage (see
+    LATENCY_STAGES), queue depth per batch and ping round trip. Network
+    and total latency rely on the exchange clock, so they include clock
+    skew; queue and callback latency are local.
+    """
+
+    def __init__(self, window=4096):
+        self.counters = {
+            'received':   0,
+            'processed':  0,
+            'dropped':    0,
+            'coalesced':  0,
+            'batches':    0,
+            'errors':     0,
+            'reconnects': 0,
+        }
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.lag = 0.0
+        self.latency = {stage: RollingHistogram(window) for stage in LATENCY_STAGES}
+        self.depth_hist = RollingHistogram(window)
+        self.started = time.time()
+
+    def count(self, key, n=1):
+        self.counters[key] += n
+
+    def on_batch(self, batch, depth):
+        """Record a drained batch of [topic, raw, recv_ts] entries"""
+        self.counters['batches'] += 1
+        self.queue_depth = depth
+        self.depth_hist.add(depth)
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def on_message(self, exch_ts, recv_ts, dequeue_ts, done_ts):
+        """Record the four timestamps of one processed message"""
+        latency = self.latency
+        latency['queue'].add(dequeue_ts - recv_ts)
+        latency['callback'].add(done_ts - dequeue_ts)
+        if exch_ts is not None:
+            latency['network'].add(recv_ts - exch_ts)
+            latency['total'].add(done_ts - exch_ts)
+
+    def on_pong(self, rtt):
+        """Record a ping round trip in seconds"""
+        self.latency['ping_rtt'].add(rtt)
+
+    def on_processed(self, n, recv_ts):
+        """Record processed messages, recv_ts of the last one"""
+        self.counters['processed'] += n
+        self.lag = time.time() - recv_ts
+
+    def snapshot(self, since=None):
+        """
+        Counters plus msg/s rates since an earlier snapshot, or since
+        start. Does not change any state, so every consumer can keep
+        its own baseline
+        """
+        now = time.time()
+        if since is None:
+            t0, received0, processed0 = self.started, 0, 0
+        else:
+            t0, received0, processed0 = since['time'], since['received'], since['processed']
+        dt = max(now - t0, 1e-9)
+        received, processed = self.counters['received'], self.counters['processed']
+
+        return dict(self.counters,
+                    time=now,
+                    queue_depth=self.queue_depth,
+                    max_queue_depth=self.max_queue_depth,
+                    lag_ms=self.lag * 1000,
+                    recv_rate=(received - received0) / dt,
+                    process_rate=(processed - processed0) / dt,
+                    uptime=now - self.started,
+                    latency_ms={stage: h.summary(1000) for stage, h in self.latency.items()},
+                    queue_depth_hist=self.depth_hist.summary())
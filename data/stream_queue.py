@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 19 14:22:10 2026
+
+@author: ymm
+
+Bounded message queue with per-topic backpressure policies
+"""
+import time
+import asyncio
+from collections import deque
+
+POLICIES = ('block', 'drop_oldest', 'drop_newest', 'coalesce')
+
+
+def topic_of(raw):
+    """Cheap topic extraction from a raw ws message without parsing it"""
+    i = raw.find('"topic"')
+    if i < 0:
+        return None
+    i = raw.find('"', i + 7) + 1
+    return raw[i:raw.find('"', i)]
+
+
+class MessageQueue(object):
+    """
+    Bounded FIFO for raw websocket messages. When full, the policy of the
+    incoming message's topic decides what happens:
+
+        block        wait for the consumer to make room
+        drop_oldest  evict the oldest queued message of a non-block topic,
+                     or wait if there is none
+        drop_newest  drop the incoming message
+        coalesce     replace the queued message of the same topic in place
+                     (keeping its slot), otherwise as drop_oldest
+
+    Coalescing topics always keep at most one pending message, so
+    consumers only ever see the latest ticker per symbol. Topic policies
+    match by prefix, e.g. {'/market/ticker': 'coalesce'}.
+    """
+
+    def __init__(self, maxsize=10000, policy='block', topic_policies=None, stats=None):
+        for p in [policy] + list((topic_policies or {}).values()):
+            if p not in POLICIES:
+                raise ValueError(f"Unknown queue policy {p}")
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.topic_policies = topic_policies or {}
+        self.stats = stats
+
+        self._items = deque()   # [topic, raw, recv_ts]
+        self._latest = {}       # topic -> pending entry, for coalescing topics
+        self._policy_cache = {}
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._closed = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def policy_of(self, topic):
+        """Policy for a topic, longest matching prefix wins"""
+        if topic not in self._policy_cache:
+            policy, best = self.policy, -1
+            for prefix, p in self.topic_policies.items():
+                if topic is not None and topic.startswith(prefix) and len(prefix) > best:
+                    policy, best = p, len(prefix)
+            self._policy_cache[topic] = policy
+        return self._policy_cache[topic]
+
+    def _count(self, key):
+        if self.stats is not None:
+            self.stats.count(key)
+
+    def _evict_oldest(self):
+        """
+        Evict the oldest message of a lossy topic, messages of block
+        topics are never dropped. False if there is none
+        """
+        items = self._items
+        for i, entry in enumerate(items):
+            if self.policy_of(entry[0]) != 'block':
+                break
+        else:
+            return False
+
+        if i == 0:
+            items.popleft()
+        else:
+            del items[i]
+        if self._latest.get(entry[0]) is entry:
+            del self._latest[entry[0]]
+        self._count('dropped')
+        return True
+
+    async def put(self, raw, topic=None, recv_ts=None):
+        """Enqueue a raw message according to its topic policy"""
+        if topic is None:
+            topic = topic_of(raw)
+        if recv_ts is None:
+            recv_ts = time.time()
+        policy = self.policy_of(topic)
+
+        # Coalesce into the pending message of this topic, if any
+        if policy == 'coalesce':
+            entry = self._latest.get(topic)
+            if entry is not None:
+                entry[1], entry[2] = raw, recv_ts
+                self._count('coalesced')
+                return
+
+        while len(self._items) >= self.maxsize and not self._closed:
+            if policy == 'block':
+                self._not_full.clear()
+                await self._not_full.wait()
+            elif policy == 'drop_newest':
+                self._count('dropped')
+                return
+            elif not self._evict_oldest():
+                # Only block topics queued, wait like they would
+                self._not_full.clear()
+                await self._not_full.wait()
+
+        entry = [topic, raw, recv_ts]
+        self._items.append(entry)
+        if policy == 'coalesce':
+            self._latest[topic] = entry
+        self._not_empty.set()
+
+    def close(self):
+        """Wake up waiting consumers, get_batch returns [] once drained"""
+        self._closed = True
+        self._not_empty.set()
+        self._not_full.set()
+
+    async def get_batch(self, max_items=100):
+        """Wait for at least one message, then drain up to max_items"""
+        while not self._items:
+            if self._closed:
+                return []
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+        batch = []
+        latest = self._latest
+        for _ in range(min(max_items, len(self._items))):
+            entry = self._items.popleft()
+            if latest and latest.get(entry[0]) is entry:
+                del latest[entry[0]]
+            batch.append(entry)
+
+        self._not_full.set()
+        return batch
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 20 09:12:45 2026
+
+@author: ymm
+
+Record raw websocket messages to disk and replay them offline
+"""
+import os
+import time
+import zlib
+import struct
+import asyncio
+import settings
+from data.base_stream_data import json_loads
+from data.stream_metrics import StreamStats
+
+# Block header: first ts, last ts (us), number of messages, compressed size
+BLOCK_HEADER = struct.Struct('<qqII')
+# Message header inside a block: receive ts (us), message size
+MSG_HEADER = struct.Struct('<qI')
+
+
+class StreamRecorder(object):
+    """
+    Append-only log of raw stream messages with their receive time.
+
+    Messages are buffered and written as zlib compressed blocks, each
+    prefixed with its time range, so a crash loses at most the open block
+    and replay can seek by time without decompressing. Logs roll over to
+    a new segment file every `segment_bytes`; segments are named by
+    their first receive time (ms) and sort in time order.
+
+    Pass as `recorder` to a stream to record everything it receives.
+    """
+
+    def __init__(self, params=None):
+        if params is None:
+            params = {}
+
+        self.path = params.get('path') or os.path.join(settings.PROJECT_ROOT, 'recordings')
+        self.block_size = params.get('block_size', 1000)
+        self.block_seconds = params.get('block_seconds', 1.0)
+        self.segment_bytes = params.get('segment_bytes', 256 * 1024 * 1024)
+        self.level = params.get('level', 6)
+        os.makedirs(self.path, exist_ok=True)
+
+        self._buffer = []
+        self._block_start = None
+        self._file = None
+        self.n_messages = 0
+
+    def write(self, raw, recv_ts=None):
+        """Append one raw message, recv_ts in epoch seconds"""
+        if recv_ts is None:
+            recv_ts = time.time()
+        if isinstance(raw, str):
+            raw = raw.encode()
+
+        self._buffer.append((int(recv_ts * 1e6), raw))
+        if self._block_start is None:
+            self._block_start = recv_ts
+        self.n_messages += 1
+
+        if len(self._buffer) >= self.block_size or recv_ts - self._block_start >= self.block_seconds:
+            self.flush()
+
+    def flush(self):
+        """Compress and append the buffered messages as one block"""
+        if not self._buffer:
+            return
+
+        first, last = self._buffer[0][0], self._buffer[-1][0]
+        payload = b''.join(MSG_HEADER.pack(ts, len(raw)) + raw for ts, raw in self._buffer)
+        block = zlib.compress(payload, self.level)
+
+        if self._file is None or self._file.tell() >= self.segment_bytes:
+            self._roll(first)
+        self._file.write(BLOCK_HEADER.pack(first, last, len(self._buffer), len(block)))
+        self._file.write(block)
+        self._file.flush()
+
+        self._buffer = []
+        self._block_start = None
+
+    def _roll(self, first_ts):
+        """Start a new segment file"""
+        if self._file is not None:
+            self._file.close()
+        name = os.path.join(self.path, f"{first_ts // 1000}.rec")
+        self._file = open(name, 'ab')
+
+    def close(self):
+        """Flush the open block and close the segment"""
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def segments(path):
+    """Segment files of a recording in time order"""
+    files = [f for f in os.listdir(path) if f.endswith('.rec')]
+    return [os.path.join(path, f) for f in sorted(files, key=lambda f: int(f[:-4]))]
+
+
+def read_blocks(fname):
+    """Yield (first ts, last ts, n, offset, size) per block without decompressing"""
+    with open(fname, 'rb') as f:
+        offset = 0
+        while True:
+            header = f.read(BLOCK_HEADER.size)
+            if len(header) < BLOCK_HEADER.size:
+                break
+            first, last, n, size = BLOCK_HEADER.unpack(header)
+            offset += BLOCK_HEADER.size
+            yield first, last, n, offset, size
+            offset += size
+            f.seek(offset)
+
+
+def read_messages(path, start=None, end=None):
+    """
+    Yield (recv ts in seconds, raw bytes) of a recording in [start, end],
+    bounds in epoch seconds. Blocks outside the range are skipped unread
+    """
+    start_us = None if start is None else int(start * 1e6)
+    end_us = None if end is None else int(end * 1e6)
+
+    for fname in segments(path):
+        with open(fname, 'rb') as f:
+            for first, last, n, offset, size in read_blocks(fname):
+                if start_us is not None and last < start_us:
+                    continue
+                if end_us is not None and first > end_us:
+                    return
+                f.seek(offset)
+                block = f.read(size)
+                if len(block) < size:
+                    # Truncated tail of a crashed recorder
+                    return
+                payload = zlib.decompress(block)
+
+                pos = 0
+                for _ in range(n):
+                    ts, length = MSG_HEADER.unpack_from(payload, pos)
+                    pos += MSG_HEADER.size
+                    if (start_us is None or ts >= start_us) and (end_us is None or ts <= end_us):
+                        yield ts / 1e6, payload[pos:pos + length]
+                    pos += length
+
+
+class StreamReplayer(object):
+    """
+    Replay a recording through the same callback interface as the live
+    streams. speed=1.0 replays in real time, speed=N N times faster and
+    speed=None as fast as the callback allows.
+
+    Callback timing is tracked in `stats` (see StreamStats), which gives
+    handler throughput and latency offline.
+    """
+
+    def __init__(self, params):
+        self.path = params.get('path') or os.path.join(settings.PROJECT_ROOT, 'recordings')
+        self.speed = params.get('speed', None)
+        self.start = params.get('start', None)
+        self.end = params.get('end', None)
+        self.stats = StreamStats()
+        self._running = True
+
+    async def replay(self, callback):
+        """Push recorded messages to an async callback, returns the count"""
+        self._running = True
+        t0 = ts0 = None
+        n = 0
+
+        for recv_ts, raw in read_messages(self.path, self.start, self.end):
+            if not self._running:
+                break
+
+            # Pace to the recorded inter-arrival times
+            if self.speed:
+                if t0 is None:
+                    t0, ts0 = time.time(), recv_ts
+                delay = t0 + (recv_ts - ts0) / self.speed - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            dequeue_ts = time.time()
+            self.stats.count('received')
+            msg = json_loads(raw)
+            await callback(msg)
+            done_ts = time.time()
+            self.stats.on_message(None, dequeue_ts, dequeue_ts, done_ts)
+            self.stats.on_processed(1, dequeue_ts)
+            n += 1
+
+        return n
+
+    def stream(self, callback):
+        """Replay, mirroring the live stream() entry point"""
+        loop = asyncio.get_event_loop()
+        if loop.is_running():
+            return asyncio.create_task(self.replay(callback))
+        return loop.run_until_complete(self.replay(callback))
+
+    def metrics(self, since=None):
+        """Throughput and callback latency of the replay"""
+        return self.stats.snapshot(since)
+
+    def stop(self):
+        self._running = False
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 26 11:02:37 2026
+
+@author: ymm
+
+Fan stream messages out to worker processes over shared memory rings
+"""
+import time
+import zlib
+import struct
+import asyncio
+import multiprocessing
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
+from data.base_stream_data import json_loads
+
+# Ring header: write position, read position, messages read (uint64 each)
+RING_HEADER = 64
+# Record header: payload size, receive ts; size STOP ends the worker
+RECORD = struct.Struct('<Id')
+STOP = 0xFFFFFFFF
+
+
+class ShmRing(object):
+    """
+    Single producer, single consumer byte ring in shared memory. Records
+    are length-prefixed raw messages with their receive time, written
+    across the wrap point when needed. Positions only ever grow, the
+    producer publishes a record by advancing the write position after
+    copying it in, the consumer frees space by advancing the read
+    position, so neither side takes a lock.
+
+    NOTE: there is no memory barrier between copying a record in and
+    publishing the write position, the ring relies on stores becoming
+    visible in program order as on x86. On weakly ordered CPUs (ARM) a
+    consumer could see the new position before the record bytes.
+    """
+
+    def __init__(self, capacity=1 << 22, name=None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=RING_HEADER + capacity)
+            self.owner = True
+        else:
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:
+                # Python < 3.13, children share the owner's resource tracker
+                self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+
+        self.name = self.shm.name
+        self.capacity = capacity
+        self.pos = np.ndarray((3,), dtype=np.uint64, buffer=self.shm.buf)
+        self.data = self.shm.buf[RING_HEADER:RING_HEADER + capacity]
+        if self.owner:
+            self.pos[:] = 0
+
+    def free(self):
+        return self.capacity - (int(self.pos[0]) - int(self.pos[1]))
+
+    def __len__(self):
+        """Bytes pending"""
+        return int(self.pos[0]) - int(self.pos[1])
+
+    def _copy_in(self, pos, payload):
+        i = pos % self.capacity
+        n = min(len(payload), self.capacity - i)
+        self.data[i:i + n] = payload[:n]
+        if n < len(payload):
+            self.data[:len(payload) - n] = payload[n:]
+
+    def _copy_out(self, pos, size):
+        i = pos % self.capacity
+        if i + size <= self.capacity:
+            return bytes(self.data[i:i + size])
+        n = self.capacity - i
+        return bytes(self.data[i:]) + bytes(self.data[:size - n])
+
+    def write(self, raw, recv_ts=0.0, size=None):
+        """Append one record, False if the ring is too full for it"""
+        need = RECORD.size + len(raw)
+        if need > self.capacity:
+            raise ValueError(f"Message of {len(raw)} bytes does not fit a ring of {self.capacity}")
+        if self.free() < need:
+            return False
+
+        w = int(self.pos[0])
+        self._copy_in(w, RECORD.pack(len(raw) if size is None else size, recv_ts))
+        self._copy_in(w + RECORD.size, raw)
+        # Publish, ordered after the copy by x86 store ordering only
+        self.pos[0] = w + need
+        return True
+
+    def read_batch(self, max_records=256):
+        """Up to max_records (raw bytes, recv_ts), raw None for STOP"""
+        r, w = int(self.pos[1]), int(self.pos[0])
+        out = []
+        while r < w and len(out) < max_records:
+            size, recv_ts = RECORD.unpack(self._copy_out(r, RECORD.size))
+            r += RECORD.size
+            if size == STOP:
+                out.append((None, recv_ts))
+                break
+            out.append((self._copy_out(r, size), recv_ts))
+            r += size
+        self.pos[1] = r
+        self.pos[2] += len(out)
+        return out
+
+    def close(self):
+        self.data.release()
+        del self.pos
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_main(ring_name, capacity, callback, init, worker_id):
+    """Worker process, hands messages from its ring to the handler in order"""
+    ring = ShmRing(capacity, name=ring_name)
+    handler = init(worker_id) if init is not None else callback
+    loop = None
+    idle = 0
+
+    try:
+        while True:
+            batch = ring.read_batch()
+            if not batch:
+                # Spin briefly, then back off to a short sleep
+                idle += 1
+                if idle > 100:
+                    time.sleep(min(0.002, 0.00005 * (idle - 100)))
+                continue
+            idle = 0
+
+            for raw, _ in batch:
+                if raw is None:
+                    return
+                try:
+                    res = handler(json_loads(raw))
+                    if asyncio.iscoroutine(res):
+                        loop = loop or asyncio.new_event_loop()
+                        loop.run_until_complete(res)
+                except Exception as e:
+                    print(f"Error in stream worker {worker_id}:", e)
+    finally:
+        ring.close()
+
+
+def shard_key(topic, key='symbol'):
+    """Routing key of a topic, the symbol part by default so all topics of a symbol share a worker"""
+    if topic is None:
+        return ''
+    if key == 'symbol':
+        return topic.rsplit(':', 1)[-1]
+    return topic
+
+
+class WorkerPool(object):
+    """
+    Runs a stream callback in worker processes. Messages are routed by
+    a stable hash of their symbol (or full topic) to one worker each, so
+    every symbol is handled by one process and in arrival order. Each
+    worker reads its own shared memory ring, the receive side only copies
+    raw bytes in and never parses or pickles.
+
+    The callback (or init(worker_id), which builds a per-worker handler
+    holding its own state) must be picklable. When a ring is full,
+    messages wait in a local backlog, flushed in order ahead of newer ones.
+    Backlogs hold at most max_backlog messages, put_async() then waits
+    for the worker so the stream's bounded queue takes the backpressure.
+    """
+
+    def __init__(self, callback=None, n_workers=2, key='symbol', ring_bytes=1 << 22, init=None,
+                 max_backlog=10000):
+        self.callback = callback
+        self.n_workers = n_workers
+        self.key = key
+        self.ring_bytes = ring_bytes
+        self.init = init
+        self.max_backlog = max_backlog
+        self.rings = []
+        self.procs = []
+        self.backlog = [deque() for _ in range(n_workers)]
+        self.sent = [0] * n_workers
+        self.stalls = [0] * n_workers
+        self._routes = {}
+
+    def start(self):
+        ctx = multiprocessing.get_context()
+        for i in range(self.n_workers):
+            ring = ShmRing(self.ring_bytes)
+            proc = ctx.Process(target=_worker_main, daemon=True,
+                               args=(ring.name, self.ring_bytes, self.callback, self.init, i))
+            proc.start()
+            self.rings.append(ring)
+            self.procs.append(proc)
+        return self
+
+    def route(self, topic):
+        """Worker index of a topic"""
+        worker = self._routes.get(topic)
+        if worker is None:
+            worker = self._routes[topic] = zlib.crc32(shard_key(topic, self.key).encode()) % self.n_workers
+        return worker
+
+    def put(self, topic, raw, recv_ts=0.0):
+        """
+        Hand a raw message to its worker without blocking. False, and
+        the message is not taken, if the worker's backlog is full
+        """
+        i = self.route(topic)
+        if isinstance(raw, str):
+            raw = raw.encode()
+        backlog = self.backlog[i]
+        if backlog:
+            self._flush(i)
+            if len(backlog) >= self.max_backlog:
+                self.stalls[i] += 1
+                return False
+            backlog.append((raw, recv_ts))
+        elif not self.rings[i].write(raw, recv_ts):
+            backlog.append((raw, recv_ts))
+        self.sent[i] += 1
+        return True
+
+    async def put_async(self, topic, raw, recv_ts=0.0):
+        """Hand a raw message to its worker, waiting while its backlog is full"""
+        while not self.put(topic, raw, recv_ts):
+            await asyncio.sleep(0.001)
+
+    def _flush(self, i):
+        ring, backlog = self.rings[i], self.backlog[i]
+        while backlog and ring.write(*backlog[0]):
+            backlog.popleft()
+
+    def flush(self):
+        """Move backlogged messages into rings that have room again"""
+        for i, backlog in enumerate(self.backlog):
+            if backlog:
+                self._flush(i)
+
+    async def drain(self, timeout=None):
+        """Wait until every backlog is in the rings and the workers have read everything"""
+        t0 = time.time()
+        while any(self.backlog) or any(len(ring) for ring in self.rings):
+            self.flush()
+            if timeout is not None and time.time() - t0 > timeout:
+                return False
+            await asyncio.sleep(0.001)
+        return True
+
+    def close(self, timeout=5.0):
+        """Stop workers after they finish what is already queued"""
+        for i, ring in enumerate(self.rings):
+            deadline = time.time() + timeout
+            while (self.backlog[i] or not ring.write(b'', size=STOP)) and time.time() < deadline:
+                self._flush(i)
+                time.sleep(0.001)
+        for proc in self.procs:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.terminate()
+        for ring in self.rings:
+            ring.close()
+        self.rings, self.procs = [], []
+
+    async def aclose(self, timeout=5.0):
+        """close() from the event loop, waits for the workers in an executor"""
+        await asyncio.get_running_loop().run_in_executor(None, self.close, timeout)
+
+    def stats(self):
+        """
+        Per worker messages sent, read and waiting in the backlog, times
+        the backlog was full, and ring fill
+        """
+        return [{'sent': self.sent[i],
+                 'read': int(ring.pos[2]),
+                 'backlog': len(self.backlog[i]),
+                 'stalls': self.stalls[i],
+                 'ring_fill': len(ring) / ring.capacity}
+                for i, ring in enumerate(self.rings)]
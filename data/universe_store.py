@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 21 15:02:26 2026
+
+@author: ymm
+
+Point in time store of daily symbol universe snapshots
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+import settings
+
+
+SNAPSHOT_FIELDS = [
+    'markPrice',
+    'indexPrice',
+    'lastTradePrice',
+    'volumeOf24h',
+    'turnoverOf24h',
+    'volValue',
+    'openInterest',
+    'fundingFeeRate',
+    'multiplier',
+    'lotSize',
+    'tickSize',
+    'maxLeverage',
+]
+SNAPSHOT_DTYPE = np.dtype([('date', '<i8'), ('symbol', '<i4')] + [(f, '<f8') for f in SNAPSHOT_FIELDS])
+
+
+def to_day(date):
+    """Date-like to int days since epoch"""
+    return int(pd.Timestamp(date).normalize().value // 86400000000000)
+
+
+class UniverseStore(object):
+    """
+    Daily snapshots of the symbol universe and its metadata.
+
+    All snapshots live in one structured array sorted by (date, symbol
+    code), with dates as days since epoch, plus a json sidecar mapping
+    symbol codes to symbols and their quote currency. As-of lookups are a
+    binary search on the date column; matrix() lays a field out as a
+    dates x symbols array for vectorized universe selection.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(settings.PROJECT_ROOT, '.cache', 'universe')
+        self.path = path
+        self._arr = None
+        self._meta = None
+
+    def _load(self):
+        if self._arr is None:
+            npy = os.path.join(self.path, 'snapshots.npy')
+            meta = os.path.join(self.path, 'symbols.json')
+            if os.path.exists(npy):
+                self._arr = np.load(npy)
+                with open(meta) as f:
+                    self._meta = json.load(f)
+            else:
+                self._arr = np.empty(0, dtype=SNAPSHOT_DTYPE)
+                self._meta = {'symbols': [], 'quote': []}
+        return self._arr, self._meta
+
+    @property
+    def symbols(self):
+        return self._load()[1]['symbols']
+
+    def dates(self):
+        """Snapshot dates as a DatetimeIndex"""
+        arr, _ = self._load()
+        days = np.unique(arr['date'])
+        return pd.DatetimeIndex(days.astype('datetime64[D]').astype('datetime64[ns]'))
+
+    def write(self, data, date):
+        """
+        Store a symbol snapshot (DataFrame as from futures_get_symbols) as
+        of a date, replacing any earlier snapshot of that day
+        """
+        arr, meta = self._load()
+        day = to_day(date)
+
+        # Extend the symbol dictionary
+        codes = {sym: i for i, sym in enumerate(meta['symbols'])}
+        quotes = data['quoteCurrency'] if 'quoteCurrency' in data else [None] * len(data)
+        for sym, quote in zip(data['symbol'], quotes):
+            if sym not in codes:
+                codes[sym] = len(meta['symbols'])
+                meta['symbols'].append(sym)
+                meta['quote'].append(quote)
+
+        snap = np.zeros(len(data), dtype=SNAPSHOT_DTYPE)
+        snap['date'] = day
+        snap['symbol'] = [codes[sym] for sym in data['symbol']]
+        for f in SNAPSHOT_FIELDS:
+            snap[f] = pd.to_numeric(data[f], errors='coerce') if f in data else np.nan
+
+        arr = np.concatenate([arr[arr['date'] != day], snap])
+        arr = arr[np.lexsort((arr['symbol'], arr['date']))]
+
+        # Atomic replace, readers never see a partial file
+        os.makedirs(self.path, exist_ok=True)
+        npy = os.path.join(self.path, 'snapshots.npy')
+        with open(npy + '.tmp', 'wb') as f:
+            np.save(f, arr)
+        os.replace(npy + '.tmp', npy)
+        with open(os.path.join(self.path, 'symbols.json.tmp'), 'w') as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(self.path, 'symbols.json.tmp'), os.path.join(self.path, 'symbols.json'))
+
+        self._arr, self._meta = arr, meta
+
+    def _frame(self, rows):
+        """Snapshot rows to a DataFrame in futures_get_symbols format"""
+        _, meta = self._load()
+        symbols = np.asarray(meta['symbols'], dtype=object)
+        quote = np.asarray(meta['quote'], dtype=object)
+        df = pd.DataFrame({f: rows[f] for f in SNAPSHOT_FIELDS})
+        df.insert(0, 'quoteCurrency', quote[rows['symbol']])
+        df.insert(0, 'symbol', symbols[rows['symbol']])
+        df.insert(0, 'date', rows['date'].astype('datetime64[D]').astype('datetime64[ns]'))
+        return df
+
+    def asof(self, date):
+        """Latest snapshot on or before date, None if there is none"""
+        arr, _ = self._load()
+        day = to_day(date)
+        i = np.searchsorted(arr['date'], day, side='right')
+        if i == 0:
+            return None
+        d = arr['date'][i - 1]
+        i0 = np.searchsorted(arr['date'], d, side='left')
+        return self._frame(arr[i0:i])
+
+    def read(self, start=None, end=None):
+        """All snapshots with dates in [start, end], in long format"""
+        arr, _ = self._load()
+        i0 = 0 if start is None else np.searchsorted(arr['date'], to_day(start), side='left')
+        i1 = len(arr) if end is None else np.searchsorted(arr['date'], to_day(end), side='right')
+        return self._frame(arr[i0:i1])
+
+    def matrix(self, fields, start=None, end=None, quote=None):
+        """
+        Fields laid out as dense dates x symbols arrays, NaN where a symbol
+        is not listed. Dates are every calendar day in [start, end], each
+        taking its as-of snapshot. Returns (dates, symbols, {field: array})
+        """
+        arr, meta = self._load()
+        if len(arr) == 0:
+            raise ValueError("Universe store is empty")
+
+        snap_days = np.unique(arr['date'])
+        first = snap_days[0] if start is None else to_day(start)
+        last = snap_days[-1] if end is None else to_day(end)
+        days = np.arange(first, last + 1)
+
+        # Each day reads the latest snapshot on or before it
+        snap_i = np.searchsorted(snap_days, days, side='right') - 1
+        rows = arr[(arr['date'] >= snap_days[max(snap_i[0], 0)]) & (arr['date'] <= last)]
+
+        codes = np.unique(rows['symbol'])
+        if quote is not None:
+            quotes = np.asarray(meta['quote'], dtype=object)[codes]
+            codes = codes[np.isin(quotes, quote)]
+            rows = rows[np.isin(rows['symbol'], codes)]
+
+        # Scatter snapshots into (snapshot, symbol), then expand to days
+        snap_row = np.searchsorted(snap_days, rows['date'])
+        col = np.searchsorted(codes, rows['symbol'])
+        out = {}
+        for f in fields:
+            dense = np.full((len(snap_days), len(codes)), np.nan)
+            dense[snap_row, col] = rows[f]
+            out[f] = np.where((snap_i >= 0)[:, np.newaxis], dense[np.maximum(snap_i, 0)], np.nan)
+
+        dates = pd.DatetimeIndex(days.astype('datetime64[D]').astype('datetime64[ns]'))
+        symbols = [meta['symbols'][c] for c in codes]
+        return dates, symbols, out
@@ -3,7 +3,88 @@ Created on Wed Apr 23 17:46:08 2025
 
 @author: ymm
 """
+import os
+import math
 import importlib
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from data.panel import Panel
+from data.profiler import Profiler, stage, n_rows
+from data.resample import freq_minutes
+from model.normalize import Normalizer
+from model.simulate import Simulator
+
+
+def load_input(input_name, content, start, end):
+    """Instantiate the data class of one data map entry and load it"""
+    
+    # Load data class module
+    module = content['module']
+    module = importlib.import_module(module)
+    data_cls = getattr(module, input_name)
+    
+    # Instantiate data class
+    params = content['params']
+    data_loader = data_cls(params)
+    
+    # Load data
+    with stage(input_name) as info:
+        data = data_loader.load(start, end)
+        info['rows'] = n_rows(data)
+    return data
+
+
+def extend_lookback(data_map, bars):
+    """
+    Data map with lookback raised to at least bars on the entries that
+    take one, e.g. for the normalizer's warm-up
+    """
+    out = {}
+    for input_name, content in data_map.items():
+        params = content['params']
+        if bars and 'lookback' in params and params['lookback'] < bars:
+            content = dict(content, params=dict(params, lookback=bars))
+        out[input_name] = content
+    return out
+
+
+# Data map inputs whose bars can be resampled from a finer base_freq
+RESAMPLED_INPUTS = ('KucoinFuturesKlinesData',)
+
+
+def share_base_freq(data_maps):
+    """
+    Copies of data maps where resampled inputs that only differ by freq
+    (and lookback) take one base_freq, the largest that divides all their
+    freqs, so every freq is resampled from a single download
+    """
+    data_maps = [{name: dict(content, params=dict(content['params'])) for name, content in data_map.items()}
+                 for data_map in data_maps]
+
+    groups = {}
+    for data_map in data_maps:
+        for input_name, content in data_map.items():
+            if input_name in RESAMPLED_INPUTS and 'freq' in content['params']:
+                key = BatchModelEvalEngine._data_key(input_name, content, ignore=('lookback', 'freq', 'base_freq'))
+                groups.setdefault(key, []).append(content['params'])
+
+    for entries in groups.values():
+        freqs = {freq_minutes(p[k]) for p in entries for k in ('freq', 'base_freq') if p.get(k) is not None}
+        if len(freqs) > 1:
+            base = math.gcd(*freqs)
+            for p in entries:
+                p['base_freq'] = base
+
+    return data_maps
+
+
+def first_panel(data):
+    """First Panel among loaded data, None if there is none"""
+    for value in data.values():
+        if isinstance(value, Panel):
+            return value
+    return None
+
 
 class ModelEvalEngine(object):
     
@@ -11,30 +92,80 @@ class ModelEvalEngine(object):
         
         self.model_type = params.get('model_type', 'TS')
         self.model = params.get('model', None)
+        self.dates = params.get('dates', None)
+        
+        # Normalization steps, e.g. ['winsorize', 'zscore']
+        self.normalizer = params.get('normalize', None)
+        if self.normalizer is not None and not isinstance(self.normalizer, Normalizer):
+            self.normalizer = Normalizer(self.normalizer)
+        
+        # Chunked eval, e.g. '30D': load and evaluate one time window at a
+        # time. output is None (return all), a callable taking each chunk,
+        # or a directory to write chunk files to
+        self.chunk = params.get('chunk', None)
+        self.output = params.get('output', None)
+        
+        # Portfolio simulation of the final signals against the close
+        # panel, Simulator params or a Simulator. Results are kept in
+        # self.simulation, see Simulator.run
+        self.simulator = params.get('simulate', None)
+        if self.simulator is not None and not isinstance(self.simulator, Simulator):
+            self.simulator = Simulator(self.simulator)
+        if self.simulator is not None and self.chunk is not None:
+            raise ValueError("Simulation needs the whole run, it is not supported with chunk")
+        self.simulation = None
+        
+        # Profiling, True for stage timing, or 'cprofile' and/or
+        # 'tracemalloc' (a list for both). run() then returns
+        # (results, report), see data.profiler
+        self.profile = params.get('profile', False)
+        self.profile_label = params.get('profile_label', None)
+        self.profile_dir = params.get('profile_dir', None)
+        self.report = None
     
     def load_data(self, start, end):
         """
         Load data as specified by model's data map
         """
         data_map = self.model.load_data_map()
+        if self.normalizer is not None:
+            data_map = extend_lookback(data_map, self.normalizer.lookback())
         
         data = {}
-        for input_name, content in data_map.items():
-            
-            # Load data class module
-            module = content['module']
-            module = importlib.import_module(module)
-            data_cls = getattr(module, input_name)
-            
-            # Instantiate data class
-            params = content['params']
-            data_loader = data_cls(params)
-            
-            # Load data
-            data[input_name] = data_loader.load(start, end)
+        with stage('load') as info:
+            for input_name, content in data_map.items():
+                data[input_name] = load_input(input_name, content, start, end)
+            info['rows'] = n_rows(data)
         
         return data
     
+    def eval_dates(self, start, end, data):
+        """
+        Dates for cross-sectional eval, explicit dates if given, otherwise
+        every bar in [start, end] of the first panel in data
+        """
+        if self.dates is not None:
+            dates = pd.DatetimeIndex(self.dates)
+            return dates[(dates >= start) & (dates <= end)]
+        
+        panel = first_panel(data)
+        if panel is None:
+            raise ValueError("No eval dates given and no panel data to take them from")
+        
+        return pd.DatetimeIndex(panel.loc(start, end).timestamps)
+    
+    def cs_eval(self, dates, data):
+        """
+        Cross-sectional signals on each date, T x N. Models with
+        cs_eval_dates evaluate all dates in one call, otherwise cs_eval
+        is called per date
+        """
+        if hasattr(self.model, 'cs_eval_dates'):
+            return self.model.cs_eval_dates(dates, data)
+        
+        results = [self.model.cs_eval(date, data) for date in dates]
+        return pd.DataFrame(results, index=pd.DatetimeIndex(dates, name='timestamp'))
+    
     
     def run(self, start, end, data=None):
         """
@@ -43,20 +174,257 @@ class ModelEvalEngine(object):
         Steps
             - Load data based on model's specified data map
             - Run model eval, generate raw signals
-            - TODO: normalize signals
-        """      
+            - Normalize signals, if normalization steps are given
+            - Simulate the portfolio, if simulation params are given
+              (kept in self.simulation)
+        
+        With profile set, returns (results, report), the report having
+        wall and CPU time, rows and peak memory per stage
+        """
+        if not self.profile:
+            return self._run(start, end, data)
+        
+        with Profiler(self.profile, label=self.profile_label, profile_dir=self.profile_dir) as prof:
+            results = self._run(start, end, data)
+        self.report = prof.report()
+        return results, self.report
+    
+    def _run(self, start, end, data=None):
+        if self.chunk is not None and not data:
+            return self.run_chunked(start, end)
+        
         # Get data
         if not data:
             data = self.load_data(start=start, end=end)
         
         # Eval signal (raw scores)
-        if self.model_type == 'TS':
-            results = self.model.ts_eval(start, end, data)
-        else:
-            results = self.model.cs_eval(start, end, data)
+        with stage('eval') as info:
+            if self.model_type == 'TS':
+                results = self.model.ts_eval(start, end, data)
+            else:
+                results = self.cs_eval(self.eval_dates(start, end, data), data)
+            info['rows'] = len(results)
             
         # Normalize signals
-        pass
+        if self.normalizer is not None:
+            with stage('normalize', rows=len(results)):
+                results = self.normalizer.transform(results, panel=first_panel(data))
+        
+        # Simulate positions and returns
+        if self.simulator is not None:
+            panel = first_panel(data)
+            if panel is None:
+                raise ValueError("Simulation needs close prices from panel data")
+            with stage('simulate', rows=len(results)):
+                self.simulation = self.simulator.run(results, panel)
         
         return results
-  
\ No newline at end of file
+    
+    def chunks(self, start, end):
+        """Split [start, end] into consecutive non-overlapping windows"""
+        step = pd.Timedelta(self.chunk)
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        
+        bounds = []
+        while start <= end:
+            bounds.append((start, min(start + step - pd.Timedelta(1, 'ns'), end)))
+            start = start + step
+        return bounds
+    
+    def run_chunked(self, start, end):
+        """
+        Run model eval one chunk at a time. Each chunk loads its own data,
+        with the data map's lookback as overlap, and the model's rolling
+        state (ts_eval_chunk) and normalization state carry over, so the
+        result equals run() over the whole range while only one chunk of
+        data is held. Models without ts_eval_chunk are evaluated with
+        ts_eval per chunk, which is exact if they only look back as far
+        as their data map's lookback.
+        
+        Returns the concatenated signals when output is None, the chunk
+        file names when output is a directory, otherwise None.
+        """
+        if isinstance(self.output, str):
+            os.makedirs(self.output, exist_ok=True)
+        
+        collected = []
+        model_state = norm_state = None
+        for i, (c_start, c_end) in enumerate(self.chunks(start, end)):
+            data = self.load_data(start=c_start, end=c_end)
+            
+            with stage('eval') as info:
+                if self.model_type != 'TS':
+                    results = self.cs_eval(self.eval_dates(c_start, c_end, data), data)
+                elif hasattr(self.model, 'ts_eval_chunk'):
+                    results, model_state = self.model.ts_eval_chunk(c_start, c_end, data, model_state)
+                else:
+                    results = self.model.ts_eval(c_start, c_end, data)
+                info['rows'] = len(results)
+            
+            if self.normalizer is not None:
+                with stage('normalize', rows=len(results)):
+                    results, norm_state = self.normalizer.transform_chunk(results, first_panel(data), norm_state, c_end)
+            del data
+            
+            # Emit the chunk
+            with stage('output', rows=len(results)):
+                if self.output is None:
+                    collected.append(results)
+                elif callable(self.output):
+                    self.output(results)
+                else:
+                    fname = os.path.join(self.output, f"chunk_{i:05d}.pkl")
+                    results.to_pickle(fname)
+                    collected.append(fname)
+        
+        if self.output is None:
+            return pd.concat(collected) if collected else pd.DataFrame()
+        return collected if isinstance(self.output, str) else None
+
+
+def read_chunks(path):
+    """Concatenate the chunk files written by a chunked run"""
+    files = sorted(f for f in os.listdir(path) if f.startswith('chunk_') and f.endswith('.pkl'))
+    return pd.concat([pd.read_pickle(os.path.join(path, f)) for f in files])
+
+
+# Data attached in each batch worker process, {dataset key: data}
+_worker_data = {}
+_worker_shm = []
+
+
+def _init_worker(shared):
+    """Attach shared memory datasets once per worker process"""
+    for key, (kind, payload) in shared.items():
+        if kind == 'shm':
+            panel, shm = Panel.from_shared(payload)
+            _worker_data[key] = panel
+            _worker_shm.append(shm)
+        elif kind == 'mmap':
+            _worker_data[key] = Panel.open(payload)
+        else:
+            _worker_data[key] = payload
+
+
+def _eval_worker(eval_params, inputs, start, end):
+    """Evaluate one model in a worker on the attached datasets"""
+    data = {input_name: _worker_data[key] for input_name, key in inputs.items()}
+    return ModelEvalEngine(eval_params).run(start, end, data)
+
+
+class BatchModelEvalEngine(object):
+    """
+    Evaluate many models over shared data.
+
+    Data map entries that only differ by lookback are merged and loaded
+    once with the largest lookback, models only see their eval window so
+    results are identical to running each model on its own. Klines at
+    different freqs are resampled from one shared base freq. Models are
+    then evaluated across a process pool; panels are placed in shared
+    memory and attached by the workers rather than pickled to each task.
+    With panel_dir set, panels are written there instead and memory
+    mapped by the workers, which also lets other processes reuse them.
+    """
+
+    def __init__(self, params):
+
+        self.model_type = params.get('model_type', 'TS')
+        self.models = params.get('models', [])
+        self.dates = params.get('dates', None)
+        self.normalize = params.get('normalize', None)
+        self.max_workers = params.get('max_workers', os.cpu_count())
+        self.panel_dir = params.get('panel_dir', None)
+
+    @staticmethod
+    def _data_key(input_name, content, ignore=('lookback',)):
+        """Hashable key of a data map entry, ignoring lookback"""
+        params = tuple(sorted(
+            (k, tuple(v) if isinstance(v, list) else v)
+            for k, v in content['params'].items() if k not in ignore
+        ))
+        return (input_name, content['module'], params)
+
+    def plan(self):
+        """
+        Deduplicate data maps across models. Returns the unique data map
+        entries {key: (input_name, content)} and, per model, the mapping
+        {input_name: key}
+        """
+        normalizer = self.normalize
+        if normalizer is not None and not isinstance(normalizer, Normalizer):
+            normalizer = Normalizer(normalizer)
+        warmup = normalizer.lookback() if normalizer is not None else 0
+
+        # Models at mixed freqs share one base freq download
+        data_maps = share_base_freq([extend_lookback(model.load_data_map(), warmup) for model in self.models])
+
+        datasets = {}
+        model_inputs = []
+        for data_map in data_maps:
+            inputs = {}
+            for input_name, content in data_map.items():
+                key = self._data_key(input_name, content)
+                if key not in datasets:
+                    datasets[key] = (input_name, {'module': content['module'],
+                                                  'params': dict(content['params'])})
+                else:
+                    merged = datasets[key][1]['params']
+                    if 'lookback' in content['params']:
+                        merged['lookback'] = max(merged.get('lookback', 0), content['params']['lookback'])
+                inputs[input_name] = key
+            model_inputs.append(inputs)
+
+        return datasets, model_inputs
+
+    def load_data(self, start, end):
+        """Load each unique dataset once"""
+        datasets, model_inputs = self.plan()
+        print(f"Loading {len(datasets)} unique dataset(s) for {len(self.models)} models")
+
+        data = {}
+        for key, (input_name, content) in datasets.items():
+            data[key] = load_input(input_name, content, start, end)
+
+        return data, model_inputs
+
+    def run(self, start, end):
+        """Run model eval for all models, returns results in model order"""
+        data, model_inputs = self.load_data(start, end)
+        eval_params = [{'model_type': self.model_type, 'model': model,
+                        'dates': self.dates, 'normalize': self.normalize}
+                       for model in self.models]
+
+        # Small batches are not worth the pool start up
+        if self.max_workers is None or self.max_workers <= 1 or len(self.models) <= 1:
+            results = []
+            for params, inputs in zip(eval_params, model_inputs):
+                data_ = {input_name: data[key] for input_name, key in inputs.items()}
+                results.append(ModelEvalEngine(params).run(start, end, data_))
+            return results
+
+        # Put panels in shared memory, anything else is pickled once per worker
+        blocks = []
+        shared = {}
+        for i, (key, value) in enumerate(data.items()):
+            if isinstance(value, Panel) and self.panel_dir is not None:
+                shared[key] = ('mmap', value.save(os.path.join(self.panel_dir, str(i))))
+            elif isinstance(value, Panel):
+                shm, descriptor = value.to_shared()
+                blocks.append(shm)
+                shared[key] = ('shm', descriptor)
+            else:
+                shared[key] = ('pickle', value)
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.max_workers,
+                                     initializer=_init_worker,
+                                     initargs=(shared,)) as pool:
+                futures = [pool.submit(_eval_worker, params, inputs, start, end)
+                           for params, inputs in zip(eval_params, model_inputs)]
+                results = [f.result() for f in futures]
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+        return results
@@ -6,10 +6,193 @@ Created on Wed Apr 23 21:28:47 2025
 @author: ymm
 """
 from model.base_model import Model
+from data.panel import Panel
+from data.resample import freq_minutes
+import math
+import bisect
+from collections import deque
 import numpy as np
 import pandas as pd
 
 
+def log_returns(close):
+    """Log returns along the time axis of a T x N price array"""
+    out = np.full(close.shape, np.nan)
+    out[1:] = np.log(close[1:] / close[:-1])
+    return out
+
+
+def rolling_sums(x, windows, rows=None, origin=None):
+    """
+    Rolling sums along the time axis of a T x N array for many windows in
+    one pass, NaN unless the whole window is valid (pandas min_periods).
+    Returns a (len(windows), len(rows), N) array.
+    
+    Sums are read off cumulative sums anchored at `origin` (default the
+    first row evaluated): forward over [origin, t] and backward over the
+    lookback part before origin. The result therefore does not depend on
+    how much extra history x holds, nor on the set of windows.
+    """
+    windows = np.asarray(windows, dtype=int)
+    rows = np.arange(len(x)) if rows is None else np.asarray(rows)
+    if len(rows) == 0:
+        return np.empty((len(windows), 0) + x.shape[1:])
+    origin = rows[0] if origin is None else origin
+    
+    valid = np.isfinite(x)
+    xz = np.where(valid, x, 0.0)
+    pad = np.zeros((1,) + x.shape[1:])
+    cs_f = np.concatenate([pad, np.cumsum(xz[origin:], axis=0)])
+    cnt_f = np.concatenate([pad, np.cumsum(valid[origin:], axis=0)])
+    cs_b = np.concatenate([pad, np.cumsum(xz[:origin][::-1], axis=0)])
+    cnt_b = np.concatenate([pad, np.cumsum(valid[:origin][::-1], axis=0)])
+    
+    return window_sums(cs_f, cnt_f, cs_b, cnt_b, rows - origin, windows, origin)
+
+
+def window_sums(cs_f, cnt_f, cs_b, cnt_b, pos, windows, n_before, offset=0):
+    """
+    Window sums read off anchored cumulative sums, see rolling_sums().
+    pos are row positions after the origin, cs_f[k] holds the forward
+    sum up to position k + offset (k = 0 is the empty sum when offset
+    is 0), cs_b[k] the sum of the k rows before the origin, of which
+    there are n_before.
+    """
+    windows = np.asarray(windows, dtype=int)
+    
+    # Window [a, t] is fwd[t] - fwd[a] if a >= origin, else fwd[t] + bwd[a]
+    hi = pos + 1 - offset
+    lo = pos[np.newaxis, :] - windows[:, np.newaxis] + 1
+    ok = lo >= -n_before
+    fwd = lo >= 0
+    i_f = np.where(fwd, lo - offset, 0)
+    i_b = np.where(fwd | ~ok, 0, -lo)
+    
+    sign = np.where(fwd, -1.0, 1.0)[:, :, np.newaxis]
+    part = np.where(fwd[:, :, np.newaxis], cs_f[i_f], cs_b[i_b])
+    part_cnt = np.where(fwd[:, :, np.newaxis], -cnt_f[i_f], cnt_b[i_b])
+    
+    full = (cnt_f[hi][np.newaxis] + part_cnt) == windows[:, np.newaxis, np.newaxis]
+    full &= ok[:, :, np.newaxis]
+    return np.where(full, cs_f[hi][np.newaxis] + sign * part, np.nan)
+
+
+class MomentumState(object):
+    """
+    Incremental momentum state. Keeps per symbol the running sum and
+    count of valid log returns over the rows of the panel the batch path
+    would build, plus a ring of their last `lookback` + 1 values, so each
+    new bar updates the signal in O(1). The signal is the difference of
+    two running sums, the same arithmetic as Momentum.ts_eval, so it is
+    bit-identical to ts_eval over the warm-up panel plus the streamed bars.
+    
+    Bars must arrive in timestamp order across symbols, as BarBuilder
+    emits them. A timestamp seen for any symbol is a panel row: symbols
+    without a bar there get a NaN return, as in the batch panel, while a
+    timestamp no symbol has is no row at all and the next return spans
+    the gap.
+    """
+    
+    def __init__(self, symbols, lookback, freq):
+        self.symbols = list(symbols)
+        self.lookback = lookback
+        self.freq_ms = freq_minutes(freq) * 60 * 1000
+        self.sym_idx = {sym: j for j, sym in enumerate(self.symbols)}
+        
+        # Plain python lists are faster than numpy for scalar updates
+        N = len(self.symbols)
+        self.cs = [[0.0] * (lookback + 1) for _ in range(N)]
+        self.cnt = [[0] * (lookback + 1) for _ in range(N)]
+        self.pos = [0] * N   # ring slot of the latest sums
+        self.last_close = [math.nan] * N
+        self.last_ts = [None] * N
+        self.signal = [math.nan] * N
+        
+        # Recent panel row timestamps, enough to count rows a symbol missed
+        self.rows = deque(maxlen=lookback + 1)
+        
+    def warmup(self, panel: Panel):
+        """Seed state from a historical panel, its first row being the first of the run"""
+        L = self.lookback
+        cols = [panel.sym_idx[sym] for sym in self.symbols]
+        close = panel['close'][:, cols]
+        rets = log_returns(close)
+        valid = np.isfinite(rets)
+        pad = np.zeros((1, len(cols)))
+        cs = np.concatenate([pad, np.cumsum(np.where(valid, rets, 0.0), axis=0)])[-(L + 1):]
+        cnt = np.concatenate([pad, np.cumsum(valid, axis=0)])[-(L + 1):].astype(int)
+        ts = panel.timestamps.astype('datetime64[ms]').astype('int64')
+        
+        self.rows.clear()
+        self.rows.extend(int(t) for t in ts[-(L + 1):])
+        for j in range(len(self.symbols)):
+            # Ring slots before the panel start keep the empty sum
+            n = len(cs)
+            self.cs[j] = [0.0] * (L + 1 - n) + cs[:, j].tolist()
+            self.cnt[j] = [0] * (L + 1 - n) + cnt[:, j].tolist()
+            self.pos[j] = L
+            self.last_close[j] = float(close[-1, j]) if len(close) else math.nan
+            self.last_ts[j] = self.rows[-1] if self.rows else None
+            self._signal(j)
+        
+    def _push(self, j, r):
+        """Add one row's log return (NaN if missing) to symbol j's sums"""
+        cs, cnt, pos = self.cs[j], self.cnt[j], self.pos[j]
+        nxt = pos + 1 if pos < self.lookback else 0
+        if r == r:
+            cs[nxt] = cs[pos] + r
+            cnt[nxt] = cnt[pos] + 1
+        else:
+            cs[nxt] = cs[pos]
+            cnt[nxt] = cnt[pos]
+        self.pos[j] = nxt
+        
+    def _signal(self, j):
+        """Sum over the last lookback rows, NaN unless all are valid"""
+        new, old = self.pos[j], self.pos[j] + 1 if self.pos[j] < self.lookback else 0
+        if self.cnt[j][new] - self.cnt[j][old] == self.lookback:
+            self.signal[j] = self.cs[j][new] - self.cs[j][old]
+        else:
+            self.signal[j] = math.nan
+        return self.signal[j]
+        
+    def update(self, sym, close, timestamp=None):
+        """Update state with a closed bar, returns the new signal for sym"""
+        j = self.sym_idx[sym]
+        close = float(close)
+        
+        if timestamp is not None:
+            last = self.last_ts[j]
+            if last is not None and timestamp <= last:
+                return self.signal[j]
+            if not self.rows or timestamp > self.rows[-1]:
+                self.rows.append(timestamp)
+            
+            # Rows other symbols had since this symbol's last bar are NaN
+            # returns here, and so is the return after them
+            if last is not None:
+                skipped = len(self.rows) - 1 - bisect.bisect_right(self.rows, last)
+                if last < self.rows[0]:
+                    skipped = self.lookback + 1
+                for _ in range(min(skipped, self.lookback + 1)):
+                    self._push(j, math.nan)
+                if skipped > 0:
+                    self.last_close[j] = math.nan
+            self.last_ts[j] = timestamp
+        
+        # np.log, not math.log, to round like the batch path
+        prev = self.last_close[j]
+        r = float(np.log(close / prev)) if prev == prev and close == close else math.nan
+        self._push(j, r)
+        self.last_close[j] = close
+        
+        return self._signal(j)
+    
+    def signals(self):
+        """Current signal for every symbol"""
+        return pd.Series(self.signal, index=pd.Index(self.symbols, name='symbol'))
+
+
 class Momentum(Model):
     """Toy momentum model"""
     
@@ -17,6 +200,9 @@ class Momentum(Model):
         self.symbols = params['symbols']
         self.freq = params['freq']
         self.lookback = params['lookback']
+        # Finer freq to download and resample from, shared across models
+        self.base_freq = params.get('base_freq', None)
+        self.state = None
         
     def load_data_map(self):
         """
@@ -33,34 +219,188 @@ class Momentum(Model):
                     'symbols': self.symbols,
                     'freq': self.freq,
                     'lookback': self.lookback,
+                    'as_panel': True,
                     }
                 }
             }
+        if self.base_freq is not None:
+            data_map['KucoinFuturesKlinesData']['params']['base_freq'] = self.base_freq
         
         return data_map
         
     def cs_eval(self, date, data):
         """Evaludate model on a point in time date"""
-        pass
+        
+        # Locate data as of date, no look-ahead
+        klines = data['KucoinFuturesKlinesData']
+        if not isinstance(klines, Panel):
+            klines = Panel.from_frames(klines)
+        mom = self._cs_row(klines['close'], klines.asof_index(date))
+        
+        return pd.Series(mom, index=pd.Index(klines.symbols, name='symbol'))
+    
+    def cs_eval_dates(self, dates, data):
+        """
+        cs_eval over many dates, one row per date. The panel is built and
+        the as-of rows located once, each date then only reads its slice
+        of the close array
+        """
+        klines = data['KucoinFuturesKlinesData']
+        if not isinstance(klines, Panel):
+            klines = Panel.from_frames(klines)
+        
+        dates = pd.DatetimeIndex(dates, name='timestamp')
+        rows = np.searchsorted(klines.timestamps, dates.values.astype('datetime64[ns]'), side='right') - 1
+        close = klines['close']
+        mom = np.empty((len(rows), len(klines.symbols)))
+        for k, i in enumerate(rows):
+            mom[k] = self._cs_row(close, i)
+        
+        return pd.DataFrame(mom, index=dates, columns=pd.Index(klines.symbols, name='symbol'))
+    
+    def _cs_row(self, close, i):
+        """Sum of the lookback log returns up to row i, NaN if any is missing"""
+        L = self.lookback
+        if i < L:
+            return np.full(close.shape[1], np.nan)
+        return np.log(close[i - L + 1:i + 1] / close[i - L:i]).sum(axis=0)
 
     def ts_eval(self, start, end, data):
         """Evaludate model on a time series"""
         
         # Locate data
         klines = data['KucoinFuturesKlinesData']
-        df = pd.concat(list(klines.values()), axis=0)
-        
-        eval_dt = df['timestamp']
-        eval_dt = eval_dt[(eval_dt >= start) & (eval_dt <= end)].copy()
-        
-        # Pivot to T X N matrix
-        df_pivot = df.pivot_table(index='timestamp', values='close', columns='symbol')
+        if not isinstance(klines, Panel):
+            klines = Panel.from_frames(klines)
         
         # Use log return
-        df_pivot = df_pivot.apply(lambda x: np.log(x / x.shift(1)))
+        log_ret = log_returns(klines['close'])
         
-        # Calculate rolling momentum
-        df_out = df_pivot.rolling(window=self.lookback, min_periods=self.lookback).sum()
+        # Calculate rolling momentum over the eval window, lookback rows
+        # before it are only warm-up
+        eval_dt = klines.timestamps
+        rows = np.flatnonzero((eval_dt >= np.datetime64(start, 'ns')) & (eval_dt <= np.datetime64(end, 'ns')))
+        mom = rolling_sums(log_ret, [self.lookback], rows)[0]
+        
+        df_out = pd.DataFrame(mom,
+                              index=pd.DatetimeIndex(eval_dt[rows], name='timestamp'),
+                              columns=pd.Index(klines.symbols, name='symbol'))
         
         return df_out
- 
\ No newline at end of file
+    
+    def ts_eval_chunk(self, start, end, data, state=None):
+        """
+        Evaluate one time chunk of a longer ts run. The forward cumulative
+        sums (last lookback rows), the sums before the run's first row and
+        the last close are carried over in `state`, so chunks chained from
+        state=None give results bit-identical to one ts_eval over the whole
+        range while only holding one chunk of history.
+        
+        Returns (signals, state)
+        """
+        klines = data['KucoinFuturesKlinesData']
+        if not isinstance(klines, Panel):
+            klines = Panel.from_frames(klines)
+        
+        L = self.lookback
+        eval_dt = klines.timestamps
+        close = klines['close']
+        in_window = (eval_dt >= np.datetime64(start, 'ns')) & (eval_dt <= np.datetime64(end, 'ns'))
+        
+        # First chunk with rows, anchor the sums like ts_eval does
+        if state is None:
+            rows = np.flatnonzero(in_window)
+            if len(rows) == 0:
+                return self._chunk_frame(klines, rows, np.empty((0, len(klines.symbols)))), None
+            
+            origin = rows[0]
+            log_ret = log_returns(close)
+            valid = np.isfinite(log_ret)
+            xz = np.where(valid, log_ret, 0.0)
+            pad = np.zeros((1, len(klines.symbols)))
+            cs_f = np.concatenate([pad, np.cumsum(xz[origin:rows[-1] + 1], axis=0)])
+            cnt_f = np.concatenate([pad, np.cumsum(valid[origin:rows[-1] + 1], axis=0)])
+            cs_b = np.concatenate([pad, np.cumsum(xz[:origin][::-1][:L], axis=0)])
+            cnt_b = np.concatenate([pad, np.cumsum(valid[:origin][::-1][:L], axis=0)])
+            
+            mom = window_sums(cs_f, cnt_f, cs_b, cnt_b, rows - origin, [L], origin)[0]
+            state = {'cs_b': cs_b, 'cnt_b': cnt_b, 'n_before': origin, 'n': len(rows), 'offset': 0}
+        
+        # Later chunks continue the forward sums from the carried tail
+        else:
+            rows = np.flatnonzero(in_window & (eval_dt > state['last_ts']))
+            prev = np.concatenate([state['last_close'][np.newaxis], close[rows[:-1]]]) if len(rows) else close[rows]
+            log_ret = np.log(close[rows] / prev).astype(float)
+            valid = np.isfinite(log_ret)
+            xz = np.where(valid, log_ret, 0.0)
+            cs_f = np.concatenate([state['cs_f'], np.cumsum(np.concatenate([state['cs_f'][-1:], xz]), axis=0)[1:]])
+            cnt_f = np.concatenate([state['cnt_f'], np.cumsum(np.concatenate([state['cnt_f'][-1:], valid]), axis=0)[1:]])
+            
+            pos = state['n'] + np.arange(len(rows))
+            mom = window_sums(cs_f, cnt_f, state['cs_b'], state['cnt_b'], pos, [L], state['n_before'], state['offset'])[0]
+            state = dict(state, n=state['n'] + len(rows))
+        
+        # Keep the last lookback rows of the forward sums
+        keep = min(len(cs_f), L + 1)
+        if len(rows):
+            state.update(cs_f=cs_f[-keep:], cnt_f=cnt_f[-keep:], offset=state['n'] + 1 - keep,
+                         last_close=close[rows[-1]].copy(), last_ts=eval_dt[rows[-1]])
+        
+        return self._chunk_frame(klines, rows, mom), state
+    
+    @staticmethod
+    def _chunk_frame(klines, rows, mom):
+        return pd.DataFrame(mom,
+                            index=pd.DatetimeIndex(klines.timestamps[rows], name='timestamp'),
+                            columns=pd.Index(klines.symbols, name='symbol'))
+    
+    def sweep(self, start, end, data, lookbacks, as_frame=False):
+        """
+        Evaluate momentum for many lookbacks at once. Log returns are
+        computed once and every lookback is read off one cumulative sum.
+        
+        Data must cover the largest lookback. Returns a (lookback x T x N)
+        array, or a DataFrame indexed by (lookback, timestamp) if as_frame.
+        """
+        klines = data['KucoinFuturesKlinesData']
+        if not isinstance(klines, Panel):
+            klines = Panel.from_frames(klines)
+        
+        log_ret = log_returns(klines['close'])
+        
+        # Only evaluate rows in the eval window
+        eval_dt = klines.timestamps
+        rows = np.flatnonzero((eval_dt >= np.datetime64(start, 'ns')) & (eval_dt <= np.datetime64(end, 'ns')))
+        out = rolling_sums(log_ret, lookbacks, rows)
+        
+        if not as_frame:
+            return out
+        
+        index = pd.MultiIndex.from_product([list(lookbacks), eval_dt[rows]], names=['lookback', 'timestamp'])
+        return pd.DataFrame(out.reshape(-1, out.shape[-1]),
+                            index=index,
+                            columns=pd.Index(klines.symbols, name='symbol'))
+    
+    def init_online(self, data=None):
+        """
+        Set up incremental evaluation, optionally warmed up from
+        historical data so the first live bars already have signals
+        """
+        self.state = MomentumState(self.symbols, self.lookback, self.freq)
+        
+        if data is not None:
+            klines = data['KucoinFuturesKlinesData']
+            if not isinstance(klines, Panel):
+                klines = Panel.from_frames(klines)
+            self.state.warmup(klines)
+            
+        return self.state
+    
+    def on_bar(self, bar):
+        """
+        Evaluate model on one closed bar, e.g. from a streaming bar
+        builder. Bar is a dict with symbol, timestamp (ms) and close.
+        """
+        if self.state is None:
+            self.init_online()
+        return self.state.update(bar['symbol'], bar['close'], bar.get('timestamp'))
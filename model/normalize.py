@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 19 10:05:33 2026
+
+@author: ymm
+
+Cross-sectional signal normalization over T x N signal matrices
+"""
+import numpy as np
+import pandas as pd
+from data.panel import Panel
+from model.momentum import log_returns
+
+
+def zscore(x, ddof=1):
+    """Cross-sectional z-score per row, NaN-aware"""
+    # Row sums are summed in a different order for F-ordered input, fix
+    # the layout so results do not depend on how x was built
+    x = np.ascontiguousarray(x, dtype=float)
+    valid = np.isfinite(x)
+    cnt = valid.sum(axis=1, keepdims=True)
+    xz = np.where(valid, x, 0.0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = xz.sum(axis=1, keepdims=True) / cnt
+        dev = np.where(valid, x - mean, 0.0)
+        std = np.sqrt((dev ** 2).sum(axis=1, keepdims=True) / (cnt - ddof))
+        out = (x - mean) / std
+
+    return np.where(valid & (std > 0), out, np.nan)
+
+
+def rank(x, pct=True):
+    """
+    Cross-sectional rank per row with average ties, NaN-aware. Same as
+    pandas rank(axis=1, pct=pct) but without per-row work
+    """
+    T, N = x.shape
+    valid = np.isfinite(x)
+
+    # NaNs sort last, so valid values take positions [0, cnt)
+    order = np.argsort(x, axis=1, kind='stable')
+    s = np.take_along_axis(x, order, axis=1)
+    pos = np.broadcast_to(np.arange(N), (T, N))
+
+    # Tie groups: first and last position of each run of equal values
+    new_group = np.ones((T, N), dtype=bool)
+    new_group[:, 1:] = s[:, 1:] != s[:, :-1]
+    group_end = np.ones((T, N), dtype=bool)
+    group_end[:, :-1] = new_group[:, 1:]
+    first = np.maximum.accumulate(np.where(new_group, pos, 0), axis=1)
+    last = np.minimum.accumulate(np.where(group_end, pos, N - 1)[:, ::-1], axis=1)[:, ::-1]
+
+    out = np.empty((T, N))
+    np.put_along_axis(out, order, (first + last) / 2 + 1, axis=1)
+    if pct:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = out / valid.sum(axis=1, keepdims=True)
+
+    return np.where(valid, out, np.nan)
+
+
+def winsorize(x, limits=(0.01, 0.99)):
+    """Clip each row to its cross-sectional quantiles"""
+    if x.shape[0] == 0:
+        return x.copy()
+
+    with np.errstate(invalid='ignore'):
+        valid = np.isfinite(x)
+        any_valid = valid.any(axis=1)
+        lo = np.full(x.shape[0], np.nan)
+        hi = np.full(x.shape[0], np.nan)
+        if any_valid.any():
+            q = np.nanquantile(x[any_valid], limits, axis=1)
+            lo[any_valid], hi[any_valid] = q[0], q[1]
+        return np.clip(x, lo[:, np.newaxis], hi[:, np.newaxis])
+
+
+def ewm_var(returns, halflife=20, init=None):
+    """
+    EWMA of squared returns along time (adjust=False, NaNs skipped). With
+    init (N,), the recursion continues from that previous value instead
+    of starting at the first return
+    """
+    r2 = returns ** 2
+    if init is not None:
+        r2 = np.concatenate([init[np.newaxis], r2])
+    var = pd.DataFrame(r2).ewm(halflife=halflife, adjust=False, ignore_na=True).mean().values
+    return var if init is None else var[1:]
+
+
+def ewm_vol(returns, halflife=20):
+    """
+    EWMA volatility of returns along time, sqrt of the EWMA of squared
+    returns (adjust=False, NaNs skipped)
+    """
+    return np.sqrt(ewm_var(returns, halflife))
+
+
+# vol_scale EWMA warm-up before the first signal, in halflives unless a
+# step passes 'warmup' bars
+WARMUP_HALFLIVES = 10
+
+
+def vol_scale(x, vol, target=1.0):
+    """Scale signals by inverse asset volatility"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = x * target / vol
+    return np.where(np.isfinite(out), out, np.nan)
+
+
+class Normalizer(object):
+    """
+    Pipeline of normalization steps over a T x N signal matrix, e.g.
+
+        Normalizer(['winsorize', ('vol_scale', {'halflife': 50}), 'zscore'])
+
+    Steps are names or (name, kwargs) tuples: zscore, rank, winsorize and
+    vol_scale. vol_scale needs the close panel to estimate volatility, its
+    EWMA starts a fixed warm-up of bars before the first signal, so the
+    result does not depend on how much history the panel holds as long
+    as it covers lookback() bars. transform() works on the whole matrix,
+    transform_row() is the streaming variant for one timestamp at a time
+    on the live path.
+    """
+
+    STEPS = ['zscore', 'rank', 'winsorize', 'vol_scale']
+
+    def __init__(self, steps):
+        self.steps = []
+        for step in steps:
+            name, kwargs = (step, {}) if isinstance(step, str) else step
+            if name not in self.STEPS:
+                raise ValueError(f"Unknown normalization step {name}")
+            self.steps.append((name, dict(kwargs)))
+
+        # Streaming vol_scale state
+        self._var = None
+        self._last_close = None
+
+    @staticmethod
+    def _warmup(kwargs):
+        return kwargs.get('warmup', WARMUP_HALFLIVES * kwargs.get('halflife', 20))
+
+    def lookback(self):
+        """Bars of close history needed before the first signal"""
+        return max([self._warmup(kwargs) for name, kwargs in self.steps if name == 'vol_scale'], default=0)
+
+    def _vol(self, kwargs, index, panel, shape):
+        """EWMA vol of the panel close aligned to the signal rows"""
+        if panel is None:
+            raise ValueError("vol_scale needs the close panel")
+
+        if index is None:
+            if len(panel) != shape[0]:
+                raise ValueError("Signal rows must match panel rows without an index")
+            return ewm_vol(log_returns(panel['close']), kwargs.get('halflife', 20))
+
+        # Returns after the warm-up start row, wherever the panel starts
+        ts = index.values.astype('datetime64[ns]')
+        first = np.searchsorted(panel.timestamps, ts[0]) if len(ts) else len(panel)
+        r0 = max(first - self._warmup(kwargs), 0)
+        vol = ewm_vol(log_returns(panel['close'][r0:]), kwargs.get('halflife', 20))
+        return vol[np.searchsorted(panel.timestamps, ts) - r0]
+
+    def _vol_chunk(self, i, kwargs, index, panel, state, end):
+        """
+        EWMA vol for one chunk of a longer run, continuing the variance
+        recursion from the previous chunk's last row up to end. state[i]
+        holds the carried variance, close and timestamp of step i
+        """
+        if panel is None:
+            raise ValueError("vol_scale needs the close panel")
+        if index is None:
+            raise ValueError("Chunked vol_scale needs a signal index")
+
+        n = np.searchsorted(panel.timestamps, end, side='right')
+        close = panel['close'][:n]
+        carry = state.get(i)
+        if carry is None:
+            # Nothing to start from before the first signal
+            if len(index) == 0:
+                return np.empty((0, close.shape[1]))
+            first = np.searchsorted(panel.timestamps, index.values.astype('datetime64[ns]')[0])
+            rows = np.arange(max(first - self._warmup(kwargs), 0), n)
+            var = ewm_var(log_returns(close[rows[0]:]), kwargs.get('halflife', 20))
+        else:
+            var_prev, close_prev, ts_prev = carry
+            rows = np.flatnonzero(panel.timestamps[:n] > ts_prev)
+            prev = np.concatenate([close_prev[np.newaxis], close[rows[:-1]]])
+            rets = np.log(close[rows] / prev).astype(float)
+            var = ewm_var(rets, kwargs.get('halflife', 20), init=var_prev)
+
+        if len(rows):
+            state[i] = (var[-1].copy(), close[rows[-1]].copy(), panel.timestamps[rows[-1]])
+        pos = np.searchsorted(panel.timestamps[rows], index.values.astype('datetime64[ns]'))
+        return np.sqrt(var[pos])
+
+    def _apply(self, x, vol):
+        """Run the steps over x, vol(i, kwargs) gives the vol of step i"""
+        for i, (name, kwargs) in enumerate(self.steps):
+            if name == 'zscore':
+                x = zscore(x, **kwargs)
+            elif name == 'rank':
+                x = rank(x, **kwargs)
+            elif name == 'winsorize':
+                x = winsorize(x, **kwargs)
+            elif name == 'vol_scale':
+                x = vol_scale(x, vol(i, kwargs), kwargs.get('target', 1.0))
+        return x
+
+    def transform(self, signals, panel: Panel=None):
+        """Normalize a T x N signal matrix (ndarray or DataFrame)"""
+        is_frame = isinstance(signals, pd.DataFrame)
+        x = signals.values.astype(float) if is_frame else np.asarray(signals, dtype=float)
+        index = signals.index if is_frame else None
+
+        x = self._apply(x, lambda i, kwargs: self._vol(kwargs, index, panel, x.shape))
+
+        if is_frame:
+            return pd.DataFrame(x, index=signals.index, columns=signals.columns)
+        return x
+
+    def transform_chunk(self, signals, panel: Panel, state=None, end=None):
+        """
+        Normalize one time chunk (DataFrame) of a longer run. Row-wise
+        steps need nothing else, vol_scale carries its EWMA state so that
+        chained chunks match transform() over the whole run. The panel
+        may overlap the neighbouring chunks, rows already seen and rows
+        after end (default the last signal) are skipped.
+
+        Returns (signals, state)
+        """
+        state = {} if state is None else dict(state)
+        if end is None:
+            end = signals.index[-1] if len(signals) else pd.Timestamp.min
+        end = np.datetime64(pd.Timestamp(end), 'ns')
+        x = self._apply(signals.values.astype(float),
+                        lambda i, kwargs: self._vol_chunk(i, kwargs, signals.index, panel, state, end))
+        return pd.DataFrame(x, index=signals.index, columns=signals.columns), state
+
+    def warmup(self, panel: Panel):
+        """Seed the streaming vol state from historical closes"""
+        for name, kwargs in self.steps:
+            if name == 'vol_scale':
+                vol = ewm_vol(log_returns(panel['close']), kwargs.get('halflife', 20))
+                self._var = vol[-1] ** 2
+                self._last_close = panel['close'][-1].copy()
+
+    def transform_row(self, row, close=None):
+        """
+        Normalize one cross section (N,). For vol_scale, pass the closes
+        of the same timestamp to update the EWMA state.
+        """
+        x = np.asarray(row, dtype=float)[np.newaxis, :]
+
+        for name, kwargs in self.steps:
+            if name == 'zscore':
+                x = zscore(x, **kwargs)
+            elif name == 'rank':
+                x = rank(x, **kwargs)
+            elif name == 'winsorize':
+                x = winsorize(x, **kwargs)
+            elif name == 'vol_scale':
+                if close is None:
+                    raise ValueError("vol_scale needs closes on the live path")
+                x = vol_scale(x, np.sqrt(self._update_var(close, kwargs))[np.newaxis], kwargs.get('target', 1.0))
+
+        return x[0]
+
+    def _update_var(self, close, kwargs):
+        """One step of the EWMA variance recursion, same as ewm_vol"""
+        close = np.asarray(close, dtype=float)
+        if self._last_close is None:
+            self._last_close = np.full(close.shape, np.nan)
+            self._var = np.full(close.shape, np.nan)
+
+        alpha = 1 - np.exp(-np.log(2) / kwargs.get('halflife', 20))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r2 = np.log(close / self._last_close) ** 2
+
+        ok = np.isfinite(r2)
+        first = ok & ~np.isfinite(self._var)
+        self._var = np.where(first, r2, np.where(ok, (1 - alpha) * self._var + alpha * r2, self._var))
+        self._last_close = close
+
+        return self._var
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 28 10:41:53 2026
+
+@author: ymm
+
+Vectorized portfolio simulation of T x N signal matrices
+"""
+import numpy as np
+import pandas as pd
+from data.panel import Panel
+
+# Summary stats per signal, return / vol / sharpe annualized, turnover
+# and cost per bar, drawdown in summed return units
+SUMMARY_STATS = ['return', 'vol', 'sharpe', 'turnover', 'cost', 'max_drawdown']
+
+
+def periods_per_year(index):
+    """Bars per year of a timestamp index (crypto trades every day)"""
+    ts = np.asarray(index, dtype='datetime64[ns]').astype('int64')
+    if len(ts) < 2:
+        return np.nan
+    return 365 * 86400e9 / np.median(np.diff(ts))
+
+
+def ffill(x):
+    """Forward fill NaNs down the rows of a (T, N) array"""
+    valid = np.isfinite(x)
+    idx = np.where(valid, np.arange(len(x))[:, np.newaxis], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    # Leading NaNs point at row 0 and stay NaN
+    return np.take_along_axis(x, idx, axis=0)
+
+
+def bar_returns(panel: Panel, index):
+    """
+    Simple close to close returns between consecutive timestamps of
+    index, from the last close at or before each. Missing closes are
+    forward filled, so a move across a missing bar is earned when prices
+    resume. (T, N), 0 in the first row and before a symbol's first close
+    """
+    ts = np.asarray(index, dtype='datetime64[ns]')
+    rows = np.searchsorted(panel.timestamps, ts, side='right') - 1
+    close = ffill(panel['close'][:max(rows.max(initial=-1) + 1, 1)].astype(float))
+    close = close[np.maximum(rows, 0)]
+    close[rows < 0] = np.nan
+
+    ret = np.zeros(close.shape)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ret[1:] = close[1:] / close[:-1] - 1
+    ret[~np.isfinite(ret)] = 0.0
+    return ret
+
+
+def positions(signals, method='raw', gross=1.0, delay=1):
+    """
+    Target weights from signals (..., T, N). method is 'raw' (the signal
+    itself), 'sign' or 'demean' (dollar neutral), then each row is scaled
+    to gross leverage (None to skip). Weights are held from delay - 1 bars
+    after the signal, missing signals hold nothing
+    """
+    # Work in place, a batch of signals is the largest array here
+    s = np.asarray(signals, dtype=float)
+    invalid = ~np.isfinite(s)
+    w = s.copy()
+    w[invalid] = 0.0
+
+    if method == 'sign':
+        np.sign(w, out=w)
+    elif method == 'demean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = w.sum(axis=-1, keepdims=True) / (~invalid).sum(axis=-1, keepdims=True)
+        w -= np.nan_to_num(mean)
+        w[invalid] = 0.0
+    elif method != 'raw':
+        raise ValueError(f"Unknown position method {method}")
+
+    if gross is not None:
+        g = np.abs(w).sum(axis=-1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            w *= np.where(g > 0, gross / g, 0.0)
+
+    # Execution lag beyond the next bar
+    lag = delay - 1
+    if lag > 0:
+        shifted = np.zeros_like(w)
+        shifted[..., lag:, :] = w[..., :-lag, :]
+        w = shifted
+    return w
+
+
+def pnl(weights, returns, cost_bps=0.0):
+    """
+    Bar by bar portfolio results of weights (..., T, N) held over the
+    next bar. Returns (gross, turnover, cost), each (..., T): gross[t]
+    is earned by weights[t - 1], turnover[t] is traded at t
+    """
+    w = weights
+    gross = np.zeros(w.shape[:-1])
+    gross[..., 1:] = np.einsum('...tn,tn->...t', w[..., :-1, :], returns[1:])
+
+    turnover = np.empty(w.shape[:-1])
+    turnover[..., 0] = np.abs(w[..., 0, :]).sum(axis=-1)
+    dw = np.subtract(w[..., 1:, :], w[..., :-1, :])
+    turnover[..., 1:] = np.abs(dw, out=dw).sum(axis=-1)
+
+    return gross, turnover, turnover * (cost_bps / 1e4)
+
+
+def summarize(net, turnover, cost, ppy):
+    """Summary stats (..., len(SUMMARY_STATS)) of net returns (..., T)"""
+    mean = net.mean(axis=-1)
+    std = net.std(axis=-1, ddof=1) if net.shape[-1] > 1 else np.full(mean.shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sharpe = np.where(std > 0, mean / std * np.sqrt(ppy), np.nan)
+
+    # Drawdown from the running peak of summed returns, starting at 0
+    equity = np.cumsum(net, axis=-1)
+    peak = np.maximum.accumulate(np.maximum(equity, 0.0), axis=-1)
+    max_dd = (peak - equity).max(axis=-1) if net.shape[-1] else np.full(mean.shape, np.nan)
+
+    return np.stack([mean * ppy, std * np.sqrt(ppy), sharpe,
+                     turnover.mean(axis=-1), cost.mean(axis=-1), max_dd], axis=-1)
+
+
+class Simulator(object):
+    """
+    Turns signals into positions and returns against a close panel,
+    with no per timestamp loop. Params:
+        method     'raw', 'sign' or 'demean', see positions()
+        gross      gross leverage per bar, None keeps signal scale
+        cost_bps   cost per unit of turnover, in bps of notional
+        delay      bars from signal to the start of holding, 1 trades
+                   on the signal's close
+        periods_per_year   annualization, inferred from the index if None
+        batch_size signals simulated at once in score(), small batches
+                   stay in cache and are as fast as large ones
+    """
+
+    def __init__(self, params=None):
+        if params is None:
+            params = {}
+
+        self.method = params.get('method', 'raw')
+        self.gross = params.get('gross', 1.0)
+        self.cost_bps = params.get('cost_bps', 0.0)
+        self.delay = params.get('delay', 1)
+        self.periods_per_year = params.get('periods_per_year', None)
+        self.batch_size = params.get('batch_size', 4)
+
+    def _ppy(self, index):
+        return self.periods_per_year or periods_per_year(index)
+
+    def run(self, signals: pd.DataFrame, panel: Panel):
+        """
+        Simulate one T x N signal DataFrame. Returns {'positions': T x N,
+        and per bar Series 'gross', 'turnover', 'cost', 'returns' (net)
+        and 'equity' (summed net returns), 'summary': Series of stats}
+        """
+        w = positions(signals.values, self.method, self.gross, self.delay)
+        ret = bar_returns(panel, signals.index)
+        gross, turnover, cost = pnl(w, ret[:, [panel.sym_idx[sym] for sym in signals.columns]], self.cost_bps)
+        net = gross - cost
+
+        index = signals.index
+        return {
+            'positions': pd.DataFrame(w, index=index, columns=signals.columns),
+            'gross': pd.Series(gross, index=index, name='gross'),
+            'turnover': pd.Series(turnover, index=index, name='turnover'),
+            'cost': pd.Series(cost, index=index, name='cost'),
+            'returns': pd.Series(net, index=index, name='returns'),
+            'equity': pd.Series(np.cumsum(net), index=index, name='equity'),
+            'summary': pd.Series(summarize(net, turnover, cost, self._ppy(index)), index=SUMMARY_STATS),
+        }
+
+    def score(self, signals, panel: Panel, index=None, symbols=None, names=None):
+        """
+        Summary stats of many signals over the same bars, as a DataFrame
+        with one row per signal and SUMMARY_STATS columns.
+
+        signals is a (K x T x N) array with its timestamps as index (and
+        symbols, default the panel's), e.g. from Momentum.sweep, a dict of
+        T x N DataFrames, or a DataFrame indexed by (name, timestamp) as
+        from sweep(as_frame=True). Signals are simulated batch_size at a
+        time to bound memory.
+        """
+        if isinstance(signals, dict):
+            names = list(signals) if names is None else names
+            first = next(iter(signals.values()))
+            index, symbols = first.index, list(first.columns)
+            signals = np.stack([df.reindex(index=index, columns=symbols).values for df in signals.values()])
+        elif isinstance(signals, pd.DataFrame):
+            level = signals.index.get_level_values(0)
+            keys = level.unique()
+            names = list(keys) if names is None else names
+            index = signals.index.get_level_values(1)[level == keys[0]]
+            symbols = list(signals.columns)
+            signals = signals.values.reshape(len(keys), len(index), -1)
+        elif index is None:
+            raise ValueError("Signal arrays need their timestamps as index")
+
+        symbols = panel.symbols if symbols is None else symbols
+        ret = bar_returns(panel, index)[:, [panel.sym_idx[sym] for sym in symbols]]
+        ppy = self._ppy(index)
+
+        out = np.empty((len(signals), len(SUMMARY_STATS)))
+        for k in range(0, len(signals), self.batch_size):
+            w = positions(signals[k:k + self.batch_size], self.method, self.gross, self.delay)
+            gross, turnover, cost = pnl(w, ret, self.cost_bps)
+            out[k:k + len(w)] = summarize(gross - cost, turnover, cost, ppy)
+
+        names = range(len(signals)) if names is None else names
+        return pd.DataFrame(out, index=pd.Index(list(names), name='signal'), columns=SUMMARY_STATS)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 29 09:20:11 2026
+
+@author: ymm
+
+Shared test setup, tests run offline against benchmarks.fakes
+"""
+import os
+import sys
+import types
+import tempfile
+from datetime import datetime
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# settings.py is local config (not in the repo), point caches at a temp dir
+try:
+    import settings
+except ImportError:
+    settings = types.ModuleType('settings')
+    settings.PROJECT_ROOT = tempfile.mkdtemp(prefix='crypto-exhibit-tests-')
+    sys.modules['settings'] = settings
+
+from benchmarks.fakes import FakeClient, fake_clients
+
+END = datetime(2025, 4, 1)
+
+
+def symbols_of(n):
+    return [f"S{i}USDTM" for i in range(n)]
+
+
+@pytest.fixture
+def fake_client():
+    """FakeClient that every data class in the test talks to"""
+    client = FakeClient()
+    with fake_clients(client):
+        yield client
+
+
+@pytest.fixture
+def kline_params(tmp_path):
+    """KucoinFuturesKlinesData params against an empty per-test cache"""
+    def params(symbols, freq=60, **kwargs):
+        return dict({'symbols': symbols, 'freq': freq, 'as_panel': True,
+                     'cache_dir': str(tmp_path / 'klines'), 'rate_limit': 1e9}, **kwargs)
+    return params
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Nov  2 10:14:27 2026
+
+@author: ymm
+
+Bars built from ticks, and loading them back through the kline loader
+"""
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from benchmarks.fakes import FakeClient, fake_clients
+from data.bar_builder import BarBuilder
+from data.kline_cache import KlineCache
+from data.kucoin_futures_data import KucoinFuturesKlinesData
+
+SYM = 'S1USDTM'
+
+
+def ms(date):
+    return int(pd.Timestamp(date).value // 1000000)
+
+
+def test_weekly_bars_open_on_mondays():
+    bars = []
+    builder = BarBuilder({'freq': '1week', 'callback': bars.append, 'use_timer': False})
+    for day in pd.date_range('2025-03-05', '2025-03-20', freq='1D'):
+        builder.on_tick(SYM, 100.0, 1.0, ms(day))
+    builder.flush(ms('2025-03-31'))
+
+    opens = pd.to_datetime([bar['timestamp'] for bar in bars], unit='ms')
+    assert list(opens) == list(pd.to_datetime(['2025-03-03', '2025-03-10', '2025-03-17']))
+
+
+class RecordingClient(FakeClient):
+    """FakeClient that keeps the requested ranges"""
+
+    def __init__(self):
+        super().__init__()
+        self.ranges = []
+
+    def futures_get_klines(self, symbol, kline_type=60, start=None, end=None):
+        self.ranges.append((start, end))
+        return super().futures_get_klines(symbol, kline_type, start, end)
+
+
+def test_stream_bars_are_read_instead_of_fetched(tmp_path):
+    # One tick a minute over 10:00-10:30, none at 10:15
+    cache = KlineCache(str(tmp_path / 'klines'))
+    builder = BarBuilder({'freq': 1, 'store': cache, 'use_timer': False})
+    t0 = ms('2025-03-03 10:00')
+    for i in range(31):
+        if i != 15:
+            builder.on_tick(SYM, 1000.0 + i, 1.0, t0 + i * 60000 + 5000)
+    builder.flush(t0 + 40 * 60000)
+    builder.close()
+
+    client = RecordingClient()
+    params = {'symbols': [SYM], 'freq': 1, 'as_panel': True, 'cache_dir': str(tmp_path / 'klines'),
+              'rate_limit': 1e9, 'stream_bars': True}
+    with fake_clients(client):
+        panel = KucoinFuturesKlinesData(params).load(datetime(2025, 3, 3, 9, 50), datetime(2025, 3, 3, 10, 40))
+
+    # The first bar after subscribing is partial and not stored
+    streamed = [t0 + i * 60000 for i in range(1, 31) if i != 15]
+    for start, end in client.ranges:
+        assert not any(start <= ts <= end for ts in streamed)
+    assert any(start <= t0 + 15 * 60000 <= end for start, end in client.ranges)
+
+    ts = panel.timestamps.astype('datetime64[ms]').astype('int64')
+    close = panel['close'][np.searchsorted(ts, streamed), 0]
+    np.testing.assert_array_equal(close, [1000.0 + i for i in range(1, 31) if i != 15])
+    assert len(panel) == 51
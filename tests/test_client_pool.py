@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Nov  2 09:41:27 2026
+
+@author: ymm
+
+Shared lazily created clients and a light data layer import
+"""
+import os
+import sys
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from data import client_pool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_does_not_load_clients_or_asyncio():
+    code = ("import sys, types, tempfile\n"
+            "settings = types.ModuleType('settings')\n"
+            "settings.PROJECT_ROOT = tempfile.gettempdir()\n"
+            "sys.modules['settings'] = settings\n"
+            "import data.kucoin_futures_data\n"
+            "print(' '.join(m for m in ('asyncio', 'kucoin', 'dotenv') if m in sys.modules))\n")
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ''
+
+
+@pytest.fixture
+def new_clients(monkeypatch):
+    """Count REST clients created by the pool"""
+    created = []
+    monkeypatch.setattr(client_pool, '_clients', {})
+    monkeypatch.setattr(client_pool, '_new_rest_client', lambda: created.append(object()) or created[-1])
+    return created
+
+
+def test_client_is_created_once_and_shared(new_clients):
+    assert new_clients == []
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        clients = list(pool.map(lambda _: client_pool.get_client('rest'), range(32)))
+
+    assert len(new_clients) == 1
+    assert all(c is new_clients[0] for c in clients)
+    with pytest.raises(ValueError):
+        client_pool.get_client('ws')
+
+
+def test_forked_process_builds_its_own_client(new_clients):
+    parent = client_pool.get_client()
+    pid = os.fork()
+    if pid == 0:
+        child = client_pool.get_client()
+        os._exit(0 if child is not parent and len(new_clients) == 2 else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert client_pool.get_client() is parent
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Nov  2 11:30:12 2026
+
+@author: ymm
+
+Kline cache coverage, concurrent writers and gap-aware loads
+"""
+import os
+import multiprocessing
+from datetime import datetime
+import numpy as np
+import pytest
+from data.kline_cache import KlineCache, KLINE_DTYPE
+from data.kucoin_futures_data import KucoinFuturesKlinesData
+
+MIN = 60000
+SYM = 'S1USDTM'
+
+
+def bars(first, n, close=1.0):
+    arr = np.zeros(n, dtype=KLINE_DTYPE)
+    arr['timestamp'] = first + MIN * np.arange(n)
+    arr['close'] = close
+    return arr
+
+
+def test_coverage_merges_and_newer_rows_win(tmp_path):
+    cache = KlineCache(str(tmp_path))
+    cache.write_array(SYM, 1, bars(0, 10), 0, 9 * MIN)
+    cache.write_array(SYM, 1, bars(10 * MIN, 5), 10 * MIN, 14 * MIN)
+    cache.write_array(SYM, 1, bars(30 * MIN, 5), 30 * MIN, 34 * MIN)
+    cache.write_array(SYM, 1, bars(2 * MIN, 2, close=2.0), 2 * MIN, 3 * MIN)
+
+    assert cache.coverage(SYM, 1) == [(0, 14 * MIN), (30 * MIN, 34 * MIN)]
+    assert cache.missing(SYM, 1, 5 * MIN, 40 * MIN) == [(14 * MIN + 1, 30 * MIN - 1), (34 * MIN + 1, 40 * MIN)]
+    arr = cache.read_array(SYM, 1)
+    assert len(arr) == 20
+    assert list(arr['close'][:5]) == [1.0, 1.0, 2.0, 2.0, 1.0]
+
+
+def _write_day(cache_dir, i):
+    KlineCache(cache_dir).write_array(SYM, 1, bars(i * 100 * MIN, 100), i * 100 * MIN, (i * 100 + 99) * MIN)
+
+
+def test_concurrent_writers_keep_all_rows(tmp_path):
+    ctx = multiprocessing.get_context('fork')
+    with ctx.Pool(4) as pool:
+        pool.starmap(_write_day, [(str(tmp_path), i) for i in range(16)])
+
+    cache = KlineCache(str(tmp_path))
+    assert cache.coverage(SYM, 1) == [(0, 1599 * MIN)]
+    assert len(cache.read_array(SYM, 1)) == 1600
+    # Only the committed data file is left
+    assert len([f for f in os.listdir(tmp_path / '1') if f.endswith('.npy')]) == 1
+
+
+def test_failed_commit_leaves_cache_unchanged(tmp_path, monkeypatch):
+    cache = KlineCache(str(tmp_path))
+    cache.write_array(SYM, 1, bars(0, 10), 0, 9 * MIN)
+
+    def crash(src, dst):
+        raise OSError("crashed before the commit")
+
+    monkeypatch.setattr(os, 'replace', crash)
+    with pytest.raises(OSError):
+        cache.write_array(SYM, 1, bars(10 * MIN, 10), 10 * MIN, 19 * MIN)
+    monkeypatch.undo()
+
+    assert cache.coverage(SYM, 1) == [(0, 9 * MIN)]
+    assert len(cache.read_array(SYM, 1)) == 10
+
+
+def test_loads_only_fetch_missing_ranges(fake_client, kline_params):
+    loader = KucoinFuturesKlinesData(kline_params([SYM]))
+    first = loader.load(datetime(2025, 3, 1), datetime(2025, 3, 5))
+    calls = fake_client.calls
+
+    loader.load(datetime(2025, 3, 1), datetime(2025, 3, 5))
+    assert fake_client.calls == calls
+
+    both = loader.load(datetime(2025, 2, 27), datetime(2025, 3, 5))
+    assert fake_client.calls == calls + 1
+    np.testing.assert_array_equal(both['close'][-len(first):], first['close'])
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 29 10:12:54 2026
+
+@author: ymm
+
+Kline loading against the fake REST client
+"""
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from benchmarks.fakes import FakeClient, fake_clients
+from data.kucoin_futures_data import KucoinFuturesKlinesData
+
+
+def test_weekly_bars_open_on_mondays(fake_client, kline_params):
+    start, end = datetime(2025, 3, 10), datetime(2025, 6, 1)
+    direct = KucoinFuturesKlinesData(kline_params(['S1USDTM'], '1week', use_cache=False)).load(start, end)
+    resampled = KucoinFuturesKlinesData(kline_params(['S1USDTM'], '1week', base_freq='1day',
+                                                     use_cache=False)).load(start, end)
+
+    ts = pd.DatetimeIndex(direct.timestamps)
+    assert (ts.dayofweek == 0).all()
+    np.testing.assert_array_equal(direct.timestamps, resampled.timestamps)
+
+
+class OffGridClient(FakeClient):
+    """Bars stamped a minute after the hour"""
+
+    def futures_get_klines(self, symbol, kline_type=60, start=None, end=None):
+        rows = super().futures_get_klines(symbol, kline_type, start - 60000, end - 60000)
+        return [[ts + 60000] + row for ts, *row in rows]
+
+
+def test_off_grid_bars_are_kept(kline_params):
+    start, end = datetime(2025, 3, 1), datetime(2025, 3, 20)
+    with fake_clients(FakeClient()):
+        on_grid = KucoinFuturesKlinesData(kline_params(['S1USDTM'], use_cache=False)).load(start, end)
+    with fake_clients(OffGridClient()):
+        panel = KucoinFuturesKlinesData(kline_params(['S1USDTM'], use_cache=False)).load(start, end)
+
+    ms = panel.timestamps.astype('datetime64[ms]').astype('int64')
+    # The shifted bar at end falls outside the range
+    assert len(panel) == len(on_grid) - 1
+    assert (ms % 3600000 == 60000).all()
+
+
+def test_resampled_bars_follow_cache_rewrites(fake_client, kline_params):
+    start, end = datetime(2025, 3, 1), datetime(2025, 3, 5)
+    loader = KucoinFuturesKlinesData(kline_params(['S1USDTM'], 60, base_freq=15))
+    before = loader.load(start, end)
+
+    # Rewrite one interior base bar, span and row count stay the same
+    arr = np.array(loader.cache.read_array('S1USDTM', 15))
+    i = len(arr) // 2
+    arr['high'][i] = 1e9
+    ts = int(arr['timestamp'][i])
+    loader.cache.write_array('S1USDTM', 15, arr[i:i + 1], ts, ts)
+
+    after = loader.load(start, end)
+    row = np.searchsorted(after.timestamps, np.datetime64(ts - ts % 3600000, 'ms'))
+    assert before['high'][row, 0] < 1e9
+    assert after['high'][row, 0] == 1e9
+
+
+def test_concurrent_fetch_matches_serial(fake_client, kline_params):
+    start, end = datetime(2025, 1, 1), datetime(2025, 3, 1)
+    symbols = ['S1USDTM', 'S2USDTM', 'S3USDTM']
+    serial = KucoinFuturesKlinesData(kline_params(symbols, use_cache=False, max_workers=1)).load(start, end)
+    calls = fake_client.calls
+    concurrent = KucoinFuturesKlinesData(kline_params(symbols, use_cache=False, max_workers=8)).load(start, end)
+
+    # Several batches per symbol, each fetched once
+    assert calls > 3 * 2
+    assert fake_client.calls == 2 * calls
+    np.testing.assert_array_equal(serial.timestamps, concurrent.timestamps)
+    for field in ['open', 'close', 'high', 'low', 'volume']:
+        np.testing.assert_array_equal(serial[field], concurrent[field])
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Nov  1 15:22:09 2026
+
+@author: ymm
+
+Chunked and batched model eval against one run of each model
+"""
+from datetime import datetime
+import pandas as pd
+import pytest
+from benchmarks.fakes import FakeClient, fake_clients
+from model.momentum import Momentum
+from model.model_eval import ModelEvalEngine, BatchModelEvalEngine, read_chunks
+
+START, END = datetime(2025, 2, 1), datetime(2025, 3, 1)
+NORMALIZE = ['winsorize', ('vol_scale', {'halflife': 10}), 'zscore']
+
+
+class CachedMomentum(Momentum):
+    """Momentum loading klines through a per-test cache"""
+
+    def __init__(self, params, cache_dir):
+        super().__init__(params)
+        self.cache_dir = cache_dir
+
+    def load_data_map(self):
+        data_map = super().load_data_map()
+        data_map['KucoinFuturesKlinesData']['params'].update(cache_dir=self.cache_dir, rate_limit=1e9)
+        return data_map
+
+
+SYMBOLS = ['S1USDTM', 'S2USDTM', 'S3USDTM']
+
+
+@pytest.fixture
+def model(fake_client, tmp_path):
+    return CachedMomentum({'symbols': SYMBOLS, 'freq': 60, 'lookback': 24}, str(tmp_path / 'klines'))
+
+
+@pytest.mark.parametrize('model_type', ['TS', 'CS'])
+@pytest.mark.parametrize('normalize', [None, NORMALIZE])
+def test_chunked_run_matches_one_shot(model, model_type, normalize):
+    params = {'model_type': model_type, 'model': model, 'normalize': normalize}
+    whole = ModelEvalEngine(params).run(START, END)
+    chunked = ModelEvalEngine(dict(params, chunk='7D')).run(START, END)
+
+    assert len(whole) > 24 * 20
+    pd.testing.assert_frame_equal(chunked, whole)
+
+
+def test_chunk_files_match_one_shot(model, tmp_path):
+    whole = ModelEvalEngine({'model': model}).run(START, END)
+    files = ModelEvalEngine({'model': model, 'chunk': '5D', 'output': str(tmp_path / 'out')}).run(START, END)
+
+    assert len(files) == 6
+    pd.testing.assert_frame_equal(read_chunks(str(tmp_path / 'out')), whole)
+
+
+@pytest.mark.parametrize('normalize', [[('vol_scale', {'halflife': 10})], NORMALIZE])
+def test_batch_matches_solo_runs(fake_client, tmp_path, normalize):
+    # Batched, the short model's data is loaded with the long model's lookback
+    models = [CachedMomentum({'symbols': SYMBOLS, 'freq': 60, 'lookback': L}, str(tmp_path / 'klines'))
+              for L in (5, 200)]
+    batch = BatchModelEvalEngine({'models': models, 'normalize': normalize, 'max_workers': 1}).run(START, END)
+
+    for model, results in zip(models, batch):
+        solo = ModelEvalEngine({'model': model, 'normalize': normalize}).run(START, END)
+        pd.testing.assert_frame_equal(results, solo)
+
+
+class KlineTypeClient(FakeClient):
+    """FakeClient that keeps the requested kline types"""
+
+    def __init__(self):
+        super().__init__()
+        self.kline_types = set()
+
+    def futures_get_klines(self, symbol, kline_type=60, start=None, end=None):
+        self.kline_types.add(kline_type)
+        return super().futures_get_klines(symbol, kline_type, start, end)
+
+
+def test_batch_shares_one_base_freq(tmp_path):
+    def models(**params):
+        return [CachedMomentum(dict({'symbols': SYMBOLS, 'freq': freq, 'lookback': 5}, **params),
+                               str(tmp_path / 'klines')) for freq in (60, 240, '1day')]
+
+    client = KlineTypeClient()
+    with fake_clients(client):
+        batch = BatchModelEvalEngine({'models': models(), 'max_workers': 1}).run(START, END)
+    assert client.kline_types == {60}
+
+    with fake_clients(FakeClient()):
+        for model, results in zip(models(base_freq=60), batch):
+            pd.testing.assert_frame_equal(results, ModelEvalEngine({'model': model}).run(START, END))
+
+
+def test_cs_run_matches_per_date_eval(model):
+    engine = ModelEvalEngine({'model_type': 'CS', 'model': model})
+    data = engine.load_data(START, END)
+    results = engine.run(START, END, data)
+
+    # One cs_eval per date, plus a date between bars and one before the panel
+    dates = list(results.index) + [pd.Timestamp('2025-02-10 12:30'), pd.Timestamp('2020-01-01')]
+    expected = pd.DataFrame([model.cs_eval(date, data) for date in dates],
+                            index=pd.DatetimeIndex(dates, name='timestamp'))
+    pd.testing.assert_frame_equal(model.cs_eval_dates(dates, data), expected)
+    pd.testing.assert_frame_equal(results, expected.iloc[:len(results)])
+
+    ts = ModelEvalEngine({'model': model}).run(START, END, data)
+    pd.testing.assert_frame_equal(results, ts, check_exact=False)
+
+
+def test_batch_loads_each_dataset_once(tmp_path):
+    cache = str(tmp_path / 'klines')
+    models = [CachedMomentum({'symbols': SYMBOLS, 'freq': 60, 'lookback': L}, cache) for L in (5, 24, 200)]
+    models.append(CachedMomentum({'symbols': SYMBOLS[:2], 'freq': 60, 'lookback': 24}, cache))
+    datasets, model_inputs = BatchModelEvalEngine({'models': models}).plan()
+
+    # Lookback only differs, one load with the largest
+    assert len(datasets) == 2
+    keys = [inputs['KucoinFuturesKlinesData'] for inputs in model_inputs]
+    assert keys[0] == keys[1] == keys[2] != keys[3]
+    assert datasets[keys[0]][1]['params']['lookback'] == 200
+    assert datasets[keys[3]][1]['params']['lookback'] == 24
+
+
+@pytest.mark.parametrize('panel_dir', [None, 'panels'])
+def test_pool_matches_solo_runs(fake_client, tmp_path, panel_dir):
+    models = [CachedMomentum({'symbols': SYMBOLS, 'freq': 60, 'lookback': L}, str(tmp_path / 'klines'))
+              for L in (5, 24, 200)]
+    params = {'models': models, 'normalize': NORMALIZE, 'max_workers': 2,
+              'panel_dir': panel_dir and str(tmp_path / panel_dir)}
+    batch = BatchModelEvalEngine(params).run(START, END)
+
+    for model, results in zip(models, batch):
+        pd.testing.assert_frame_equal(results, ModelEvalEngine({'model': model, 'normalize': NORMALIZE}).run(START, END))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Nov  1 14:05:36 2026
+
+@author: ymm
+
+Incremental momentum against the batch ts_eval
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from data.panel import Panel
+from model.momentum import Momentum
+
+
+def make_data(T=400, N=6, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (T, N)), axis=0))
+    close[rng.random((T, N)) < 0.03] = np.nan
+    ts = pd.date_range('2025-01-01', periods=T, freq='1h').values
+    symbols = [f"S{j}USDTM" for j in range(N)]
+
+    # Hours no symbol traded are not panel rows at all
+    keep = np.ones(T, dtype=bool)
+    keep[[60, 61, 150, 300]] = False
+    return ts[keep], symbols, close[keep]
+
+
+@pytest.mark.parametrize('W', [0, 5, 50])
+def test_on_bar_matches_ts_eval(W):
+    ts, symbols, close = make_data()
+    model = Momentum({'symbols': symbols, 'freq': 60, 'lookback': 24})
+    batch = model.ts_eval(ts[0], ts[-1], {'KucoinFuturesKlinesData': Panel(ts, symbols, {'close': close})})
+
+    # Warm up on the first bars, then stream the rest. Missing closes are
+    # bars that never arrive
+    model.init_online({'KucoinFuturesKlinesData': Panel(ts[:W], symbols, {'close': close[:W]})} if W else None)
+    ms = ts.astype('datetime64[ms]').astype('int64')
+    for t in range(W, len(ts)):
+        for j, sym in enumerate(symbols):
+            if np.isfinite(close[t, j]):
+                signal = model.on_bar({'symbol': sym, 'timestamp': int(ms[t]), 'close': close[t, j]})
+                np.testing.assert_array_equal(signal, batch.values[t, j])
+
+
+def test_sweep_matches_ts_eval_and_pandas():
+    ts, symbols, close = make_data()
+    data = {'KucoinFuturesKlinesData': Panel(ts, symbols, {'close': close})}
+    start, end = ts[100], ts[-1]
+    lookbacks = [1, 5, 24, 96]
+    sweep = Momentum({'symbols': symbols, 'freq': 60, 'lookback': 24}).sweep(start, end, data, lookbacks, as_frame=True)
+
+    log_ret = np.log(pd.DataFrame(close, index=ts)).diff()
+    for L in lookbacks:
+        mom = Momentum({'symbols': symbols, 'freq': 60, 'lookback': L}).ts_eval(start, end, data)
+        np.testing.assert_array_equal(sweep.loc[L].values, mom.values)
+
+        expected = log_ret.rolling(L).sum().loc[start:end].values
+        np.testing.assert_array_equal(np.isnan(mom.values), np.isnan(expected))
+        np.testing.assert_allclose(mom.values, expected, rtol=1e-9, atol=1e-12)
+
+    # Same values whatever the other lookbacks and history before start
+    trimmed = {'KucoinFuturesKlinesData': Panel(ts[100 - 96:], symbols, {'close': close[100 - 96:]})}
+    alone = Momentum({'symbols': symbols, 'freq': 60, 'lookback': 96}).sweep(start, end, trimmed, [96])
+    np.testing.assert_array_equal(alone[0], sweep.loc[96].values)
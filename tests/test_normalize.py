@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Nov  2 14:08:15 2026
+
+@author: ymm
+
+Signal normalization against pandas, and the streaming path against
+the batch one
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from data.panel import Panel
+from model.normalize import Normalizer, zscore, rank, winsorize
+
+
+def make_signals(T=300, N=8, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(T, N))
+    x[rng.random((T, N)) < 0.1] = np.nan
+    x[5] = np.nan                       # empty cross section
+    x[6, 1:] = np.nan                   # single value
+    x[7, :4] = x[7, 4:] = 1.5           # all tied
+    x[8, [0, 3, 5]] = 0.25              # some tied
+    return x
+
+
+def make_panel(T=300, N=8, seed=1):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (T, N)), axis=0))
+    close[rng.random((T, N)) < 0.02] = np.nan
+    ts = pd.date_range('2025-01-01', periods=T, freq='1h').values
+    return Panel(ts, [f"S{j}USDTM" for j in range(N)], {'close': close})
+
+
+def test_zscore_and_rank_match_pandas():
+    x = make_signals()
+    df = pd.DataFrame(x)
+
+    expected = df.sub(df.mean(axis=1), axis=0).div(df.std(axis=1), axis=0)
+    expected[df.std(axis=1) == 0] = np.nan
+    np.testing.assert_allclose(zscore(x), expected.values, rtol=1e-12, atol=1e-12)
+
+    for pct in (True, False):
+        np.testing.assert_array_equal(rank(x, pct=pct), df.rank(axis=1, pct=pct).values)
+
+
+def test_winsorize_clips_to_row_quantiles():
+    x = make_signals()
+    out = winsorize(x, (0.1, 0.9))
+    q = pd.DataFrame(x).quantile([0.1, 0.9], axis=1).values
+    expected = np.clip(x, q[0][:, None], q[1][:, None])
+
+    np.testing.assert_array_equal(out, expected)
+    assert winsorize(x[:0]).shape == (0, x.shape[1])
+
+
+@pytest.mark.parametrize('steps', [['winsorize', 'zscore'], ['rank'],
+                                   [('vol_scale', {'halflife': 10}), 'zscore']])
+def test_transform_row_matches_transform(steps):
+    panel = make_panel()
+    x = make_signals()
+    batch = Normalizer(steps).transform(x, panel)
+
+    # Warm up on the first rows, then normalize one cross section at a time
+    W = 50
+    live = Normalizer(steps)
+    live.warmup(panel.slice(end=panel.timestamps[W - 1]))
+    rows = [live.transform_row(x[t], panel['close'][t]) for t in range(W, len(x))]
+    np.testing.assert_allclose(np.array(rows), batch[W:], rtol=1e-9, atol=1e-12)
+
+
+def test_vol_scale_does_not_depend_on_history_length():
+    panel = make_panel()
+    x = make_signals()
+    signals = pd.DataFrame(x[200:], index=pd.DatetimeIndex(panel.timestamps[200:]))
+    norm = Normalizer([('vol_scale', {'halflife': 10})])
+
+    full = norm.transform(signals, panel)
+    short = norm.transform(signals, panel.slice(start=panel.timestamps[200 - norm.lookback()]))
+    pd.testing.assert_frame_equal(full, short)
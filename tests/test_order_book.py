@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Nov  2 16:21:44 2026
+
+@author: ymm
+
+Level 2 books against a dict reference and against the local book server
+"""
+import socket
+import asyncio
+import numpy as np
+from benchmarks.fakes import FakeBookServer, fake_clients
+from data.kucoin_stream_data import KucoinStreamOrderBookData
+from data.order_book import OrderBook, parse_l2
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def spot_delta(seq, bids=(), asks=(), sym='A-USDT'):
+    return {'type': 'message', 'topic': f"/market/level2:{sym}",
+            'data': {'changes': {'bids': [[str(p), str(s), str(seq)] for p, s in bids],
+                                 'asks': [[str(p), str(s), str(seq)] for p, s in asks]},
+                     'sequenceStart': seq, 'sequenceEnd': seq, 'symbol': sym, 'time': 1}}
+
+
+def test_parse_spot_and_futures():
+    assert parse_l2(spot_delta(7, bids=[(99.5, 2)], asks=[(100.5, 0)])) == \
+        ('A-USDT', 7, 7, [(True, 99.5, 2.0, 7), (False, 100.5, 0.0, 7)], 1)
+
+    futures = {'type': 'message', 'topic': '/contractMarket/level2:XBTUSDTM',
+               'data': {'sequence': 12, 'change': '64000.5,sell,3', 'timestamp': 2}}
+    assert parse_l2(futures) == ('XBTUSDTM', 12, 12, [(False, 64000.5, 3.0, 12)], 2)
+    assert parse_l2({'type': 'ack'}) is None
+
+
+def test_book_matches_dict_reference():
+    rng = np.random.default_rng(0)
+    book = OrderBook('A-USDT')
+    ref = {'bids': {99.0 - i: 1.0 for i in range(5)}, 'asks': {101.0 + i: 1.0 for i in range(5)}}
+    book.load([[p, s] for p, s in ref['bids'].items()], [[p, s] for p, s in ref['asks'].items()], 10)
+
+    for seq in range(11, 2000):
+        side = 'bids' if rng.random() < 0.5 else 'asks'
+        price = float(99 - rng.integers(0, 30)) if side == 'bids' else float(101 + rng.integers(0, 30))
+        size = 0.0 if rng.random() < 0.3 else float(rng.integers(1, 50))
+        if size:
+            ref[side][price] = size
+        else:
+            ref[side].pop(price, None)
+        assert book.apply(parse_l2(spot_delta(seq, **{side: [(price, size)]})))
+
+    bids = sorted(ref['bids'].items(), reverse=True)
+    asks = sorted(ref['asks'].items())
+    depth = book.depth(n=len(bids) + len(asks))
+    np.testing.assert_array_equal(depth['bids'], bids)
+    np.testing.assert_array_equal(depth['asks'], asks)
+    assert book.top() == (bids[0][0], bids[0][1], asks[0][0], asks[0][1])
+
+    # Market buy of 10 walks the asks
+    left, cost = 10.0, 0.0
+    for price, size in asks:
+        take = min(left, size)
+        cost, left = cost + take * price, left - take
+        if left == 0:
+            break
+    assert abs(book.vwap(10, 'buy') - cost / 10) < 1e-12
+    assert np.isnan(book.vwap(1e9, 'buy'))
+
+    # Old deltas are skipped, a gap is reported
+    assert book.apply(parse_l2(spot_delta(5, bids=[(1.0, 1)])))
+    assert 1.0 not in book.depth(1000)['bids'][:, 0]
+    assert not book.apply(parse_l2(spot_delta(2001, bids=[(1.0, 1)])))
+
+
+def test_stream_books_follow_server_through_gaps():
+    async def run():
+        port = free_port()
+        # The last changes are sent, or the books could not know of them
+        n, gap_every = 2900, 500
+        server = await FakeBookServer(port, n_messages=n, rate=3000, levels=50, gap_every=gap_every).start()
+        symbols = ['A-USDT', 'B-USDT', 'C-USDT']
+        with fake_clients(ws_port=port):
+            stream = KucoinStreamOrderBookData({'symbols': symbols, 'reconnect_base': 0.01})
+        received = [0]
+
+        async def callback(msg):
+            if msg.get('type') == 'message':
+                received[0] += 1
+            if received[0] == n - n // gap_every and not stream._pending:
+                stream.stop()
+
+        try:
+            await asyncio.wait_for(stream._connect(lambda msg: stream._on_message(msg, callback)), 10)
+        finally:
+            await server.close()
+
+        assert stream.stats.counters['book_gaps'] >= 1
+        for sym in symbols:
+            expected = server.snapshot(sym)
+            depth = stream.books[sym].depth(1000)
+            assert stream.books[sym].sequence == int(expected['sequence'])
+            np.testing.assert_array_equal(depth['bids'], np.array(expected['bids'], dtype=float))
+            np.testing.assert_array_equal(depth['asks'], np.array(expected['asks'], dtype=float))
+
+    asyncio.run(run())
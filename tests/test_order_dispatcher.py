@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 29 11:40:18 2026
+
+@author: ymm
+
+Order dispatch against the fake exchange
+"""
+import time
+import socket
+import asyncio
+import pytest
+from benchmarks.fakes import FakeExchange, FakeAPIException, fake_clients
+from data.kucoin_stream_data import KucoinStreamAccountData
+
+
+def account_of(exchange):
+    with fake_clients(stream_client=exchange):
+        return KucoinStreamAccountData({})
+
+
+def test_test_orders_go_through_the_dispatcher():
+    async def run():
+        exchange = FakeExchange(latency=0.001)
+        account = account_of(exchange)
+        order_id = await account.submit_test_market_order('BTC-USDT', 'buy', 1)
+
+        with pytest.raises(FakeAPIException):
+            await account.submit_test_market_order('BTC-USDT', 'hold', 1)
+        return order_id, account.dispatcher
+
+    order_id, dispatcher = asyncio.run(run())
+    assert order_id is not None
+    assert dispatcher.counters['tested'] == 1
+    assert dispatcher.counters['rejected'] == 1
+    assert dispatcher.open_orders() == []
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def streaming_account(exchange):
+    """Account streaming from a started exchange, with its stream task"""
+    await exchange.start()
+    with fake_clients(stream_client=exchange):
+        account = KucoinStreamAccountData({'rate_limit': 1e9})
+    task = account.stream()
+    for _ in range(200):
+        if exchange._sockets:
+            break
+        await asyncio.sleep(0.01)
+    return account, task
+
+
+def test_concurrent_orders_fill_and_replace():
+    async def run():
+        exchange = FakeExchange(free_port(), latency=0.01)
+        account, task = await streaming_account(exchange)
+        dispatcher = account.dispatcher
+        orders = [{'symbol': f"S{i}-USDT", 'side': 'buy', 'size': 1} for i in range(10)]
+        try:
+            filled = await account.submit_orders(orders)
+            assert await dispatcher.wait(filled, timeout=5) == []
+
+            resting = await account.submit_orders([dict(o, price=90) for o in orders])
+            replaced = await account.replace_orders({o['client_oid']: dict(o_, price=95)
+                                                     for o, o_ in zip(resting, orders)})
+            # Already canceled, nothing to cancel twice
+            again = await account.cancel_orders([o['client_oid'] for o in resting])
+            return filled, resting, replaced, again, dispatcher
+        finally:
+            account.stop()
+            await asyncio.wait_for(task, timeout=5)
+            await exchange.close()
+
+    filled, resting, replaced, again, dispatcher = asyncio.run(run())
+    assert [o['status'] for o in filled] == ['filled'] * 10
+    assert all(o['ack_ts'] is not None and o['fill_ts'] >= o['ack_ts'] for o in filled)
+    assert [o['status'] for o in resting] == ['canceled'] * 10
+    assert [o['price'] for o in replaced] == [95] * 10
+    assert again == [True] * 10
+    assert len(dispatcher.open_orders()) == 10
+    assert dispatcher.counters['rejected'] == 0
+
+
+def test_rejected_orders_do_not_raise():
+    async def run():
+        exchange = FakeExchange(latency=0.001)
+        account = account_of(exchange)
+        first = await account.dispatcher.submit('BTC-USDT', 'buy', 1, client_oid='a')
+        # Known to the exchange but not to this dispatcher, rejected there
+        account.dispatcher.orders.pop('a')
+        second = await account.dispatcher.submit('BTC-USDT', 'buy', 1, client_oid='a')
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first['status'] == 'submitted'
+    assert second['status'] == 'rejected'
+    assert isinstance(second['error'], FakeAPIException)
+
+
+class RejectingExchange(FakeExchange):
+    """Rejects every market order"""
+
+    async def create_market_order(self, symbol, side, size=None, funds=None, client_oid=None, **params):
+        raise FakeAPIException('200004', 'Balance insufficient')
+
+
+def test_market_and_test_orders_both_raise_rejections():
+    async def run():
+        account = account_of(RejectingExchange(latency=0.001))
+        with pytest.raises(FakeAPIException):
+            await account.submit_market_order('BTC-USDT', 'buy', 1)
+        with pytest.raises(FakeAPIException):
+            await account.submit_test_market_order('BTC-USDT', 'hold', 1)
+
+    asyncio.run(run())
+
+
+def test_finished_orders_are_pruned():
+    async def run():
+        with fake_clients(stream_client=FakeExchange(latency=0.001)):
+            account = KucoinStreamAccountData({'history': 5})
+        records = await account.submit_orders([{'symbol': 'BTC-USDT', 'side': 'buy', 'size': 1, 'test': True}
+                                               for _ in range(20)])
+        return records, account.dispatcher
+
+    records, dispatcher = asyncio.run(run())
+    assert dispatcher.orders == {}
+    assert len(dispatcher.finished) == 5
+    assert set(dispatcher.finished) <= {o['client_oid'] for o in records}
+
+
+def test_latency_excludes_limiter_wait():
+    async def run():
+        with fake_clients(stream_client=FakeExchange(latency=0.002)):
+            account = KucoinStreamAccountData({'rate_limit': 20})
+        t0 = time.time()
+        records = await account.submit_orders([{'symbol': 'BTC-USDT', 'side': 'buy', 'size': 1, 'test': True}
+                                               for _ in range(25)])
+        return records, time.time() - t0
+
+    # A burst of 20, the last 5 orders queue for the limiter
+    records, elapsed = asyncio.run(run())
+    assert elapsed > 0.2
+    assert max(o['ack_ts'] - o['submit_ts'] for o in records) < 0.05
+
+
+class SlowSubmitExchange(FakeExchange):
+    """Order requests take longer to reach the exchange than cancels"""
+
+    async def _new_order(self, *args):
+        await asyncio.sleep(0.05)
+        return await super()._new_order(*args)
+
+
+def test_cancel_waits_for_the_exchange_to_have_the_order():
+    async def run():
+        exchange = SlowSubmitExchange(latency=0.002)
+        account = account_of(exchange)
+        dispatcher = account.dispatcher
+        order = dispatcher.new_order('BTC-USDT', 'buy', 1, price=90)
+        sending = asyncio.ensure_future(dispatcher._send(order))
+        # Still in flight, the exchange does not know the order yet
+        canceled = await dispatcher.cancel_orders([order['client_oid']])
+        await sending
+        return canceled, order
+
+    canceled, order = asyncio.run(run())
+    assert canceled == [True]
+    assert order['status'] == 'canceled'
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Nov  2 13:26:41 2026
+
+@author: ymm
+
+Panel alignment, point in time access and sharing across processes
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from data.kline_cache import KLINE_DTYPE, KLINE_COLUMNS, array_to_frame
+from data.panel import Panel, PANEL_FIELDS
+
+H = 3600000
+
+
+def make_arrays():
+    """Symbols on overlapping but different hourly grids"""
+    rng = np.random.default_rng(0)
+    out = {}
+    for sym, hours in [('A', range(0, 10)), ('B', range(3, 12)), ('C', [0, 2, 4, 6, 20])]:
+        arr = np.empty(len(hours), dtype=KLINE_DTYPE)
+        arr['timestamp'] = [1735689600000 + h * H for h in hours]
+        for c in KLINE_COLUMNS:
+            arr[c] = rng.random(len(hours))
+        out[sym] = arr
+    return out
+
+
+def test_from_arrays_matches_pivot():
+    arrays = make_arrays()
+    panel = Panel.from_arrays(arrays)
+    long = pd.concat([array_to_frame(arr, sym).astype({'symbol': str}) for sym, arr in arrays.items()])
+
+    for f in PANEL_FIELDS:
+        expected = long.pivot_table(index='timestamp', columns='symbol', values=f, dropna=False)
+        expected.index = expected.index.as_unit('ns')
+        pd.testing.assert_frame_equal(panel.to_frame(f), expected, check_names=False, check_freq=False)
+        assert panel[f].flags['C_CONTIGUOUS']
+    assert panel.shape == (13, 3)
+
+    float32 = Panel.from_arrays(arrays, dtype=np.float32)
+    assert float32.dtype == np.float32
+    np.testing.assert_array_equal(float32['close'], panel['close'].astype(np.float32))
+
+
+def test_asof_has_no_look_ahead():
+    panel = Panel.from_arrays(make_arrays())
+    t0 = pd.Timestamp(panel.timestamps[0])
+
+    assert panel.asof_index(t0 - pd.Timedelta('1min')) == -1
+    assert panel.asof(t0 - pd.Timedelta('1min')) is None
+    assert panel.asof_index(t0 + pd.Timedelta('2h')) == 2
+    assert panel.asof_index(t0 + pd.Timedelta('2h59min')) == 2
+    np.testing.assert_array_equal(panel.asof(t0 + pd.Timedelta('2h30min')), panel['close'][2])
+
+    # Slices are inclusive and share memory with the panel
+    part = panel.loc(t0 + pd.Timedelta('2h'), t0 + pd.Timedelta('5h'))
+    assert len(part) == 4 and part.timestamps[0] == panel.timestamps[2]
+    assert np.shares_memory(part['close'], panel['close'])
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_shared_and_saved_panels_round_trip(tmp_path, dtype):
+    panel = Panel.from_arrays(make_arrays(), dtype=dtype)
+
+    shm, descriptor = panel.to_shared()
+    try:
+        attached, shm_ = Panel.from_shared(descriptor)
+        for p in [attached, Panel.open(panel.save(str(tmp_path / 'panel')))]:
+            assert p.symbols == panel.symbols and p.dtype == dtype
+            np.testing.assert_array_equal(p.timestamps, panel.timestamps)
+            for f in PANEL_FIELDS:
+                np.testing.assert_array_equal(p[f], panel[f])
+        del attached, p
+        shm_.close()
+    finally:
+        shm.close()
+        shm.unlink()
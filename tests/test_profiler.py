@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Nov  2 17:02:19 2026
+
+@author: ymm
+
+Stage timing of model eval runs and report aggregation
+"""
+import os
+import time
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from data.profiler import Profiler, stage, bind, save_report, load_reports, aggregate, format_report
+from model.model_eval import ModelEvalEngine
+from model.momentum import Momentum
+
+START, END = datetime(2025, 2, 1), datetime(2025, 3, 1)
+SYMBOLS = ['S1USDTM', 'S2USDTM', 'S3USDTM']
+
+
+def cached_momentum(cache_dir):
+    """Momentum loading klines through a per-test cache"""
+    model = Momentum({'symbols': SYMBOLS, 'freq': 60, 'lookback': 24})
+    data_map = model.load_data_map()
+    data_map['KucoinFuturesKlinesData']['params'].update(cache_dir=cache_dir, rate_limit=1e9)
+    model.load_data_map = lambda: data_map
+    return model
+
+
+def test_stages_nest_and_sum_over_threads():
+    with stage('ignored') as info:
+        info['rows'] = 1
+
+    with Profiler(label='nested') as prof:
+        with stage('load', rows=10):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                def fetch(i):
+                    with stage('fetch', rows=i):
+                        time.sleep(0.01)
+                list(pool.map(bind(fetch), range(8)))
+    report = prof.report()
+
+    assert set(report['stages']) == {'load', 'load/fetch'}
+    assert report['stages']['load/fetch']['calls'] == 8
+    assert report['stages']['load/fetch']['rows'] == sum(range(8))
+    assert report['stages']['load/fetch']['peak_mb'] is None
+    assert report['stages']['load']['rows'] == 10
+    assert report['wall'] >= report['stages']['load']['wall'] >= 0.02
+
+    started = datetime.fromisoformat(report['started'])
+    assert started.tzinfo is not None and started.utcoffset().total_seconds() == 0
+    assert abs((datetime.now(timezone.utc) - started).total_seconds()) < 60
+
+
+def test_profiled_run_reports_stages(fake_client, tmp_path):
+    model = cached_momentum(str(tmp_path / 'klines'))
+    params = {'model': model, 'normalize': ['winsorize', 'zscore']}
+    results, report = ModelEvalEngine(dict(params, profile=['cprofile', 'tracemalloc'], profile_label='mom',
+                                           profile_dir=str(tmp_path / 'prof'))).run(START, END)
+
+    pd.testing.assert_frame_equal(results, ModelEvalEngine(params).run(START, END))
+    stages = report['stages']
+    assert {'load', 'load/KucoinFuturesKlinesData', 'eval', 'normalize'} <= set(stages)
+    assert stages['eval']['rows'] == len(results)
+    assert stages['load']['rows'] >= len(results) * len(SYMBOLS)
+    assert all(s['peak_mb'] is not None for path, s in stages.items() if path.count('/') < 2)
+    assert report['memory'] == 'tracemalloc' and report['functions']
+    assert os.path.exists(report['profile_file'])
+
+    # Reports of many runs aggregate per stage
+    path = str(tmp_path / 'reports.jsonl')
+    for _ in range(3):
+        save_report(report, path)
+    agg = aggregate(load_reports(path))
+    assert agg['runs'] == 3 and agg['labels'] == ['mom']
+    assert agg['stages']['eval']['calls'] == 3 * stages['eval']['calls']
+    assert abs(agg['stages']['eval']['mean_wall'] - stages['eval']['wall']) < 1e-12
+    assert 'normalize' in format_report(agg)
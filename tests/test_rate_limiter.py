@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Nov  1 11:20:05 2026
+
+@author: ymm
+
+Shared REST rate limiters
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from data.rate_limiter import TokenBucket, get_limiter, ENDPOINT_LIMITS
+
+
+def test_overrides_do_not_change_the_shared_limit():
+    shared = get_limiter('futures_get_klines')
+    fast = get_limiter('futures_get_klines', 1e9)
+
+    assert fast is not shared
+    assert shared.rate == ENDPOINT_LIMITS['futures_get_klines'][0]
+    assert get_limiter('futures_get_klines') is shared
+    assert get_limiter('futures_get_klines', 1e9) is fast
+
+
+def test_bucket_paces_concurrent_callers():
+    bucket = TokenBucket(100, 1)
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda _: bucket.acquire(), range(21)))
+    # One token up front, then 20 at 100 per second
+    assert time.monotonic() - t0 >= 0.19
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 29 12:15:02 2026
+
+@author: ymm
+
+Stream pipeline metrics
+"""
+from data.stream_metrics import StreamStats
+
+
+def test_snapshots_do_not_reset_each_other():
+    stats = StreamStats()
+    stats.started -= 10
+    stats.count('received', 100)
+    stats.counters['processed'] = 100
+
+    baseline = stats.snapshot()
+    stats.count('received', 50)
+    stats.counters['processed'] = 150
+    baseline['time'] -= 5
+
+    # A pull snapshot in between does not move the reporter's baseline
+    pulled = stats.snapshot()
+    interval = stats.snapshot(since=baseline)
+    assert abs(interval['recv_rate'] - 10) < 0.1
+    assert abs(interval['process_rate'] - 10) < 0.1
+    assert abs(pulled['recv_rate'] - 15) < 0.1
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 29 11:03:25 2026
+
+@author: ymm
+
+Backpressure policies of the stream message queue
+"""
+import asyncio
+from data.stream_queue import MessageQueue
+
+POLICIES = {'/market/ticker': 'drop_oldest', '/spotMarket/tradeOrders': 'block'}
+
+
+def test_drop_oldest_never_evicts_block_topics():
+    async def run():
+        queue = MessageQueue(maxsize=3, policy='block', topic_policies=POLICIES)
+        await queue.put('o1', topic='/spotMarket/tradeOrdersV2')
+        await queue.put('t1', topic='/market/ticker:A')
+        await queue.put('o2', topic='/spotMarket/tradeOrdersV2')
+        await queue.put('t2', topic='/market/ticker:A')
+        return [raw for _, raw, _ in await queue.get_batch()]
+
+    assert asyncio.run(run()) == ['o1', 'o2', 't2']
+
+
+def test_drop_oldest_waits_when_only_block_topics_queued():
+    async def run():
+        queue = MessageQueue(maxsize=2, policy='block', topic_policies=POLICIES)
+        await queue.put('o1', topic='/spotMarket/tradeOrdersV2')
+        await queue.put('o2', topic='/spotMarket/tradeOrdersV2')
+
+        put = asyncio.ensure_future(queue.put('t1', topic='/market/ticker:A'))
+        await asyncio.sleep(0.01)
+        assert not put.done()
+
+        first = await queue.get_batch(max_items=1)
+        await asyncio.wait_for(put, 1)
+        rest = await queue.get_batch()
+        return [raw for _, raw, _ in first + rest]
+
+    assert asyncio.run(run()) == ['o1', 'o2', 't1']
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Nov  2 11:03:52 2026
+
+@author: ymm
+
+Stream reconnects against a local server that drops connections, and
+bar backfill after a reconnect
+"""
+import json
+import time
+import socket
+import asyncio
+import pytest
+from benchmarks.fakes import FakeClient, FakeTickerServer, fake_clients
+from data.bar_builder import BarBuilder
+from data.kucoin_futures_data import KucoinFuturesKlinesData
+from data.kucoin_stream_data import KucoinStreamPriceData
+from data.resample import floor_ts
+
+SYMBOLS = ['A-USDT', 'B-USDT']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class DroppingServer(FakeTickerServer):
+    """Ticker server that closes its first `drops` connections after a few messages"""
+
+    def __init__(self, port, drops=1, **kwargs):
+        super().__init__(port, **kwargs)
+        self.drops = drops
+        self.connections = 0
+
+    async def _handler(self, ws):
+        self.connections += 1
+        if self.connections > self.drops:
+            return await super()._handler(ws)
+
+        msg = json.loads(await ws.recv())
+        await ws.send(json.dumps({'id': msg['id'], 'type': 'ack'}))
+        topic = msg['topic'].split(',')[0]
+        for i in range(3):
+            await ws.send(json.dumps(self.message(i, topic)))
+
+
+def price_stream(port, **params):
+    with fake_clients(ws_port=port):
+        return KucoinStreamPriceData(dict({'symbols': SYMBOLS}, **params))
+
+
+def test_reconnects_resubscribes_and_runs_handlers():
+    async def run():
+        port = free_port()
+        server = await DroppingServer(port, n_messages=1000, rate=500).start()
+        stream = price_stream(port, reconnect_base=0.01)
+        handled, received = [], []
+        stream.add_reconnect_handler(handled.append)
+
+        async def callback(msg):
+            if msg.get('type') == 'message':
+                received.append(msg)
+            if handled and len(received) >= 10:
+                stream.stop()
+
+        try:
+            await asyncio.wait_for(stream._connect(callback), 5)
+        finally:
+            await server.close()
+
+        assert server.connections == 2
+        assert handled == [SYMBOLS]
+        assert stream.stats.counters['reconnects'] == 1
+        assert len(received) >= 10
+
+    asyncio.run(run())
+
+
+def test_stop_cancels_shards_waiting_to_reconnect():
+    async def run():
+        port = free_port()
+        server = await DroppingServer(port, drops=float('inf')).start()
+        # Shards back off up to a minute after the drop
+        stream = price_stream(port, reconnect_base=60, reconnect_cap=60)
+
+        async def callback(msg):
+            if msg.get('type') == 'message':
+                asyncio.get_running_loop().call_later(0.2, stream.stop)
+
+        try:
+            t0 = time.monotonic()
+            await asyncio.wait_for(stream._connect(callback), 5)
+            assert time.monotonic() - t0 < 1
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def loader(kline_params):
+    with fake_clients(FakeClient(latency=0.05)):
+        yield KucoinFuturesKlinesData(kline_params(['S1USDTM'], freq=1))
+
+
+def test_backfill_fills_the_outage_in_order(loader):
+    async def run():
+        bars = []
+        builder = BarBuilder({'freq': 1, 'callback': bars.append, 'use_timer': False, 'backfill': loader})
+
+        # Last bar before the outage, ten minutes ago
+        now_bar = floor_ts(int(time.time() * 1000), 60000)
+        t0 = now_bar - 10 * 60000
+        builder.on_tick('S1USDTM', 100.0, 1.0, t0 + 1000)
+        builder.flush(t0 + 60000)
+
+        # A bar closing while the backfill is fetching is held back
+        task = asyncio.ensure_future(builder.backfill(['S1USDTM']))
+        await asyncio.sleep(0.01)
+        builder.on_tick('S1USDTM', 101.0, 1.0, now_bar + 1000)
+        builder.flush(now_bar + 60000)
+        assert [bar['timestamp'] for bar in bars] == [t0]
+        await task
+
+        assert [bar['timestamp'] for bar in bars] == [t0 + i * 60000 for i in range(11)]
+        assert [bar['n_ticks'] for bar in bars] == [1] + [0] * 9 + [1]
+        assert bars[-1]['close'] == 101.0
+
+    asyncio.run(run())
+
+
+def test_shards_stay_within_topic_limits():
+    symbols = [f"S{i}-USDT" for i in range(25)]
+    with fake_clients(ws_port=0):
+        stream = KucoinStreamPriceData({'symbols': symbols, 'topics': ['/market/ticker', '/market/match'],
+                                        'topics_per_connection': 20})
+    shards = stream.shards()
+
+    assert [len(s) for s in shards] == [10, 10, 5]
+    assert sum(shards, []) == symbols
+
+
+def test_sharded_connections_feed_one_queue():
+    async def run():
+        port = free_port()
+        server = await FakeTickerServer(port, n_messages=200).start()
+        symbols = [f"S{i}-USDT" for i in range(7)]
+        stream = price_stream(port, symbols=symbols, topics_per_connection=3, symbols_per_topic=2)
+        seen = set()
+
+        # Subscribe messages sent per connection
+        subscriptions = []
+        async def subscribe(ws=None, symbols=None, topics=None):
+            sent = []
+            subscriptions.append(sent)
+            send = ws.send
+            async def recording_send(raw):
+                sent.append(json.loads(raw)['topic'])
+                await send(raw)
+            ws.send = recording_send
+            await KucoinStreamPriceData.subscribe(stream, ws=ws, symbols=symbols)
+            ws.send = send
+        stream.subscribe = subscribe
+
+        async def callback(msg):
+            if msg.get('type') == 'message':
+                seen.add(msg['topic'].split(':', 1)[1])
+            if len(seen) == len(symbols):
+                stream.stop()
+
+        try:
+            await asyncio.wait_for(stream._connect(callback), 5)
+        finally:
+            await server.close()
+
+        assert seen == set(symbols)
+        # Three connections, symbols batched two to a topic
+        assert sorted(subscriptions) == [
+            ['/market/ticker:S0-USDT,S1-USDT', '/market/ticker:S2-USDT'],
+            ['/market/ticker:S3-USDT,S4-USDT', '/market/ticker:S5-USDT'],
+            ['/market/ticker:S6-USDT'],
+        ]
+
+    asyncio.run(run())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Nov  1 10:12:48 2026
+
+@author: ymm
+
+Worker pool backlog bound and streams that cannot run in workers
+"""
+import time
+import asyncio
+import pytest
+from data.stream_workers import WorkerPool, ShmRing
+from data.kucoin_stream_data import KucoinStreamOrderBookData, KucoinStreamAccountData
+
+
+def test_backlog_is_bounded():
+    async def run():
+        # Rings only, no worker processes, so nothing is read until we do
+        pool = WorkerPool(n_workers=1, ring_bytes=64, max_backlog=2)
+        ring = ShmRing(64)
+        pool.rings.append(ring)
+        try:
+            msg = b'x' * 40
+            taken = [pool.put('/market/ticker:A', msg) for _ in range(4)]
+            assert taken == [True, True, True, False]
+            assert pool.stats()[0]['backlog'] == 2
+            assert pool.stats()[0]['stalls'] == 1
+
+            # put_async waits until the worker frees room
+            task = asyncio.ensure_future(pool.put_async('/market/ticker:A', msg))
+            await asyncio.sleep(0.01)
+            assert not task.done()
+            ring.read_batch()
+            await asyncio.wait_for(task, 1)
+            assert pool.sent[0] == 4
+        finally:
+            ring.close()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('cls', [KucoinStreamOrderBookData, KucoinStreamAccountData])
+def test_stateful_streams_reject_workers(cls):
+    with pytest.raises(ValueError):
+        cls({'workers': 2})
+
+
+def slow_handler(msg):
+    time.sleep(0.1)
+
+
+def test_aclose_does_not_block_the_loop():
+    async def run():
+        pool = WorkerPool(slow_handler, n_workers=1).start()
+        for i in range(5):
+            pool.put('/market/ticker:A', b'{}')
+
+        # The worker needs ~0.5s to finish, the loop keeps running meanwhile
+        ticks = []
+        async def ticker():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+        task = asyncio.ensure_future(ticker())
+        t0 = time.monotonic()
+        await pool.aclose()
+        task.cancel()
+
+        assert time.monotonic() - t0 >= 0.4
+        assert len(ticks) > 20
+        assert pool.procs == [] and pool.rings == []
+
+    asyncio.run(run())
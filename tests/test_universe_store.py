@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Nov  1 16:40:51 2026
+
+@author: ymm
+
+Universe membership over a range against per day filter_symbols
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from data.kucoin_futures_data import KucoinFuturesSymbolData
+from data.universe_store import UniverseStore
+
+
+@pytest.fixture
+def universe(fake_client, tmp_path):
+    """Snapshots on some days of a month, symbols listing and delisting"""
+    store = UniverseStore(str(tmp_path / 'universe'))
+    rng = np.random.default_rng(1)
+    base = pd.DataFrame(fake_client.futures_get_symbols()[:30])
+    base.loc[25:, 'quoteCurrency'] = 'USDC'
+
+    for day in pd.date_range('2025-03-01', '2025-03-31'):
+        if rng.random() < 0.3:
+            continue
+        snap = base[rng.random(len(base)) < 0.9].copy()
+        snap['volumeOf24h'] *= np.exp(rng.normal(0, 0.5, len(snap)))
+        snap['volValue'] *= np.exp(rng.normal(0, 0.5, len(snap)))
+        store.write(snap, day)
+
+    return KucoinFuturesSymbolData({'store': store, 'snapshot': False})
+
+
+@pytest.mark.parametrize('rules', [{'top': 8}, {'threshold': 0.6}, {'top': 5, 'min_dollar_vol': 1e6}])
+def test_range_matches_per_day_filter(universe, rules):
+    start, end = universe.store.dates()[0], pd.Timestamp('2025-04-03')
+    member = universe.filter_symbols_range(start, end, **rules)
+
+    assert len(member) == (end - start).days + 1
+    for date, row in member.iterrows():
+        expected = set(universe.filter_symbols(universe.load(date=date), **rules)['symbol'])
+        assert set(row.index[row.values]) == expected